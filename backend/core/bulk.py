@@ -0,0 +1,98 @@
+"""Массовая вставка строк через COPY.
+
+На PostgreSQL объекты пишутся командой ``COPY ... FROM STDIN`` — без
+разбора многострочных INSERT на сервере. На остальных бэкендах (SQLite в
+локальной разработке) используется обычный ``bulk_create``. Как и
+``bulk_create``, функция не вызывает ``save()`` и сигналы и не заполняет
+первичные ключи у переданных объектов.
+
+С ``ignore_conflicts=True`` строки сначала копируются во временную таблицу,
+а затем переносятся одним ``INSERT ... SELECT ... ON CONFLICT DO NOTHING``:
+строки, нарушающие уникальные индексы, пропускаются без ошибки.
+"""
+import io
+from datetime import date, datetime, time
+
+from django.db import connections, router, transaction
+
+
+BULK_CREATE_BATCH_SIZE = 500
+COPY_BATCH_SIZE = 10000
+
+
+def copy_insert(model, objs, *, ignore_conflicts=False, using=None):
+    """Вставляет объекты ``model`` и возвращает число вставленных строк.
+
+    На других бэкендах при ``ignore_conflicts`` число пропущенных строк
+    неизвестно, и возвращается количество переданных объектов.
+    """
+    objs = list(objs)
+    if not objs:
+        return 0
+    alias = using or router.db_for_write(model)
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        model._default_manager.using(alias).bulk_create(
+            objs,
+            batch_size=BULK_CREATE_BATCH_SIZE,
+            ignore_conflicts=ignore_conflicts,
+        )
+        return len(objs)
+
+    opts = model._meta
+    # Поля, которые заполняет база (serial-ключ), в COPY не передаются
+    fields = [field for field in opts.concrete_fields if not field.db_returning]
+    quote = connection.ops.quote_name
+    table = quote(opts.db_table)
+    columns = ', '.join(quote(field.column) for field in fields)
+    staging = quote(f'{opts.db_table}_copy')
+    inserted = 0
+    with transaction.atomic(using=alias), connection.cursor() as cursor:
+        if ignore_conflicts:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA'
+            )
+        target = staging if ignore_conflicts else table
+        for offset in range(0, len(objs), COPY_BATCH_SIZE):
+            rows = [
+                [field.get_db_prep_save(field.pre_save(obj, add=True), connection) for field in fields]
+                for obj in objs[offset:offset + COPY_BATCH_SIZE]
+            ]
+            _copy_rows(cursor, f'COPY {target} ({columns}) FROM STDIN', rows)
+            if ignore_conflicts:
+                cursor.execute(
+                    f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} ON CONFLICT DO NOTHING'
+                )
+                inserted += cursor.rowcount
+                cursor.execute(f'TRUNCATE {staging}')
+            else:
+                inserted += len(rows)
+        if ignore_conflicts:
+            # Внутри внешней транзакции ON COMMIT DROP сработает не сразу
+            cursor.execute(f'DROP TABLE {staging}')
+    return inserted
+
+
+def _copy_rows(cursor, sql, rows):
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    if is_psycopg3:
+        with cursor.copy(sql) as copy:
+            for row in rows:
+                copy.write_row(row)
+        return
+    payload = ''.join('\t'.join(_copy_text(value) for value in row) + '\n' for row in rows)
+    cursor.copy_expert(sql, io.BytesIO(payload.encode('utf-8')))
+
+
+def _copy_text(value):
+    """Значение в текстовом формате COPY: ``\\N`` для NULL, экранирование спецсимволов."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime, date, time)):
+        value = value.isoformat()
+    text = str(value)
+    return text.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
@@ -0,0 +1,78 @@
+"""Условные GET по версии данных пользователя.
+
+``data_condition`` — обёртка над ``django.views.decorators.http.condition``:
+ETag строится из версии данных (core.datastate), параметров запроса и
+CSRF-секрета (страница с формами не должна отдаваться из кэша после смены
+токена), Last-Modified — время последней записи. Если ни данные, ни
+параметры не менялись, ответ 304 отдаётся до выполнения запросов view.
+``Cache-Control: private, no-cache`` заставляет браузер каждый раз
+перепроверять страницу, а не показывать её из кэша по эвристике.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .datastate import get_data_state
+
+
+# Параметры, которые меняются на каждом запросе и не влияют на данные
+VOLATILE_PARAMS = ('draw', '_')
+
+
+def _request_state(request):
+    # etag_func и last_modified_func вызываются по очереди: строка читается один раз
+    state = getattr(request, '_data_state', None)
+    if state is None:
+        state = request._data_state = get_data_state(request.user.id)
+    return state
+
+
+def request_params(request, *args, **kwargs):
+    return sorted(
+        (name, request.GET.getlist(name))
+        for name in request.GET
+        if name not in VOLATILE_PARAMS
+    )
+
+
+def data_condition(key_func=request_params):
+    """``condition`` с ETag из версии данных и ``key_func(request, *args, **kwargs)``."""
+
+    def etag(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return None
+        state = _request_state(request)
+        payload = json.dumps(
+            [
+                request.user.id,
+                state.version,
+                request.META.get('CSRF_COOKIE', ''),
+                key_func(request, *args, **kwargs),
+            ],
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return None
+        return _request_state(request).updated_at
+
+    conditional = condition(etag_func=etag, last_modified_func=last_modified)
+
+    def decorator(view):
+        conditional_view = conditional(view)
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        return wrapped
+
+    return decorator
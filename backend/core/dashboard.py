@@ -0,0 +1,263 @@
+"""Данные виджетов дашборда (итоги, балансы, топ категорий, динамика, последние операции).
+
+Каждый виджет читается отдельно через async ORM, поэтому страница
+отдаётся сразу, а виджеты грузятся параллельно и медленный (например,
+динамика за годы) не задерживает остальные. Агрегатный виджет читает один
+сгруппированный результат по своим измерениям (``WIDGET_DIMENSIONS``),
+локальному дню и валюте с доходами, расходами и числом операций и
+сворачивает его в Python (``summarize_groups``) — групп на порядки меньше,
+чем транзакций.
+
+Если период состоит из целых локальных дней (так всегда при фильтрах из
+формы), группы читаются из дневных оборотов ``DailyRollup`` (core.rollups),
+а названия категорий — по связкам пользователя. Иначе ``TransactionRow``
+группируется с условными ``Sum(..., filter=Q(...))``. Последние операции
+читаются запросом с LIMIT по индексу (пользователь, дата).
+
+Группы различаются валютой: суммы пересчитываются в базовую валюту
+пользователя (``UserPreferences.base_currency``), а балансы — в валюту
+счёта, по курсам на день группы из ``core.rates`` — одним векторным
+поиском по всем группам, без подзапроса курса на каждую строку. Суммы
+остаются в Decimal: курс применяется один раз к сумме групп с одной валютой
+и днём.
+
+``cached_widget_data`` кэширует результат в кэше ``DASHBOARD_CACHE_ALIAS``
+по пользователю, фильтрам, виджету и версии данных (core.datastate): любая
+запись транзакций, справочников или курсов меняет версию, и старые ключи
+просто перестают читаться, а вытесняются по TTL и лимиту размера бэкенда.
+"""
+from collections import defaultdict
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import Account, DailyRollup, ExpenseLink, TransactionRow, UserPreferences
+from .rates import PIVOT_CURRENCY, RateTable
+
+
+TOP_CATEGORIES = 5
+# Виджет → измерения групп (день и валюта нужны всем для курса на дату)
+WIDGET_DIMENSIONS = {
+    'totals': (),
+    'balances': ('account_id',),
+    'categories': ('category',),
+    'trend': (),
+}
+WIDGETS = tuple(WIDGET_DIMENSIONS) + ('recent',)
+RECENT_LIMIT = 5
+RECENT_FIELDS = ('date', 'account_name', 'project_name', 'category_name', 'amount', 'currency', 'comment')
+
+
+def _parse_day(value, moment):
+    try:
+        parsed = datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+    return timezone.make_aware(datetime.combine(parsed.date(), moment), timezone.get_current_timezone())
+
+
+def read_dashboard_filters(params):
+    """Период и фильтры дашборда из GET; по умолчанию — с начала месяца по сегодня.
+
+    Границы периода — начало первого и конец последнего локального дня.
+    """
+    now = timezone.localtime()
+    tz = timezone.get_current_timezone()
+    account = params.get('account')
+    project = params.get('project')
+    return {
+        'start': _parse_day(params.get('start'), time.min)
+        or timezone.make_aware(datetime(now.year, now.month, 1), tz),
+        'end': _parse_day(params.get('end'), time.max)
+        or timezone.make_aware(datetime.combine(now.date(), time.max), tz),
+        'account_id': int(account) if account and account.isdigit() else None,
+        'project_id': int(project) if project and project.isdigit() else None,
+    }
+
+
+def dashboard_rows(user_id, filters):
+    rows = TransactionRow.objects.filter(user_id=user_id, date__range=(filters['start'], filters['end']))
+    if filters['account_id'] is not None:
+        rows = rows.filter(account_id=filters['account_id'])
+    if filters['project_id'] is not None:
+        rows = rows.filter(project_id=filters['project_id'])
+    return rows
+
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0')
+
+
+def _money(value):
+    return value.quantize(CENT)
+
+
+def _converted(sums):
+    """``{(ключ, множитель): сумма}`` → ``{ключ: сумма × множитель}``."""
+    result = defaultdict(Decimal)
+    for (key, factor), amount in sums.items():
+        result[key] += amount * factor
+    return result
+
+
+def needed_currencies(groups, base_currency, account_currencies):
+    return {group['currency'] for group in groups} | set(account_currencies.values()) | {base_currency}
+
+
+def summarize_groups(groups, base_currency, account_currencies, rates, top=TOP_CATEGORIES):
+    """Сворачивает группы ``{account_id, category_name, local_date, currency, income, expense, operations}``.
+
+    Группы виджета могут не содержать ``account_id`` или ``category_name``,
+    если виджету они не нужны. Суммы пересчитываются по курсам ``rates``
+    (``RateTable`` с валютами ``needed_currencies``) на день группы:
+    итоги, категории и динамика — в ``base_currency``, балансы — в валюту
+    счёта из ``account_currencies``. Возвращает итоги (``income``,
+    ``expense`` со знаком минус, ``operations``), ``balances`` —
+    {account_id: сумма}, ``categories`` — топ ``top`` категорий по расходам
+    [(название, сумма)], ``trend`` — [(день, сумма)] по возрастанию дня и
+    ``missing_currencies`` — валюты без курсов, суммы в которых не учтены.
+    """
+    account_targets = [account_currencies.get(group.get('account_id'), base_currency) for group in groups]
+    currencies = [group['currency'] for group in groups]
+    days = [group['local_date'] for group in groups]
+    to_base = rates.factors(currencies, base_currency, days)
+    to_account = rates.factors(currencies, account_targets, days)
+
+    # Суммы копятся в Decimal по (ключ, множитель) и умножаются один раз на такую группу:
+    # суммы в целевой валюте (множитель 1) остаются точными
+    totals, balances, categories, trend = (defaultdict(Decimal) for _ in range(4))
+    for group, base_factor, account_factor in zip(groups, to_base, to_account):
+        income = group['income'] or ZERO
+        expense = group['expense'] or ZERO
+        if account_factor is not None:
+            balances[(group.get('account_id'), account_factor)] += income + expense
+        if base_factor is None:
+            continue
+        totals[('income', base_factor)] += income
+        totals[('expense', base_factor)] += expense
+        if expense:
+            categories[(group.get('category_name'), base_factor)] += expense
+        trend[(group['local_date'], base_factor)] += income + expense
+    totals = _converted(totals)
+    return {
+        'income': _money(totals['income']),
+        'expense': _money(totals['expense']),
+        'operations': sum(group['operations'] for group in groups),
+        'balances': {account_id: _money(total) for account_id, total in _converted(balances).items()},
+        'categories': [
+            (name, _money(total))
+            for name, total in sorted(_converted(categories).items(), key=lambda item: item[1])[:top]
+        ],
+        'trend': [(day, _money(total)) for day, total in sorted(_converted(trend).items())],
+        'missing_currencies': sorted(rates.missing),
+    }
+
+
+def rollups_cover(filters):
+    """Совпадает ли период с границами локальных дней (тогда хватает дневных оборотов)."""
+    return (
+        timezone.localtime(filters['start']).time() == time.min
+        and timezone.localtime(filters['end']).time() == time.max
+    )
+
+
+def _groups_queryset(user_id, filters, dimensions):
+    """Группы по ``dimensions`` (``account_id``, ``category``), дню и валюте."""
+    if not rollups_cover(filters):
+        columns = ['category_name' if name == 'category' else name for name in dimensions]
+        return (
+            dashboard_rows(user_id, filters)
+            .order_by()
+            .values(*columns, 'local_date', 'currency')
+            .annotate(
+                income=Sum('amount', filter=Q(amount__gt=0)),
+                expense=Sum('amount', filter=Q(amount__lt=0)),
+                operations=Count('pk'),
+            )
+        )
+    rollups = DailyRollup.objects.filter(
+        user_id=user_id,
+        local_date__range=(timezone.localtime(filters['start']).date(), timezone.localtime(filters['end']).date()),
+    )
+    if filters['account_id'] is not None:
+        rollups = rollups.filter(account_id=filters['account_id'])
+    if filters['project_id'] is not None:
+        rollups = rollups.filter(
+            expense_link_id__in=ExpenseLink.objects.filter(user_id=user_id, project_id=filters['project_id']).values('pk')
+        )
+    # Категория оборота определяется связкой: названия подставляются после чтения
+    columns = ['expense_link_id' if name == 'category' else name for name in dimensions]
+    return (
+        rollups.order_by()
+        .values(*columns, 'local_date', 'currency')
+        .annotate(income=Sum('income'), expense=Sum('expense'), operations=Sum('operations'))
+    )
+
+
+async def _load_groups(user_id, filters, dimensions):
+    groups = [group async for group in _groups_queryset(user_id, filters, dimensions)]
+    if groups and 'category' in dimensions and rollups_cover(filters):
+        names = ExpenseLink.objects.filter(user_id=user_id).values_list('pk', 'category__name')
+        categories = {pk: name async for pk, name in names}
+        for group in groups:
+            group['category_name'] = categories.get(group['expense_link_id'])
+    return groups
+
+
+async def _base_currency(user_id):
+    preferences = UserPreferences.objects.filter(user_id=user_id).values_list('base_currency', flat=True)
+    return await preferences.afirst() or PIVOT_CURRENCY
+
+
+async def widget_data(user_id, filters, widget):
+    """Данные виджета ``widget`` из ``WIDGETS``: свёртка групп или последние операции."""
+    if widget == 'recent':
+        rows = dashboard_rows(user_id, filters).order_by('-date', '-pk').values_list(*RECENT_FIELDS, named=True)
+        return {'rows': [row async for row in rows[:RECENT_LIMIT]]}
+    dimensions = WIDGET_DIMENSIONS[widget]
+    groups = await _load_groups(user_id, filters, dimensions)
+    base_currency = await _base_currency(user_id)
+    accounts = []
+    if 'account_id' in dimensions:
+        accounts = [
+            row async for row in Account.objects.filter(user_id=user_id).order_by('name').values_list('pk', 'name', 'currency')
+        ]
+    account_currencies = {pk: currency for pk, _, currency in accounts}
+    rates = await RateTable.aload(needed_currencies(groups, base_currency, account_currencies))
+    summary = summarize_groups(groups, base_currency, account_currencies, rates)
+    summary['base_currency'] = base_currency
+    summary['accounts'] = accounts
+    return summary
+
+
+def _dashboard_cache():
+    alias = getattr(settings, 'DASHBOARD_CACHE_ALIAS', DEFAULT_CACHE_ALIAS)
+    return caches[alias if alias in settings.CACHES else DEFAULT_CACHE_ALIAS]
+
+
+def dashboard_cache_key(user_id, version, filters, widget):
+    return ':'.join([
+        'dashboard',
+        str(user_id),
+        str(version),
+        filters['start'].isoformat(),
+        filters['end'].isoformat(),
+        str(filters['account_id'] or ''),
+        str(filters['project_id'] or ''),
+        widget,
+    ])
+
+
+async def cached_widget_data(user_id, version, filters, widget):
+    """``widget_data`` для версии данных ``version``; из кэша, если есть."""
+    cache = _dashboard_cache()
+    key = dashboard_cache_key(user_id, version, filters, widget)
+    data = await cache.aget(key)
+    if data is None:
+        data = await widget_data(user_id, filters, widget)
+        await cache.aset(key, data)
+    return data
@@ -0,0 +1,71 @@
+"""Версия данных и счётчик транзакций пользователя.
+
+Каждая запись транзакций вызывает ``note_transactions_changed``: версия
+увеличивается, счётчик сдвигается на число вставленных/удалённых строк.
+Запись справочников (счета, проекты, категории, подкатегории, связки)
+вызывает ``note_dimensions_changed`` и тоже меняет версию, запись курсов
+валют (``note_rates_changed``) — версию всех пользователей. Сохранение и
+удаление через ORM учитываются сигналами (core.signals), массовые операции
+(COPY, ``QuerySet.update``/``delete``) вызывают функции явно.
+"""
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Transaction, UserDataState
+
+
+def note_transactions_changed(user_id, *, inserted=0, deleted=0):
+    delta = inserted - deleted
+    updates = {'version': F('version') + 1, 'updated_at': timezone.now()}
+    if delta:
+        # NULL + delta остаётся NULL: непосчитанный счётчик посчитается при чтении
+        updates['transaction_count'] = F('transaction_count') + delta
+    # Строку создаёт первое чтение: пока её нет, кэшировать по версии было нечего
+    UserDataState.objects.filter(user_id=user_id).update(**updates)
+
+
+def note_dimensions_changed(user_id):
+    note_transactions_changed(user_id)
+
+
+def note_rates_changed():
+    # Курсы общие: пересчитанные итоги устаревают у всех пользователей
+    UserDataState.objects.update(version=F('version') + 1, updated_at=timezone.now())
+
+
+def _state(user_id):
+    state, _ = UserDataState.objects.get_or_create(user_id=user_id)
+    return state
+
+
+def get_data_state(user_id):
+    """Строка ``UserDataState``: версия и время последней записи."""
+    return _state(user_id)
+
+
+def get_data_version(user_id):
+    return _state(user_id).version
+
+
+async def aget_data_version(user_id):
+    state, _ = await UserDataState.objects.aget_or_create(user_id=user_id)
+    return state.version
+
+
+def get_transaction_state(user_id):
+    """(число транзакций, версия данных); COUNT по истории — только при первом вызове."""
+    state = _state(user_id)
+    if state.transaction_count is not None:
+        return state.transaction_count, state.version
+    total = Transaction.objects.filter(account__user_id=user_id).count()
+    # Если за время подсчёта были записи, версия сменилась и значение не сохраняется
+    UserDataState.objects.filter(
+        user_id=user_id,
+        version=state.version,
+        transaction_count__isnull=True,
+    ).update(transaction_count=total)
+    return total, state.version
+
+
+def get_transaction_total(user_id):
+    return get_transaction_state(user_id)[0]
@@ -0,0 +1,113 @@
+"""Плоская проекция транзакций (``TransactionRow``) для чтения списков.
+
+Таблица транзакций и выгрузка читают ``TransactionRow`` — одну таблицу с
+названиями и id справочников, знаком и локальной датой — вместо соединения
+транзакции со счётом, проектом, категорией и подкатегорией.
+
+Синхронизация:
+
+* сохранение транзакции через ORM (форма, ``transaction_update``) —
+  сигнал post_save пишет строку ``save_transaction_row``;
+* удаление — каскад по ``TransactionRow.transaction``;
+* импорт — ``build_row`` по уже известным справочникам и COPY вместе с
+  транзакциями порции;
+* переименование справочника — ``rename_in_rows``: название одним UPDATE,
+  документы поиска пакетами;
+* массовые правки — ``sync_transaction_rows`` по выборке транзакций.
+"""
+from django.utils import timezone
+
+from .models import Account, Category, Project, Subcategory, TransactionRow
+from .search import update_search_documents
+
+
+ROW_BATCH_SIZE = 1000
+ROW_UPDATE_FIELDS = [
+    field.name for field in TransactionRow._meta.concrete_fields if not field.primary_key
+]
+# Справочник → (колонка id, колонка названия) в TransactionRow
+ROW_NAME_COLUMNS = {
+    Account: ('account_id', 'account_name'),
+    Project: ('project_id', 'project_name'),
+    Category: ('category_id', 'category_name'),
+    Subcategory: ('subcategory_id', 'subcategory_name'),
+}
+ROW_DOCUMENT_FIELDS = ('account_name', 'project_name', 'category_name', 'subcategory_name', 'comment')
+
+
+def build_row(transaction, account, project, category, subcategory):
+    """Строка проекции для сохранённой транзакции и её справочников."""
+    return TransactionRow(
+        transaction_id=transaction.pk,
+        user_id=account.user_id,
+        date=transaction.date,
+        local_date=timezone.localtime(transaction.date).date(),
+        amount=transaction.amount,
+        is_income=transaction.amount >= 0,
+        currency=transaction.currency,
+        transaction_type=transaction.transaction_type,
+        account_id=account.pk,
+        account_name=account.name,
+        expense_link_id=transaction.expense_link_id,
+        project_id=project.pk,
+        project_name=project.name,
+        category_id=category.pk,
+        category_name=category.name,
+        subcategory_id=subcategory.pk if subcategory else None,
+        subcategory_name=subcategory.name if subcategory else '',
+        comment=transaction.comment or '',
+        search_document=transaction.search_document,
+    )
+
+
+def row_for(transaction):
+    link = transaction.expense_link
+    return build_row(transaction, transaction.account, link.project, link.category, link.subcategory)
+
+
+def save_rows(rows):
+    """Вставляет или обновляет строки проекции (upsert по transaction_id)."""
+    if not rows:
+        return
+    TransactionRow.objects.bulk_create(
+        rows,
+        batch_size=ROW_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['transaction'],
+        update_fields=ROW_UPDATE_FIELDS,
+    )
+
+
+def save_transaction_row(transaction):
+    row = row_for(transaction)
+    save_rows([row])
+    return row
+
+
+def sync_transaction_rows(queryset):
+    """Пересобирает строки проекции для выборки транзакций; возвращает их число."""
+    transactions = queryset.select_related(
+        'account',
+        'expense_link__project',
+        'expense_link__category',
+        'expense_link__subcategory',
+    ).order_by()
+    count = 0
+    batch = []
+    for transaction in transactions.iterator(chunk_size=ROW_BATCH_SIZE):
+        batch.append(row_for(transaction))
+        if len(batch) >= ROW_BATCH_SIZE:
+            save_rows(batch)
+            count += len(batch)
+            batch = []
+    save_rows(batch)
+    return count + len(batch)
+
+
+def rename_in_rows(instance):
+    """Переносит новое название справочника в проекцию и пересчитывает документы строк."""
+    id_column, name_column = ROW_NAME_COLUMNS[type(instance)]
+    rows = TransactionRow.objects.filter(**{id_column: instance.pk})
+    updated = rows.update(**{name_column: instance.name})
+    update_search_documents(rows, ROW_DOCUMENT_FIELDS)
+    return updated
@@ -0,0 +1,120 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from core.models import ExpenseLink, Transaction
+
+
+# Индексы под горячие запросы (миграция 0008); --compare на SQLite временно удаляет их
+HOT_INDEXES = (
+    (Transaction, 'core_tx_account_date'),
+    (ExpenseLink, 'core_link_active_lookup'),
+)
+# На PostgreSQL --compare не трогает схему: DROP INDEX взял бы ACCESS EXCLUSIVE на живые таблицы
+PLANNER_SWITCHES = ('enable_indexscan', 'enable_indexonlyscan', 'enable_bitmapscan')
+
+
+class _Rollback(Exception):
+    pass
+
+
+def hot_queries(user, days):
+    period_end = timezone.now()
+    period_start = period_end - timedelta(days=days)
+    period = Transaction.objects.filter(account__user=user, date__range=(period_start, period_end))
+    link = ExpenseLink.objects.filter(user=user, status='active').order_by().first()
+    queries = [
+        ('Транзакции за период (дашборд)', period.order_by('-date', '-id')[:50]),
+        ('Обороты по счетам за период', period.values('account_id').order_by().annotate(total=Sum('amount'))),
+    ]
+    if link is not None:
+        queries.append((
+            'Активная связка (TransactionForm.clean)',
+            ExpenseLink.objects.filter(
+                user=user,
+                project_id=link.project_id,
+                category_id=link.category_id,
+                subcategory_id=link.subcategory_id,
+                status='active',
+            )[:1],
+        ))
+    return queries
+
+
+class Command(BaseCommand):
+    help = 'Печатает планы и время горячих запросов транзакций и связок (до и после индексов).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Имя пользователя (по умолчанию — с наибольшим числом транзакций).')
+        parser.add_argument('--days', type=int, default=90, help='Длина периода дашборда в днях.')
+        parser.add_argument('--repeat', type=int, default=20, help='Сколько раз выполнить каждый запрос.')
+        parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE (только PostgreSQL).')
+        parser.add_argument(
+            '--compare',
+            action='store_true',
+            help=(
+                'Сначала показать планы без индексов: на PostgreSQL сканы по индексам отключаются '
+                'SET LOCAL до конца транзакции (без DDL и блокировок), на локальной SQLite индексы '
+                'миграции 0008 удаляются внутри откатываемой транзакции.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        user = self._user(options['user'])
+        queries = hot_queries(user, options['days'])
+        if options['compare']:
+            self._report_without_indexes(queries, options)
+            self.stdout.write(self.style.MIGRATE_HEADING('=== С индексами ==='))
+        self._report(queries, options)
+
+    def _report_without_indexes(self, queries, options):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError('--compare поддерживается только на PostgreSQL и SQLite')
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    self.stdout.write(self.style.MIGRATE_HEADING(
+                        '=== Без сканов по индексам (SET LOCAL ' + ', '.join(PLANNER_SWITCHES) + ' = off) ==='
+                    ))
+                    for setting in PLANNER_SWITCHES:
+                        cursor.execute(f'SET LOCAL {setting} = off')
+                else:
+                    self.stdout.write(self.style.MIGRATE_HEADING('=== Без индексов миграции 0008 (SQLite) ==='))
+                    # Без контекста schema_editor: на SQLite он запрещён внутри atomic
+                    editor = connection.schema_editor()
+                    for model, name in HOT_INDEXES:
+                        index = next(index for index in model._meta.indexes if index.name == name)
+                        cursor.execute(str(index.remove_sql(model, editor)))
+                self._report(queries, options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist as exc:
+                raise CommandError(f'Пользователь {username} не найден') from exc
+        user = User.objects.annotate(count=Count('account__transaction')).order_by('-count').first()
+        if user is None:
+            raise CommandError('В базе нет пользователей')
+        return user
+
+    def _report(self, queries, options):
+        explain_options = {'analyze': True} if options['analyze'] and connection.vendor == 'postgresql' else {}
+        for title, queryset in queries:
+            self.stdout.write(self.style.SUCCESS(title))
+            self.stdout.write(queryset.explain(**explain_options))
+            timings = []
+            for _ in range(max(options['repeat'], 1)):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(f'медиана {statistics.median(timings):.2f} мс, минимум {min(timings):.2f} мс\n')
@@ -0,0 +1,41 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.datastate import note_transactions_changed
+from core.rollups import rebuild_rollups, rollup_mismatches
+
+
+class Command(BaseCommand):
+    help = 'Сверяет дневные обороты (DailyRollup) с транзакциями и пересобирает их.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Имя пользователя (по умолчанию — все).')
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сверить и вывести расхождения; с ошибкой, если они есть.',
+        )
+        parser.add_argument('--limit', type=int, default=20, help='Сколько расхождений вывести.')
+
+    def handle(self, *args, **options):
+        user_id = None
+        if options['user']:
+            user_id = User.objects.filter(username=options['user']).values_list('pk', flat=True).first()
+            if user_id is None:
+                raise CommandError(f"Пользователь {options['user']} не найден")
+
+        if options['verify']:
+            mismatches = rollup_mismatches(user_id)
+            for key, stored, expected in mismatches[:options['limit']]:
+                self.stdout.write(f'{key}: в таблице {stored}, по транзакциям {expected}')
+            if mismatches:
+                raise CommandError(f'Расхождений: {len(mismatches)}')
+            self.stdout.write(self.style.SUCCESS('Обороты совпадают с транзакциями'))
+            return
+
+        count = rebuild_rollups(user_id)
+        # Дашборд мог быть закэширован по старым оборотам
+        users = [user_id] if user_id is not None else User.objects.values_list('pk', flat=True)
+        for pk in users:
+            note_transactions_changed(pk)
+        self.stdout.write(self.style.SUCCESS(f'Пересобрано строк: {count}'))
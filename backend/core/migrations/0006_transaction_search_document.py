@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+from core.search import TRANSACTION_DOCUMENT_FIELDS, update_search_documents
+
+
+def fill_search_documents(apps, schema_editor):
+    Transaction = apps.get_model('core', 'Transaction')
+    update_search_documents(Transaction.objects.using(schema_editor.connection.alias), TRANSACTION_DOCUMENT_FIELDS)
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS core_transaction_search_trgm '
+        'ON core_transaction USING gin (search_document gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS core_transaction_search_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_userdatastate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,111 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+FILL_BATCH_SIZE = 2000
+ROW_SOURCE_FIELDS = (
+    'id', 'account__user_id', 'date', 'amount', 'currency', 'transaction_type',
+    'account_id', 'account__name', 'expense_link_id',
+    'expense_link__project_id', 'expense_link__project__name',
+    'expense_link__category_id', 'expense_link__category__name',
+    'expense_link__subcategory_id', 'expense_link__subcategory__name',
+    'comment', 'search_document',
+)
+
+
+def fill_transaction_rows(apps, schema_editor):
+    Transaction = apps.get_model('core', 'Transaction')
+    TransactionRow = apps.get_model('core', 'TransactionRow')
+    alias = schema_editor.connection.alias
+    values = Transaction.objects.using(alias).order_by().values_list(*ROW_SOURCE_FIELDS)
+    batch = []
+    for (pk, user_id, date, amount, currency, kind, account_id, account_name, link_id,
+         project_id, project_name, category_id, category_name, sub_id, sub_name,
+         comment, search_document) in values.iterator(chunk_size=FILL_BATCH_SIZE):
+        batch.append(TransactionRow(
+            transaction_id=pk,
+            user_id=user_id,
+            date=date,
+            local_date=timezone.localtime(date).date(),
+            amount=amount,
+            is_income=amount >= 0,
+            currency=currency,
+            transaction_type=kind,
+            account_id=account_id,
+            account_name=account_name,
+            expense_link_id=link_id,
+            project_id=project_id,
+            project_name=project_name,
+            category_id=category_id,
+            category_name=category_name,
+            subcategory_id=sub_id,
+            subcategory_name=sub_name or '',
+            comment=comment or '',
+            search_document=search_document,
+        ))
+        if len(batch) >= FILL_BATCH_SIZE:
+            TransactionRow.objects.using(alias).bulk_create(batch)
+            batch = []
+    TransactionRow.objects.using(alias).bulk_create(batch)
+
+
+def move_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS core_transaction_search_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS core_transactionrow_search_trgm '
+        'ON core_transactionrow USING gin (search_document gin_trgm_ops)'
+    )
+
+
+def restore_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS core_transactionrow_search_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS core_transaction_search_trgm '
+        'ON core_transaction USING gin (search_document gin_trgm_ops)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0006_transaction_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionRow',
+            fields=[
+                ('transaction', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='row', serialize=False, to='core.transaction')),
+                ('date', models.DateTimeField()),
+                ('local_date', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('is_income', models.BooleanField()),
+                ('currency', models.CharField(max_length=10)),
+                ('transaction_type', models.CharField(choices=[('income', 'Доход'), ('expense', 'Расход'), ('transfer', 'Перевод')], max_length=16)),
+                ('account_id', models.BigIntegerField()),
+                ('account_name', models.CharField(max_length=100)),
+                ('expense_link_id', models.BigIntegerField()),
+                ('project_id', models.BigIntegerField()),
+                ('project_name', models.CharField(max_length=100)),
+                ('category_id', models.BigIntegerField()),
+                ('category_name', models.CharField(max_length=100)),
+                ('subcategory_id', models.BigIntegerField(blank=True, null=True)),
+                ('subcategory_name', models.CharField(blank=True, default='', max_length=100)),
+                ('comment', models.TextField(blank=True, default='')),
+                ('search_document', models.TextField(blank=True, default='')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-date', '-transaction'], name='core_txrow_user_date'), models.Index(fields=['user', 'account_id', '-date'], name='core_txrow_user_account'), models.Index(fields=['user', 'expense_link_id', '-date'], name='core_txrow_user_link')],
+            },
+        ),
+        migrations.RunPython(fill_transaction_rows, migrations.RunPython.noop),
+        migrations.RunPython(move_trigram_index, restore_trigram_index),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_transactionrow'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expenselink',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['user', 'project', 'category', 'subcategory'], name='core_link_active_lookup'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', '-date', '-id'], name='core_tx_account_date'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+FILL_BATCH_SIZE = 2000
+ROLLUP_KEY = ('user_id', 'account_id', 'expense_link_id', 'local_date', 'currency')
+
+
+def fill_rollups(apps, schema_editor):
+    TransactionRow = apps.get_model('core', 'TransactionRow')
+    DailyRollup = apps.get_model('core', 'DailyRollup')
+    alias = schema_editor.connection.alias
+    groups = (
+        TransactionRow.objects.using(alias)
+        .order_by()
+        .values(*ROLLUP_KEY)
+        .annotate(
+            income=models.Sum('amount', filter=models.Q(amount__gt=0)),
+            expense=models.Sum('amount', filter=models.Q(amount__lt=0)),
+            operations=models.Count('pk'),
+        )
+    )
+    batch = []
+    for group in groups.iterator(chunk_size=FILL_BATCH_SIZE):
+        group['income'] = group['income'] or 0
+        group['expense'] = group['expense'] or 0
+        batch.append(DailyRollup(**group))
+        if len(batch) >= FILL_BATCH_SIZE:
+            DailyRollup.objects.using(alias).bulk_create(batch)
+            batch = []
+    DailyRollup.objects.using(alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0008_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_id', models.BigIntegerField()),
+                ('expense_link_id', models.BigIntegerField()),
+                ('local_date', models.DateField()),
+                ('currency', models.CharField(max_length=10)),
+                ('income', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('expense', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('operations', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'local_date'], name='core_rollup_user_day')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'account_id', 'expense_link_id', 'local_date', 'currency'), name='core_rollup_key'),
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
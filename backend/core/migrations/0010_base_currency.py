@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_dailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userpreferences',
+            name='base_currency',
+            field=models.CharField(default='RUB', max_length=10, verbose_name='Базовая валюта'),
+        ),
+        migrations.AddIndex(
+            model_name='currencyrate',
+            index=models.Index(fields=['currency', 'date'], name='core_rate_currency_date'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from core.search import TRANSACTION_DOCUMENT_FIELDS, update_search_documents
+
+
+ROW_DOCUMENT_FIELDS = ('account_name', 'project_name', 'category_name', 'subcategory_name', 'comment')
+
+
+def normalize_search_documents(apps, schema_editor):
+    # Документы, собранные lower() базы, могли остаться в верхнем регистре (кириллица на SQLite)
+    alias = schema_editor.connection.alias
+    update_search_documents(apps.get_model('core', 'Transaction').objects.using(alias), TRANSACTION_DOCUMENT_FIELDS)
+    update_search_documents(apps.get_model('core', 'TransactionRow').objects.using(alias), ROW_DOCUMENT_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_base_currency'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_search_documents, migrations.RunPython.noop),
+    ]
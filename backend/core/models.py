@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from .search import build_search_document
+
 # === PROJECT ===
 class Project(models.Model):
     STATUS_CHOICES = (
@@ -83,6 +85,16 @@ class ExpenseLink(models.Model):
     subcategory = models.ForeignKey(Subcategory, on_delete=models.SET_NULL, blank=True, null=True)
     status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='active')
 
+    class Meta:
+        indexes = [
+            # Поиск активной связки в TransactionForm.clean и transaction_update
+            models.Index(
+                fields=['user', 'project', 'category', 'subcategory'],
+                condition=models.Q(status='active'),
+                name='core_link_active_lookup',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.project} — {self.category}" + (f" — {self.subcategory}" if self.subcategory else "")
 
@@ -101,17 +113,121 @@ class Transaction(models.Model):
     transaction_type = models.CharField(max_length=16, choices=TRANSACTION_TYPE_CHOICES)
     comment = models.TextField(blank=True, null=True)
     related_transaction = models.ForeignKey('self', on_delete=models.SET_NULL, blank=True, null=True)
+    # Отпечаток исходной строки выписки (core.fingerprints); NULL у операций, введённых вручную
+    fingerprint = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+    # Строка для поиска (core.search); копируется в TransactionRow, где и ищется
+    search_document = models.TextField(blank=True, default='', editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Выборка по счетам пользователя за период в порядке -date, -id (дашборд)
+            models.Index(fields=['account', '-date', '-id'], name='core_tx_account_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.transaction_type}: {self.amount} {self.currency}"
+
+    def build_search_document(self):
+        link = self.expense_link
+        return build_search_document(
+            self.account.name,
+            link.project.name,
+            link.category.name,
+            link.subcategory.name if link.subcategory_id else '',
+            self.comment,
+        )
+
+    def save(self, *args, **kwargs):
+        self.search_document = self.build_search_document()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'search_document'}
+        super().save(*args, **kwargs)
+
+# === TRANSACTION ROW ===
+class TransactionRow(models.Model):
+    """Плоская проекция транзакции для таблицы и выгрузки (core.listing).
+
+    Хранит названия и id справочников, знак и локальную дату, чтобы список
+    читался из одной таблицы без соединений. Синхронизируется сигналами
+    сохранения транзакций и переименования справочников, а импорт пишет
+    строки сам вместе с транзакциями.
+    """
+    transaction = models.OneToOneField(
+        Transaction, on_delete=models.CASCADE, primary_key=True, related_name='row'
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    date = models.DateTimeField()
+    local_date = models.DateField()
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+    is_income = models.BooleanField()
+    currency = models.CharField(max_length=10)
+    transaction_type = models.CharField(max_length=16, choices=Transaction.TRANSACTION_TYPE_CHOICES)
+    account_id = models.BigIntegerField()
+    account_name = models.CharField(max_length=100)
+    expense_link_id = models.BigIntegerField()
+    project_id = models.BigIntegerField()
+    project_name = models.CharField(max_length=100)
+    category_id = models.BigIntegerField()
+    category_name = models.CharField(max_length=100)
+    subcategory_id = models.BigIntegerField(null=True, blank=True)
+    subcategory_name = models.CharField(max_length=100, blank=True, default='')
+    comment = models.TextField(blank=True, default='')
+    # Копия Transaction.search_document; GIN-индекс pg_trgm создаётся миграцией
+    search_document = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-date', '-transaction'], name='core_txrow_user_date'),
+            models.Index(fields=['user', 'account_id', '-date'], name='core_txrow_user_account'),
+            models.Index(fields=['user', 'expense_link_id', '-date'], name='core_txrow_user_link'),
+        ]
+
     def __str__(self):
         return f"{self.transaction_type}: {self.amount} {self.currency}"
 
+class DailyRollup(models.Model):
+    """Дневные обороты по (пользователь, счёт, связка, локальный день, валюта) (core.rollups).
+
+    Доходы и расходы хранятся раздельно, ``operations`` — число транзакций.
+    Каждая запись транзакций сдвигает строки на разницу, а не пересчитывает
+    их; сверить и пересобрать таблицу можно командой ``rebuild_rollups``.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    account_id = models.BigIntegerField()
+    expense_link_id = models.BigIntegerField()
+    local_date = models.DateField()
+    currency = models.CharField(max_length=10)
+    income = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    expense = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    operations = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'account_id', 'expense_link_id', 'local_date', 'currency'],
+                name='core_rollup_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'local_date'], name='core_rollup_user_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.local_date}: +{self.income} {self.expense} {self.currency}"
+
 # === CURRENCY RATE ===
 class CurrencyRate(models.Model):
     date = models.DateField()
     currency = models.CharField(max_length=10)
     amount = models.DecimalField(max_digits=14, decimal_places=6)  # Сколько рублей за 1 единицу валюты
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['currency', 'date'], name='core_rate_currency_date'),
+        ]
+
     def __str__(self):
         return f"{self.currency} на {self.date}: {self.amount}"
 
@@ -149,6 +265,23 @@ class UserPreferences(models.Model):
         null=True,
         related_name='preferred_by_users'
     )
+    # Валюта итогов дашборда; суммы в других валютах пересчитываются по CurrencyRate
+    base_currency = models.CharField(max_length=10, default='RUB', verbose_name="Базовая валюта")
 
     def __str__(self):
         return f"Настройки пользователя {self.user.username}"
+
+
+class UserDataState(models.Model):
+    """Счётчик транзакций и версия данных пользователя.
+
+    Версия увеличивается при любой записи транзакций (core.datastate) и
+    входит в ключи кэшей; ``transaction_count`` — NULL, пока не посчитан.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='data_state')
+    transaction_count = models.BigIntegerField(null=True, blank=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Состояние данных {self.user_id}: v{self.version}"
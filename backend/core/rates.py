@@ -0,0 +1,118 @@
+"""Пересчёт сумм между валютами по курсам ``CurrencyRate`` на дату.
+
+``CurrencyRate.amount`` — сколько рублей стоит единица валюты, рубль —
+опорная валюта с курсом 1. ``RateTable.load`` (``aload`` в async-коде)
+читает курсы нужных валют одним запросом и держит их по валютам в
+отсортированных массивах NumPy: дни ``datetime64[D]`` и курсы ``Decimal``
+(массив ``object``), чтобы деньги не проходили через float. Курс на день
+ищется «на дату» через ``searchsorted`` сразу для всего массива дней:
+последний известный не позже этого дня, а до первого известного — первый
+известный. Суммы в валюте без единого курса пересчитать нельзя: множитель
+для них None, а валюта попадает в ``RateTable.missing``.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+import numpy as np
+
+from .models import CurrencyRate
+
+
+PIVOT_CURRENCY = 'RUB'
+ONE = Decimal('1')
+
+
+def normalize_currency(code):
+    return (code or PIVOT_CURRENCY).strip().upper()
+
+
+class RateTable:
+    def __init__(self, series):
+        # {валюта: (дни по возрастанию, рублей за единицу)}
+        self.series = series
+        self.missing = set()
+
+    @staticmethod
+    def queryset(currencies):
+        codes = {normalize_currency(code) for code in currencies} - {PIVOT_CURRENCY}
+        if not codes:
+            return CurrencyRate.objects.none()
+        return (
+            CurrencyRate.objects.filter(currency__in=codes)
+            .order_by('currency', 'date', 'pk')
+            .values_list('currency', 'date', 'amount')
+        )
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Таблица из строк ``(валюта, день, курс)``, упорядоченных по валюте и дню."""
+        collected = defaultdict(lambda: ([], []))
+        for currency, day, amount in rows:
+            days, values = collected[normalize_currency(currency)]
+            days.append(day)
+            values.append(Decimal(amount))
+        series = {}
+        for currency, (days, values) in collected.items():
+            rates = np.empty(len(values), dtype=object)
+            rates[:] = values
+            series[currency] = (np.array(days, dtype='datetime64[D]'), rates)
+        return cls(series)
+
+    @classmethod
+    def load(cls, currencies):
+        return cls.from_rows(cls.queryset(currencies))
+
+    @classmethod
+    async def aload(cls, currencies):
+        return cls.from_rows([row async for row in cls.queryset(currencies)])
+
+    def rates(self, currencies, days):
+        """Рублей за единицу ``currencies[i]`` на ``days[i]`` (Decimal); None, если курсов валюты нет."""
+        currencies = np.asarray(currencies, dtype=object)
+        days = np.asarray(days, dtype='datetime64[D]')
+        result = np.full(len(days), None, dtype=object)
+        for currency in set(currencies.tolist()):
+            mask = currencies == currency
+            if currency == PIVOT_CURRENCY:
+                result[mask] = ONE
+                continue
+            series = self.series.get(currency)
+            if series is None:
+                self.missing.add(currency)
+                continue
+            known_days, known_rates = series
+            # При нескольких курсах на день side='right' берёт последний загруженный
+            index = np.searchsorted(known_days, days[mask], side='right') - 1
+            result[mask] = known_rates[np.clip(index, 0, None)]
+        return result
+
+    def factors(self, sources, targets, days):
+        """Множители (Decimal) из ``sources[i]`` в ``targets[i]`` (или одну валюту) на ``days[i]``.
+
+        Для совпадающих валют множитель — ровно 1, для валют без курсов — None.
+        """
+        sources = np.array([normalize_currency(code) for code in sources], dtype=object)
+        if isinstance(targets, str):
+            targets = np.full(len(sources), normalize_currency(targets), dtype=object)
+        else:
+            targets = np.array([normalize_currency(code) for code in targets], dtype=object)
+        days = np.asarray(days, dtype='datetime64[D]')
+        result = np.full(len(sources), ONE, dtype=object)
+        foreign = sources != targets
+        if foreign.any():
+            source_rates = self.rates(sources[foreign], days[foreign])
+            target_rates = self.rates(targets[foreign], days[foreign])
+            converted = np.empty(len(source_rates), dtype=object)
+            converted[:] = [
+                None if source is None or target is None else source / target
+                for source, target in zip(source_rates, target_rates)
+            ]
+            result[foreign] = converted
+        return result
+
+    def convert(self, amounts, sources, targets, days):
+        """Суммы в ``targets``; None для сумм в валюте без курсов."""
+        return [
+            None if factor is None else Decimal(amount) * factor
+            for amount, factor in zip(amounts, self.factors(sources, targets, days))
+        ]
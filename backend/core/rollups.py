@@ -0,0 +1,194 @@
+"""Дневные обороты (``DailyRollup``) для дашборда и отчётов за длинные периоды.
+
+Таблица хранит суммы доходов, расходов и число транзакций по ключу
+(пользователь, счёт, связка, локальный день, валюта) и поддерживается
+приращениями: каждая запись транзакций считает разницу «было/стало» по
+ключам и применяет её одним ``executemany``.
+
+* сохранение через ORM (форма, ``transaction_update``) — сигнал post_save
+  сравнивает прежнюю строку проекции ``TransactionRow`` с новой;
+* удаление через ORM — сигнал post_delete вычитает транзакцию;
+* импорт — ``row_deltas`` по строкам проекции порции;
+* пакетные правки и удаление — ``queryset_deltas`` по проекции до и после.
+
+Новые ключи вставляются ``INSERT ... ON CONFLICT DO UPDATE``, уменьшение
+существующих — ``UPDATE`` (строка не создаётся заново, если её уже удалил
+каскад пользователя), опустевшие строки удаляются. ``rollup_mismatches`` и
+``rebuild_rollups`` сверяют и пересобирают таблицу по транзакциям.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction as db_transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyRollup, Transaction
+
+
+ROLLUP_KEY = ('user_id', 'account_id', 'expense_link_id', 'local_date', 'currency')
+ROLLUP_VALUES = ('income', 'expense', 'operations')
+ROLLUP_BATCH_SIZE = 1000
+ZERO = Decimal('0')
+
+
+def _sums():
+    return {
+        'income': Sum('amount', filter=Q(amount__gt=0)),
+        'expense': Sum('amount', filter=Q(amount__lt=0)),
+        'operations': Count('pk'),
+    }
+
+
+def _zero():
+    return [ZERO, ZERO, 0]
+
+
+def new_deltas():
+    """{ключ: [доход, расход, операции]}."""
+    return defaultdict(_zero)
+
+
+def add_delta(deltas, key, amount, sign=1):
+    delta = deltas[key]
+    if amount > 0:
+        delta[0] += sign * amount
+    elif amount < 0:
+        delta[1] += sign * amount
+    delta[2] += sign
+
+
+def row_key(row):
+    return (row.user_id, row.account_id, row.expense_link_id, row.local_date, row.currency)
+
+
+def row_deltas(rows, sign=1, deltas=None):
+    """Приращения по строкам ``TransactionRow`` (или объектам с теми же атрибутами)."""
+    deltas = new_deltas() if deltas is None else deltas
+    for row in rows:
+        add_delta(deltas, row_key(row), row.amount, sign)
+    return deltas
+
+
+def transaction_key(transaction, user_id):
+    return (
+        user_id,
+        transaction.account_id,
+        transaction.expense_link_id,
+        timezone.localtime(transaction.date).date(),
+        transaction.currency,
+    )
+
+
+def queryset_deltas(rows, sign=1, deltas=None):
+    """Приращения по выборке ``TransactionRow`` одним сгруппированным запросом."""
+    deltas = new_deltas() if deltas is None else deltas
+    for group in rows.order_by().values(*ROLLUP_KEY).annotate(**_sums()):
+        delta = deltas[tuple(group[name] for name in ROLLUP_KEY)]
+        delta[0] += sign * (group['income'] or ZERO)
+        delta[1] += sign * (group['expense'] or ZERO)
+        delta[2] += sign * group['operations']
+    return deltas
+
+
+def _prepared(key, delta):
+    values = dict(zip(ROLLUP_KEY + ROLLUP_VALUES, key + tuple(delta)))
+    return [
+        field.get_db_prep_save(values[field.attname], connection)
+        for field in (DailyRollup._meta.get_field(name) for name in ROLLUP_KEY + ROLLUP_VALUES)
+    ]
+
+
+def apply_deltas(deltas):
+    """Применяет приращения; возвращает число затронутых ключей."""
+    changes = [(key, delta) for key, delta in deltas.items() if any(delta)]
+    if not changes:
+        return 0
+    quote = connection.ops.quote_name
+    table = quote(DailyRollup._meta.db_table)
+    key_columns = [quote(DailyRollup._meta.get_field(name).column) for name in ROLLUP_KEY]
+    value_columns = [quote(name) for name in ROLLUP_VALUES]
+    upsert = (
+        f'INSERT INTO {table} ({", ".join(key_columns + value_columns)}) '
+        f'VALUES ({", ".join(["%s"] * (len(key_columns) + len(value_columns)))}) '
+        f'ON CONFLICT ({", ".join(key_columns)}) DO UPDATE SET '
+        + ', '.join(f'{column} = {table}.{column} + excluded.{column}' for column in value_columns)
+    )
+    update = (
+        f'UPDATE {table} SET '
+        + ', '.join(f'{column} = {column} + %s' for column in value_columns)
+        + ' WHERE '
+        + ' AND '.join(f'{column} = %s' for column in key_columns)
+    )
+    inserts = []
+    updates = []
+    for key, delta in changes:
+        params = _prepared(key, delta)
+        if delta[2] > 0:
+            inserts.append(params)
+        else:
+            # Ключ с вычитанием уже есть в таблице: новую строку не создаём
+            key_params, value_params = params[:len(key_columns)], params[len(key_columns):]
+            updates.append(value_params + key_params)
+    with db_transaction.atomic(), connection.cursor() as cursor:
+        for statement, batch in ((upsert, inserts), (update, updates)):
+            for offset in range(0, len(batch), ROLLUP_BATCH_SIZE):
+                cursor.executemany(statement, batch[offset:offset + ROLLUP_BATCH_SIZE])
+        if updates:
+            DailyRollup.objects.filter(
+                user_id__in={key[0] for key, _ in changes}, operations__lte=0
+            ).delete()
+    return len(changes)
+
+
+def _source(user_id=None):
+    """Обороты, посчитанные заново по таблице транзакций."""
+    transactions = Transaction.objects.all()
+    if user_id is not None:
+        transactions = transactions.filter(account__user_id=user_id)
+    return (
+        transactions.order_by()
+        .values('account_id', 'expense_link_id', 'currency', user_id=F('account__user_id'), local_date=TruncDate('date'))
+        .annotate(**_sums())
+    )
+
+
+def _stored(user_id=None):
+    rollups = DailyRollup.objects.all()
+    if user_id is not None:
+        rollups = rollups.filter(user_id=user_id)
+    return rollups
+
+
+def _as_items(groups):
+    return {
+        tuple(group[name] for name in ROLLUP_KEY): (
+            group['income'] or ZERO, group['expense'] or ZERO, group['operations']
+        )
+        for group in groups
+    }
+
+
+def rollup_mismatches(user_id=None):
+    """[(ключ, в таблице, по транзакциям)] для расходящихся ключей."""
+    expected = _as_items(_source(user_id))
+    stored = _as_items(_stored(user_id).values(*ROLLUP_KEY + ROLLUP_VALUES))
+    missing = (ZERO, ZERO, 0)
+    return [
+        (key, stored.get(key, missing), expected.get(key, missing))
+        for key in sorted(expected.keys() | stored.keys(), key=str)
+        if stored.get(key, missing) != expected.get(key, missing)
+    ]
+
+
+def rebuild_rollups(user_id=None):
+    """Пересобирает обороты пользователя (или всех); возвращает число строк."""
+    rows = [
+        DailyRollup(**dict(zip(ROLLUP_KEY + ROLLUP_VALUES, key + values)))
+        for key, values in _as_items(_source(user_id)).items()
+    ]
+    with db_transaction.atomic():
+        _stored(user_id).delete()
+        DailyRollup.objects.bulk_create(rows, batch_size=ROLLUP_BATCH_SIZE)
+    return len(rows)
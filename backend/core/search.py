@@ -0,0 +1,76 @@
+"""Поисковый документ транзакции.
+
+В ``Transaction.search_document`` хранится строка из названий счёта,
+проекта, категории, подкатегории и комментария, приведённая
+``normalize_search_text``; её копия лежит в проекции ``TransactionRow``
+(core.listing). Поиск в таблице транзакций — одно условие ``LIKE '%...%'``
+по этой колонке без соединений; на PostgreSQL его обслуживает GIN-индекс
+pg_trgm на проекции.
+
+Документ и запрос нормализуются одной функцией в Python: ``lower()`` базы
+зависит от бэкенда и локали (SQLite не переводит кириллицу в нижний
+регистр), поэтому документы и при массовом пересчёте собираются в Python.
+Документ пересчитывается при сохранении транзакции, собирается импортом и
+обновляется пакетами ``update_search_documents`` при переименовании
+счёта, проекта, категории или подкатегории (core.signals) и пакетных правках.
+"""
+from django.db import transaction as db_transaction
+
+
+DOCUMENT_BATCH_SIZE = 1000
+# Поля транзакции в порядке частей документа
+TRANSACTION_DOCUMENT_FIELDS = (
+    'account__name',
+    'expense_link__project__name',
+    'expense_link__category__name',
+    'expense_link__subcategory__name',
+    'comment',
+)
+
+
+def normalize_search_text(text):
+    return text.lower()
+
+
+def build_search_document(account_name, project_name, category_name, subcategory_name, comment):
+    parts = [account_name, project_name, category_name, subcategory_name, comment]
+    return normalize_search_text(' '.join(str(part or '') for part in parts))
+
+
+def update_search_documents(queryset, fields):
+    """Пересчитывает документы выборки по полям ``fields`` (в порядке частей документа).
+
+    Строки читаются пакетами по первичному ключу, изменившиеся документы
+    пишутся ``bulk_update``. Возвращает число строк выборки.
+    """
+    model = queryset.model
+    manager = model._default_manager.db_manager(queryset.db)
+    queryset = queryset.order_by('pk')
+    count = 0
+    last_pk = None
+    with db_transaction.atomic(using=queryset.db):
+        while True:
+            batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            rows = list(batch.values_list('pk', 'search_document', *fields)[:DOCUMENT_BATCH_SIZE])
+            if not rows:
+                return count
+            count += len(rows)
+            last_pk = rows[-1][0]
+            changed = []
+            for pk, current, *parts in rows:
+                document = build_search_document(*parts)
+                if document != current:
+                    changed.append(model(pk=pk, search_document=document))
+            manager.bulk_update(changed, ['search_document'])
+
+
+def refresh_search_documents(queryset):
+    """Пересчитывает документы выбранных транзакций; возвращает их число."""
+    return update_search_documents(queryset, TRANSACTION_DOCUMENT_FIELDS)
+
+
+def search_transactions(queryset, query):
+    query = normalize_search_text((query or '').strip())
+    if not query:
+        return queryset
+    return queryset.filter(search_document__contains=query)
@@ -76,6 +76,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+# Виджеты дашборда — async views: под ASGI-сервером они выполняются конкурентно
+ASGI_APPLICATION = 'core.asgi.application'
 
 
 # Database
@@ -137,3 +139,61 @@ STATICFILES_DIRS = [BASE_DIR / '../frontend/static']
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Transaction import
+# Загрузки хранятся в spool-каталоге по хэшу содержимого и удаляются по TTL;
+# при загрузке читаются только заголовок и первые строки, сам импорт идёт порциями из spool
+
+TRANSACTION_IMPORT_SPOOL_DIR = BASE_DIR / 'var' / 'import_spool'
+TRANSACTION_IMPORT_SPOOL_TTL = 6 * 60 * 60
+TRANSACTION_IMPORT_CHUNK_SIZE = 5000
+TRANSACTION_IMPORT_MAX_STORED_ERRORS = 1000
+# Задание без обновления прогресса дольше этого срока считается прерванным
+TRANSACTION_IMPORT_JOB_STALE_TIMEOUT = 30 * 60
+
+# Transaction grid
+# Точный COUNT по фильтрам или оценка планировщика PostgreSQL для больших выборок ('exact' | 'estimated')
+TRANSACTION_GRID_COUNT_MODE = 'exact'
+TRANSACTION_GRID_EXACT_COUNT_LIMIT = 50000
+TRANSACTION_GRID_COUNT_CACHE_TIMEOUT = 10 * 60
+# Строк на одну выборку серверного курсора при выгрузке CSV/XLSX
+TRANSACTION_EXPORT_CHUNK_SIZE = 2000
+
+# Caches
+# Результаты дашборда кэшируются по пользователю, фильтрам и версии данных (core.dashboard).
+# DASHBOARD_CACHE_BACKEND: 'locmem' (в памяти процесса), 'file' (общий для воркеров каталог)
+# или 'redis' (DASHBOARD_CACHE_URL, нужен пакет redis; вытеснение — политикой maxmemory сервера).
+# Для locmem и file размер ограничен MAX_ENTRIES: при переполнении удаляется часть записей.
+DASHBOARD_CACHE_ALIAS = 'dashboard'
+DASHBOARD_CACHE_BACKEND = os.environ.get('DASHBOARD_CACHE_BACKEND', 'locmem')
+DASHBOARD_CACHE_TIMEOUT = 10 * 60
+DASHBOARD_CACHE_MAX_ENTRIES = 5000
+
+_DASHBOARD_CACHES = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'dashboard',
+        'OPTIONS': {'MAX_ENTRIES': DASHBOARD_CACHE_MAX_ENTRIES},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'var' / 'dashboard_cache',
+        'OPTIONS': {'MAX_ENTRIES': DASHBOARD_CACHE_MAX_ENTRIES},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('DASHBOARD_CACHE_URL', 'redis://localhost:6379/1'),
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    DASHBOARD_CACHE_ALIAS: {
+        **_DASHBOARD_CACHES[DASHBOARD_CACHE_BACKEND],
+        'TIMEOUT': DASHBOARD_CACHE_TIMEOUT,
+        'KEY_PREFIX': 'dashboard',
+    },
+}
@@ -0,0 +1,140 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .datastate import note_dimensions_changed, note_rates_changed, note_transactions_changed
+from .listing import ROW_NAME_COLUMNS, rename_in_rows, save_transaction_row, sync_transaction_rows
+from .models import (
+    Account, Category, CurrencyRate, ExpenseLink, Project, Subcategory, Transaction, TransactionRow, UserPreferences,
+)
+from .rollups import add_delta, apply_deltas, new_deltas, row_deltas, transaction_key
+from .search import refresh_search_documents
+
+
+# Справочник → фильтр транзакций, в поисковый документ которых входит его название
+SEARCH_SOURCES = {
+    Account: 'account',
+    Project: 'expense_link__project',
+    Category: 'expense_link__category',
+    Subcategory: 'expense_link__subcategory',
+}
+
+
+# Массовые операции сами пишут версию, проекцию и обороты одним запросом (transactions.batch)
+_transaction_signals_muted = ContextVar('transaction_signals_muted', default=False)
+
+
+@contextmanager
+def muted_transaction_signals():
+    token = _transaction_signals_muted.set(True)
+    try:
+        yield
+    finally:
+        _transaction_signals_muted.reset(token)
+
+
+def _owner_id(transaction):
+    account = Transaction.account.field.get_cached_value(transaction, default=None)
+    if account is not None:
+        return account.user_id
+    return Account.objects.filter(pk=transaction.account_id).values_list('user_id', flat=True).first()
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or _transaction_signals_muted.get():
+        return
+    # Прежняя строка проекции — то, что сейчас учтено в дневных оборотах
+    previous = None if created else TransactionRow.objects.filter(pk=instance.pk).only(
+        'user', 'account_id', 'expense_link_id', 'local_date', 'currency', 'amount'
+    ).first()
+    deltas = row_deltas([previous], sign=-1) if previous is not None else new_deltas()
+    row = save_transaction_row(instance)
+    apply_deltas(row_deltas([row], deltas=deltas))
+    note_transactions_changed(row.user_id, inserted=1 if created else 0)
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_deleted(sender, instance, **kwargs):
+    if _transaction_signals_muted.get():
+        return
+    user_id = _owner_id(instance)
+    if user_id is not None:
+        deltas = new_deltas()
+        add_delta(deltas, transaction_key(instance, user_id), instance.amount, sign=-1)
+        apply_deltas(deltas)
+        note_transactions_changed(user_id, deleted=1)
+
+
+def _remember_name(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._search_name_changed = False
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and 'name' not in update_fields:
+        return
+    previous = sender.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+    instance._search_name_changed = previous is not None and previous != instance.name
+
+
+def _refresh_after_rename(sender, instance, created=False, raw=False, **kwargs):
+    if created or raw or not getattr(instance, '_search_name_changed', False):
+        return
+    instance._search_name_changed = False
+    transactions = Transaction.objects.filter(**{SEARCH_SOURCES[sender]: instance})
+    # Версию данных меняет _dimension_changed, он срабатывает на любое сохранение
+    if refresh_search_documents(transactions):
+        rename_in_rows(instance)
+
+
+for _model in SEARCH_SOURCES:
+    pre_save.connect(_remember_name, sender=_model, dispatch_uid=f'search_name_{_model.__name__}')
+    post_save.connect(_refresh_after_rename, sender=_model, dispatch_uid=f'search_refresh_{_model.__name__}')
+
+
+def _remember_rows(sender, instance, **kwargs):
+    # Связки теряют подкатегорию через SET_NULL одним UPDATE без сигналов: строки проекции
+    # и документы поиска этих транзакций пересобираются после удаления
+    id_column, _ = ROW_NAME_COLUMNS[sender]
+    instance._affected_transactions = list(
+        TransactionRow.objects.filter(**{id_column: instance.pk}).values_list('transaction_id', flat=True)
+    )
+
+
+def _refresh_after_delete(sender, instance, **kwargs):
+    ids = getattr(instance, '_affected_transactions', None)
+    if not ids:
+        return
+    instance._affected_transactions = None
+    # Транзакции, удалённые каскадом вместе со справочником, сюда уже не попадут
+    transactions = Transaction.objects.filter(pk__in=ids)
+    refresh_search_documents(transactions)
+    sync_transaction_rows(transactions)
+
+
+for _model in (Category, Subcategory):
+    pre_delete.connect(_remember_rows, sender=_model, dispatch_uid=f'rows_delete_{_model.__name__}')
+    post_delete.connect(_refresh_after_delete, sender=_model, dispatch_uid=f'rows_refresh_{_model.__name__}')
+
+
+def _dimension_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    note_dimensions_changed(instance.user_id)
+
+
+# Базовая валюта из настроек меняет итоги дашборда так же, как справочники
+for _model in (Account, Project, Category, Subcategory, ExpenseLink, UserPreferences):
+    post_save.connect(_dimension_changed, sender=_model, dispatch_uid=f'data_version_save_{_model.__name__}')
+    post_delete.connect(_dimension_changed, sender=_model, dispatch_uid=f'data_version_delete_{_model.__name__}')
+
+
+def _rates_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    note_rates_changed()
+
+
+post_save.connect(_rates_changed, sender=CurrencyRate, dispatch_uid='data_version_rate_save')
+post_delete.connect(_rates_changed, sender=CurrencyRate, dispatch_uid='data_version_rate_delete')
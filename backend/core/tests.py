@@ -0,0 +1,371 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import dashboard
+from .bulk import copy_insert
+from .dashboard import cached_widget_data, read_dashboard_filters, summarize_groups
+from .datastate import get_data_version, note_transactions_changed
+from .fingerprints import FingerprintCounter, base_key, fingerprint
+from .models import (
+    Account, Category, CurrencyRate, DailyRollup, ExpenseLink, Project, Subcategory, Transaction, TransactionRow,
+)
+from .rates import RateTable
+from .rollups import rollup_mismatches
+from .views import _format_amount
+
+
+def make_dimensions(username):
+    """Пользователь со счётом и связкой «проект — категория»."""
+    user = User.objects.create_user(username)
+    account = Account.objects.create(user=user, name='Карта')
+    project = Project.objects.create(user=user, name='Дом')
+    category = Category.objects.create(user=user, name='Еда')
+    link = ExpenseLink.objects.create(user=user, project=project, category=category)
+    return user, account, link
+
+
+class CopyInsertTests(TestCase):
+    def setUp(self):
+        self.user, self.account, self.link = make_dimensions('bulk')
+
+    def transactions(self, fingerprints, comment=None):
+        moment = timezone.make_aware(datetime(2024, 2, 1, 12, 0))
+        return [
+            Transaction(
+                account=self.account,
+                expense_link=self.link,
+                amount=Decimal('-10.50'),
+                currency='RUB',
+                date=moment,
+                transaction_type='expense',
+                comment=comment,
+                fingerprint=fingerprint,
+            )
+            for fingerprint in fingerprints
+        ]
+
+    def test_inserts_rows(self):
+        self.assertEqual(copy_insert(Transaction, self.transactions(['a', 'b'], comment='таб\tи\\n')), 2)
+        saved = Transaction.objects.filter(account=self.account).order_by('fingerprint')
+        self.assertEqual([item.fingerprint for item in saved], ['a', 'b'])
+        self.assertEqual(saved[0].comment, 'таб\tи\\n')
+        self.assertEqual(saved[0].amount, Decimal('-10.50'))
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY и ON CONFLICT DO NOTHING проверяются только на PostgreSQL')
+    def test_conflicts_are_skipped_and_not_counted(self):
+        copy_insert(Transaction, self.transactions(['a', 'b']))
+        inserted = copy_insert(Transaction, self.transactions(['b', 'c', 'c']), ignore_conflicts=True)
+        self.assertEqual(inserted, 1)
+        fingerprints = Transaction.objects.filter(account=self.account).values_list('fingerprint', flat=True)
+        self.assertEqual(sorted(fingerprints), ['a', 'b', 'c'])
+
+
+class FingerprintTests(SimpleTestCase):
+    moment = datetime(2024, 2, 1, 12, 0, 30, tzinfo=dt_timezone.utc)
+
+    def key(self, **changes):
+        values = {
+            'account_id': 1,
+            'date': self.moment,
+            'amount': Decimal('-100'),
+            'currency': 'RUB',
+            'comment': 'Кофе',
+        }
+        values.update(changes)
+        return base_key(**values)
+
+    def test_identical_rows_are_numbered(self):
+        counter = FingerprintCounter()
+        key = self.key()
+        numbered = [counter.next(key) for _ in range(3)]
+        counter.flush()
+        numbered.append(counter.next(key))
+        self.assertEqual(numbered, [fingerprint(key, occurrence) for occurrence in range(4)])
+        self.assertEqual(len(set(numbered)), 4)
+        self.assertEqual(numbered[0], key.hex())
+
+    def test_numbering_survives_flush(self):
+        counter = FingerprintCounter()
+        first, second = self.key(), self.key(comment='Чай')
+        self.assertEqual(counter.next(first), fingerprint(first, 0))
+        counter.flush()
+        self.assertEqual(counter.next(second), fingerprint(second, 0))
+        self.assertEqual(counter.next(first), fingerprint(first, 1))
+        counter.flush()
+        self.assertEqual(counter.next(second), fingerprint(second, 1))
+
+    def test_changed_fields_change_key(self):
+        key = self.key()
+        changes = [
+            {'amount': Decimal('-100.01')},
+            {'date': self.moment + timedelta(seconds=1)},
+            {'account_id': 2},
+            {'currency': 'USD'},
+            {'comment': 'Чай'},
+        ]
+        for change in changes:
+            with self.subTest(change=change):
+                self.assertNotEqual(self.key(**change), key)
+
+    def test_insignificant_differences_keep_key(self):
+        key = self.key()
+        same = [
+            {'amount': Decimal('-100.00')},
+            {'date': self.moment.replace(microsecond=500)},
+            {'date': self.moment.astimezone(dt_timezone(timedelta(hours=3)))},
+            {'currency': ' rub '},
+            {'comment': '  кофе '},
+        ]
+        for change in same:
+            with self.subTest(change=change):
+                self.assertEqual(self.key(**change), key)
+
+    def test_operation_id_replaces_row_fields(self):
+        key = self.key(operation_id='A-1')
+        self.assertEqual(self.key(operation_id='a-1', amount=Decimal('5')), key)
+        self.assertNotEqual(self.key(operation_id='A-2'), key)
+
+
+class DimensionDeleteTests(TestCase):
+    def setUp(self):
+        self.user, self.account, self.link = make_dimensions('deletes')
+        self.subcategory = Subcategory.objects.create(user=self.user, name='Овощи')
+        self.link.subcategory = self.subcategory
+        self.link.save()
+        self.transaction = Transaction.objects.create(
+            account=self.account,
+            expense_link=self.link,
+            amount=Decimal('-10'),
+            date=timezone.now(),
+            transaction_type='expense',
+        )
+
+    def test_subcategory_delete_refreshes_rows(self):
+        self.subcategory.delete()
+        row = TransactionRow.objects.get(transaction=self.transaction)
+        self.assertIsNone(row.subcategory_id)
+        self.assertEqual(row.subcategory_name, '')
+        self.transaction.refresh_from_db()
+        self.assertNotIn('овощи', self.transaction.search_document)
+        self.assertEqual(row.search_document, self.transaction.search_document)
+
+    def test_category_delete_removes_rows(self):
+        self.link.category.delete()
+        self.assertFalse(Transaction.objects.filter(pk=self.transaction.pk).exists())
+        self.assertFalse(TransactionRow.objects.filter(user=self.user).exists())
+        self.assertEqual(rollup_mismatches(self.user.id), [])
+
+
+class RateTableTests(TestCase):
+    def setUp(self):
+        CurrencyRate.objects.bulk_create([
+            CurrencyRate(currency='USD', date=date(2024, 1, 10), amount=Decimal('90')),
+            CurrencyRate(currency='USD', date=date(2024, 1, 20), amount=Decimal('100')),
+            CurrencyRate(currency='EUR', date=date(2024, 1, 10), amount=Decimal('120')),
+        ])
+        self.rates = RateTable.load({'USD', 'EUR', 'RUB'})
+
+    def test_rate_on_date(self):
+        days = [date(2024, 1, 5), date(2024, 1, 10), date(2024, 1, 15), date(2024, 1, 25)]
+        factors = self.rates.factors(['USD'] * 4, 'RUB', days)
+        # До первого курса берётся первый, дальше — последний известный
+        self.assertEqual(list(factors), [Decimal('90'), Decimal('90'), Decimal('90'), Decimal('100')])
+
+    def test_cross_rate_and_same_currency(self):
+        factors = self.rates.factors(['eur', 'USD'], ['USD', 'usd'], [date(2024, 1, 20)] * 2)
+        self.assertEqual(list(factors), [Decimal('1.2'), Decimal('1')])
+        self.assertEqual(self.rates.missing, set())
+
+    def test_missing_currency(self):
+        factors = self.rates.factors(['GBP', 'RUB'], 'USD', [date(2024, 1, 20)] * 2)
+        self.assertEqual(list(factors), [None, Decimal('0.01')])
+        self.assertEqual(self.rates.missing, {'GBP'})
+
+
+class SummarizeGroupsTests(SimpleTestCase):
+    def setUp(self):
+        rates = np.empty(1, dtype=object)
+        rates[:] = [Decimal('100')]
+        self.rates = RateTable({'USD': (np.array(['2024-01-10'], dtype='datetime64[D]'), rates)})
+
+    def group(self, currency, income, expense, day=date(2024, 1, 15), **extra):
+        return {
+            'currency': currency,
+            'local_date': day,
+            'income': income,
+            'expense': expense,
+            'operations': 1,
+            **extra,
+        }
+
+    def test_base_currency_sums_are_exact(self):
+        groups = [self.group('RUB', Decimal('0.10'), None), self.group('RUB', Decimal('0.20'), None)] * 5
+        groups.append(self.group('RUB', Decimal('123456789012.34'), Decimal('-0.01')))
+        summary = summarize_groups(groups, 'RUB', {}, self.rates)
+        self.assertEqual(summary['income'], Decimal('123456789013.84'))
+        self.assertEqual(summary['expense'], Decimal('-0.01'))
+        self.assertEqual(summary['operations'], 11)
+        self.assertEqual(summary['trend'], [(date(2024, 1, 15), Decimal('123456789013.83'))])
+
+    def test_converts_to_base_and_account_currency(self):
+        groups = [
+            self.group('USD', Decimal('1.50'), Decimal('-0.25'), account_id=1, category_name='Еда'),
+            self.group('RUB', None, Decimal('-50'), account_id=1, category_name='Дом'),
+            self.group('RUB', Decimal('10'), None, account_id=2),
+        ]
+        summary = summarize_groups(groups, 'RUB', {1: 'USD', 2: 'RUB'}, self.rates)
+        self.assertEqual(summary['income'], Decimal('160.00'))
+        self.assertEqual(summary['expense'], Decimal('-75.00'))
+        self.assertEqual(summary['balances'], {1: Decimal('0.75'), 2: Decimal('10.00')})
+        self.assertEqual(summary['categories'], [('Дом', Decimal('-50.00')), ('Еда', Decimal('-25.00'))])
+        self.assertEqual(summary['missing_currencies'], [])
+
+    def test_missing_currency_is_reported_and_skipped(self):
+        groups = [self.group('RUB', Decimal('5'), None), self.group('GBP', Decimal('7'), Decimal('-3'))]
+        summary = summarize_groups(groups, 'RUB', {}, self.rates)
+        self.assertEqual(summary['income'], Decimal('5.00'))
+        self.assertEqual(summary['expense'], Decimal('0.00'))
+        self.assertEqual(summary['categories'], [])
+        self.assertEqual(summary['missing_currencies'], ['GBP'])
+
+
+DASHBOARD_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'dashboard': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-dashboard'},
+}
+
+
+@override_settings(CACHES=DASHBOARD_CACHES, DASHBOARD_CACHE_ALIAS='dashboard')
+class DashboardTestCase(TestCase):
+    """Февраль 2024: расходы по двум категориям, зарплата и покупка в долларах со счёта в USD."""
+    params = {'start': '2024-02-01', 'end': '2024-02-29'}
+
+    def setUp(self):
+        # Ключи кэша — id пользователя и версия: после отката прошлого теста они могут совпасть
+        caches['dashboard'].clear()
+        self.user, self.card, food = make_dimensions('widgets')
+        self.client.force_login(self.user)
+        self.cash = Account.objects.create(user=self.user, name='Наличные', currency='USD')
+        cafe = ExpenseLink.objects.create(
+            user=self.user, project=food.project, category=Category.objects.create(user=self.user, name='Кафе'),
+        )
+        salary = ExpenseLink.objects.create(
+            user=self.user, project=food.project, category=Category.objects.create(user=self.user, name='Зарплата'),
+        )
+        CurrencyRate.objects.create(currency='USD', date=date(2024, 1, 31), amount=Decimal('90'))
+        self.add(self.card, food, '-100', datetime(2024, 2, 1, 10))
+        self.add(self.card, cafe, '-250', datetime(2024, 2, 2, 11))
+        self.add(self.cash, food, '-30', datetime(2024, 2, 3, 12))
+        self.add(self.cash, cafe, '-10', datetime(2024, 2, 4, 12), currency='USD')
+        self.add(self.card, salary, '5000', datetime(2024, 2, 5, 9))
+        self.add(self.card, food, '-999', datetime(2024, 3, 1, 9))
+
+    def add(self, account, link, amount, moment, currency='RUB'):
+        amount = Decimal(amount)
+        return Transaction.objects.create(
+            account=account,
+            expense_link=link,
+            amount=amount,
+            currency=currency,
+            date=timezone.make_aware(moment),
+            transaction_type='income' if amount >= 0 else 'expense',
+        )
+
+    def widget(self, name, **params):
+        return self.client.get(reverse('dashboard_widget', args=[name]), dict(self.params, **params))
+
+
+class DashboardWidgetTests(DashboardTestCase):
+    def synchronous_totals(self, **filters):
+        """Итоги периода обычным синхронным ORM: каждая строка по курсу в рубли."""
+        rates = {'RUB': Decimal('1'), 'USD': Decimal('90')}
+        rows = TransactionRow.objects.filter(
+            user=self.user, local_date__range=(date(2024, 2, 1), date(2024, 2, 29)), **filters
+        )
+        income = sum((row.amount * rates[row.currency] for row in rows if row.amount > 0), Decimal('0'))
+        expense = sum((row.amount * rates[row.currency] for row in rows if row.amount < 0), Decimal('0'))
+        return {
+            'total_income': _format_amount(income),
+            'total_expense': _format_amount(abs(expense)),
+            'net_amount': _format_amount(income + expense),
+            'net_positive': income + expense >= 0,
+            'operation_count': rows.count(),
+            'base_currency': 'RUB',
+            'missing_currencies': [],
+        }
+
+    def test_requires_login(self):
+        self.client.logout()
+        response = self.widget('totals')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'error': 'Требуется вход'})
+
+    def test_unknown_widget(self):
+        self.assertEqual(self.widget('nothing').status_code, 404)
+
+    def test_totals_match_synchronous_sums(self):
+        response = self.widget('totals')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(response.json(), self.synchronous_totals())
+        self.assertEqual(response.json()['total_expense'], '1 280')
+        cash = self.widget('totals', account=self.cash.pk).json()
+        self.assertEqual(cash, self.synchronous_totals(account_id=self.cash.pk))
+
+    def test_widget_payloads(self):
+        self.assertEqual(self.widget('balances').json(), {'account_balances': [
+            {'name': 'Карта', 'currency': 'RUB', 'balance': '4 650', 'is_negative': False},
+            {'name': 'Наличные', 'currency': 'USD', 'balance': '-10,33', 'is_negative': True},
+        ]})
+        self.assertEqual(self.widget('categories').json(), {
+            'top_expense_categories': [
+                {'name': 'Кафе', 'total': '1 150', 'percent': 89.8},
+                {'name': 'Еда', 'total': '130', 'percent': 10.2},
+            ],
+            'base_currency': 'RUB',
+        })
+        self.assertEqual(self.widget('trend').json(), {
+            'trend_labels': ['01.02', '02.02', '03.02', '04.02', '05.02'],
+            'trend_values': [-100.0, -250.0, -30.0, -900.0, 5000.0],
+            'base_currency': 'RUB',
+        })
+        recent = self.widget('recent').json()['recent_transactions']
+        self.assertEqual([row['amount'] for row in recent], ['+5 000 RUB', '-10 USD', '-30 RUB', '-250 RUB', '-100 RUB'])
+        self.assertEqual(recent[0]['date'], '05.02.2024 09:00')
+
+
+class DashboardCacheTests(DashboardTestCase):
+    def cached(self, widget='totals'):
+        filters = read_dashboard_filters(self.params)
+        return async_to_sync(cached_widget_data)(self.user.id, get_data_version(self.user.id), filters, widget)
+
+    def test_same_version_reads_cache(self):
+        with mock.patch.object(dashboard, 'widget_data', wraps=dashboard.widget_data) as widget_data:
+            first = self.cached()
+            second = self.cached()
+            self.cached('balances')
+        self.assertEqual(first, second)
+        self.assertEqual(widget_data.await_count, 2)
+
+        # Запись в обход версии не видна: ответ берётся из кэша
+        DailyRollup.objects.filter(user=self.user).delete()
+        self.assertEqual(self.widget('totals').json()['operation_count'], 5)
+        self.assertEqual(self.cached(), first)
+
+    def test_version_bump_invalidates(self):
+        self.assertEqual(self.widget('totals').json()['total_income'], '5 000')
+        TransactionRow.objects.filter(user=self.user, amount__gt=0).update(amount=Decimal('6000'))
+        DailyRollup.objects.filter(user=self.user, income__gt=0).update(income=Decimal('6000'))
+        self.assertEqual(self.widget('totals').json()['total_income'], '5 000')
+        note_transactions_changed(self.user.id)
+        self.assertEqual(self.widget('totals').json()['total_income'], '6 000')
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.shortcuts import render
-from core.views import landing_view, dashboard_view, categories_settings, accounts_directory
+from core.views import landing_view, dashboard_view, dashboard_widget, categories_settings, accounts_directory
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -10,6 +10,7 @@ urlpatterns = [
     path('home/', lambda request: render(request, "error-404-2.html"), name="home"),  # Заглушка для главной
     path('', landing_view, name='landing'),
     path('dashboard/', dashboard_view, name='dashboard'),
+    path('dashboard/widgets/<slug:widget>/', dashboard_widget, name='dashboard_widget'),
     path('categories/', categories_settings, name='categories_settings'),
     path('settings/accounts/', accounts_directory, name='accounts_directory'),
 ]
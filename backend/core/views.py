@@ -1,165 +1,152 @@
-from datetime import datetime, time
 from decimal import Decimal
 
-from django.db.models import Sum
-from django.db.models.functions import TruncDay
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
 
+from .conditional import data_condition, request_params
+from .dashboard import WIDGETS, cached_widget_data, read_dashboard_filters
+from .datastate import aget_data_version, note_dimensions_changed
 from .forms import ProjectForm, CategoryForm, SubcategoryForm, AccountForm
-from core.models import Project, Category, Subcategory, ExpenseLink, Account, UserPreferences, Transaction
+from core.models import Project, Category, Subcategory, ExpenseLink, Account, UserPreferences
 
 
 def landing_view(request):
     return render(request, 'landing.html')
 
+def _dashboard_key(request):
+    # Период по умолчанию заканчивается сегодня: смена дня меняет и страницу
+    return [request_params(request), timezone.localdate().isoformat()]
+
+
 @login_required
+@data_condition(_dashboard_key)
 def dashboard_view(request):
+    """Каркас дашборда: форма фильтров, данные виджеты загружают сами (``dashboard_widget``)."""
     user = request.user
-    now = timezone.localtime()
-    default_start = datetime(now.year, now.month, 1)
-    period_start = timezone.make_aware(default_start, timezone.get_current_timezone())
-
-    start_param = request.GET.get('start')
-    end_param = request.GET.get('end')
-    account_param = request.GET.get('account')
-    project_param = request.GET.get('project')
-
-    if start_param:
-        try:
-            parsed = datetime.strptime(start_param, '%Y-%m-%d')
-            period_start = timezone.make_aware(
-                datetime.combine(parsed.date(), time.min),
-                timezone.get_current_timezone()
-            )
-        except ValueError:
-            pass
-
-    period_end = timezone.make_aware(datetime.combine(now.date(), time.max), timezone.get_current_timezone())
-    if end_param:
-        try:
-            parsed = datetime.strptime(end_param, '%Y-%m-%d')
-            period_end = timezone.make_aware(
-                datetime.combine(parsed.date(), time.max),
-                timezone.get_current_timezone()
-            )
-        except ValueError:
-            pass
-
-    transactions_qs = Transaction.objects.filter(account__user=user)
-    filtered_qs = transactions_qs.filter(date__range=(period_start, period_end))
-
-    if account_param and account_param.isdigit():
-        filtered_qs = filtered_qs.filter(account_id=int(account_param))
-    if project_param and project_param.isdigit():
-        filtered_qs = filtered_qs.filter(expense_link__project_id=int(project_param))
-
-    total_income = filtered_qs.filter(amount__gt=0).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    total_expense = filtered_qs.filter(amount__lt=0).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-
-    account_balances_raw = (
-        filtered_qs
-        .values('account__name', 'account__currency')
-        .annotate(balance=Sum('amount'))
-        .order_by('account__name')
-    )
-
-    top_expense_categories_raw = (
-        filtered_qs
-        .filter(amount__lt=0)
-        .values('expense_link__category__name')
-        .annotate(total=Sum('amount'))
-        .order_by('total')[:5]
-    )
-
-    trend_data = (
-        filtered_qs
-        .annotate(day=TruncDay('date'))
-        .values('day')
-        .annotate(total=Sum('amount'))
-        .order_by('day')
-    )
-
-    recent_transactions_qs = (
-        filtered_qs
-        .select_related('account', 'expense_link__project', 'expense_link__category')
-        .order_by('-date')[:5]
-    )
-    recent_transactions = []
-    for tx in recent_transactions_qs:
-        amount_value = float(tx.amount)
-        amount_text = f"{abs(amount_value):,.2f}".replace(',', ' ').replace('.', ',')
-        if amount_text.endswith(',00'):
-            amount_text = amount_text[:-3]
-        amount_text = f"{'+' if amount_value >= 0 else '-'}{amount_text} {tx.currency}"
-        recent_transactions.append({
-            'date': timezone.localtime(tx.date).strftime('%d.%m.%Y %H:%M'),
-            'account': tx.account.name,
-            'project': tx.expense_link.project.name,
-            'category': tx.expense_link.category.name,
-            'amount': amount_text,
-            'is_income': amount_value >= 0,
-            'comment': tx.comment or '—',
-        })
+    selected = read_dashboard_filters(request.GET)
+    filters = {
+        'start': selected['start'].strftime('%Y-%m-%d'),
+        'end': selected['end'].strftime('%Y-%m-%d'),
+        'account': request.GET.get('account') or '',
+        'project': request.GET.get('project') or '',
+    }
+    context = {
+        'filters': filters,
+        'accounts': Account.objects.filter(user=user, status='active').order_by('name'),
+        'projects': Project.objects.filter(user=user, status='active').order_by('name'),
+        'widget_urls': {widget: reverse('dashboard_widget', args=[widget]) for widget in WIDGETS},
+    }
+    return render(request, 'dashboard.html', context)
 
-    def format_amount(value):
-        text = f"{Decimal(value or 0):,.2f}".replace(',', ' ').replace('.', ',')
-        if text.endswith(',00'):
-            text = text[:-3]
-        return text
 
-    net_amount = total_income + total_expense
-    total_expense_abs = abs(total_expense)
-    has_expense = total_expense_abs > 0
-    if not has_expense:
-        total_expense_abs = Decimal('1')
+def _format_amount(value):
+    text = f"{Decimal(value or 0):,.2f}".replace(',', ' ').replace('.', ',')
+    if text.endswith(',00'):
+        text = text[:-3]
+    return text
 
-    trend_labels = [data['day'].strftime('%d.%m') for data in trend_data]
-    trend_values = [float(data['total']) for data in trend_data]
 
-    filters = {
-        'start': period_start.strftime('%Y-%m-%d'),
-        'end': period_end.strftime('%Y-%m-%d'),
-        'account': account_param or '',
-        'project': project_param or '',
+def _totals_payload(data):
+    net_amount = data['income'] + data['expense']
+    return {
+        'total_income': _format_amount(data['income']),
+        'total_expense': _format_amount(abs(data['expense'])),
+        'net_amount': _format_amount(net_amount),
+        'net_positive': net_amount >= 0,
+        'operation_count': data['operations'],
+        'base_currency': data['base_currency'],
+        'missing_currencies': data['missing_currencies'],
     }
 
-    accounts = Account.objects.filter(user=user, status='active').order_by('name')
-    projects = Project.objects.filter(user=user, status='active').order_by('name')
 
-    context = {
-        'total_income': format_amount(total_income),
-        'total_expense': format_amount(abs(total_expense)),
-        'net_amount': format_amount(net_amount),
-        'net_positive': net_amount >= 0,
-        'operation_count': filtered_qs.count(),
-        'filters': filters,
-        'accounts': accounts,
-        'projects': projects,
+def _balances_payload(data):
+    balances = data['balances']
+    return {
         'account_balances': [
             {
-                'name': row['account__name'],
-                'currency': row['account__currency'],
-                'balance': format_amount(row['balance'] or 0),
-                'is_negative': (row['balance'] or 0) < 0,
+                'name': name,
+                'currency': currency,
+                'balance': _format_amount(balances[pk]),
+                'is_negative': balances[pk] < 0,
             }
-            for row in account_balances_raw
+            for pk, name, currency in data['accounts']
+            if pk in balances
         ],
+    }
+
+
+def _categories_payload(data):
+    total_expense_abs = abs(data['expense'])
+    return {
         'top_expense_categories': [
             {
-                'name': row['expense_link__category__name'] or '—',
-                'total': format_amount(abs(row['total'] or 0)),
-                'percent': 0 if not has_expense else round((abs(row['total'] or 0) / total_expense_abs) * 100, 1)
+                'name': name or '—',
+                'total': _format_amount(abs(total)),
+                'percent': 0 if not total_expense_abs else float(round(abs(total) / total_expense_abs * 100, 1)),
             }
-            for row in top_expense_categories_raw
+            for name, total in data['categories']
         ],
-        'trend_labels': trend_labels,
-        'trend_values': trend_values,
-        'recent_transactions': recent_transactions,
+        'base_currency': data['base_currency'],
     }
-    return render(request, 'dashboard.html', context)
+
+
+def _trend_payload(data):
+    return {
+        'trend_labels': [day.strftime('%d.%m') for day, _ in data['trend']],
+        'trend_values': [float(total) for _, total in data['trend']],
+        'base_currency': data['base_currency'],
+    }
+
+
+def _recent_payload(data):
+    recent_transactions = []
+    for tx in data['rows']:
+        amount_value = float(tx.amount)
+        recent_transactions.append({
+            'date': timezone.localtime(tx.date).strftime('%d.%m.%Y %H:%M'),
+            'account': tx.account_name,
+            'project': tx.project_name,
+            'category': tx.category_name,
+            'amount': f"{'+' if amount_value >= 0 else '-'}{_format_amount(abs(tx.amount))} {tx.currency}",
+            'is_income': amount_value >= 0,
+            'comment': tx.comment or '—',
+        })
+    return {'recent_transactions': recent_transactions}
+
+
+WIDGET_PAYLOADS = {
+    'totals': _totals_payload,
+    'balances': _balances_payload,
+    'categories': _categories_payload,
+    'trend': _trend_payload,
+    'recent': _recent_payload,
+}
+
+
+def _authenticated_user(request):
+    user = request.user
+    return user if user.is_authenticated else None
+
+
+async def dashboard_widget(request, widget):
+    """JSON одного виджета дашборда; фильтры — те же GET-параметры, что у страницы."""
+    if widget not in WIDGET_PAYLOADS:
+        raise Http404
+    # В Django 4.2 пользователь сессии загружается только синхронно
+    user = await sync_to_async(_authenticated_user)(request)
+    if user is None:
+        return JsonResponse({'error': 'Требуется вход'}, status=401)
+    selected = read_dashboard_filters(request.GET)
+    version = await aget_data_version(user.id)
+    data = await cached_widget_data(user.id, version, selected, widget)
+    response = JsonResponse(WIDGET_PAYLOADS[widget](data))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 @login_required
 def categories_settings(request):
@@ -208,6 +195,7 @@ def categories_settings(request):
         project.status = 'deleted'
         project.save(update_fields=['status'])
         ExpenseLink.objects.filter(user=user, project=project, status='active').update(status='deleted')
+        note_dimensions_changed(user.id)
         if preferences.default_project_id == project.id:
             preferences.default_project = None
             preferences.save(update_fields=['default_project'])
@@ -298,6 +286,8 @@ def categories_settings(request):
             ).exists()
             if not has_active_links:
                 Subcategory.objects.filter(pk=subcategory_id, user=user, status='active').update(status='deleted')
+        # Массовые update не посылают сигналов
+        note_dimensions_changed(user.id)
 
         return redirect(f"{reverse('categories_settings')}?open={project_id}")
 
@@ -362,6 +352,7 @@ def categories_settings(request):
             subcategory=subcategory,
             status='active'
         ).update(status='deleted')
+        note_dimensions_changed(user.id)
 
         has_active_links = ExpenseLink.objects.filter(
             user=user, subcategory=subcategory, status='active'
@@ -0,0 +1,161 @@
+"""Пакетное изменение и удаление транзакций.
+
+Справочники из патча проверяются одним запросом на тип, затем все
+транзакции меняются одним ``UPDATE`` (связки подменяются через ``CASE`` по
+текущей связке) или удаляются одним ``DELETE`` в одной транзакции БД.
+Поисковые документы, проекция ``TransactionRow``, дневные обороты и версия
+данных обновляются следом запросами на весь набор, а не на каждую строку.
+"""
+from django.db import transaction as db_transaction
+from django.db.models import BigIntegerField, Case, Value, When
+
+from core.datastate import note_transactions_changed
+from core.listing import sync_transaction_rows
+from core.models import Account, Category, Project, Subcategory, Transaction, TransactionRow
+from core.rollups import apply_deltas, queryset_deltas
+from core.search import refresh_search_documents
+from core.signals import muted_transaction_signals
+from .dimensions import DimensionResolver
+from .importer import normalize_string
+
+
+BATCH_UPDATE = 'update'
+BATCH_DELETE = 'delete'
+MAX_BATCH_SIZE = 1000
+PATCH_FIELDS = ('account_id', 'project_id', 'category_id', 'subcategory_id', 'comment', 'currency')
+
+
+class BatchError(ValueError):
+    """Raised when a batch request fails validation; ``errors`` maps field to message."""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(errors.values()))
+        self.errors = errors
+
+
+def parse_ids(raw_ids):
+    if not isinstance(raw_ids, list) or not raw_ids:
+        raise BatchError({'ids': 'Выберите транзакции'})
+    if len(raw_ids) > MAX_BATCH_SIZE:
+        raise BatchError({'ids': f'Не больше {MAX_BATCH_SIZE} транзакций за раз'})
+    try:
+        return sorted({int(value) for value in raw_ids})
+    except (TypeError, ValueError) as exc:
+        raise BatchError({'ids': 'Некорректный список транзакций'}) from exc
+
+
+def owned_ids(user, ids):
+    found = set(
+        Transaction.objects.filter(pk__in=ids, account__user=user).values_list('pk', flat=True)
+    )
+    missing = [pk for pk in ids if pk not in found]
+    if missing:
+        raise BatchError({'ids': 'Транзакции не найдены: ' + ', '.join(str(pk) for pk in missing[:20])})
+    return ids
+
+
+def _active(model, user, pk, message, errors, field):
+    try:
+        return model.objects.get(pk=pk, user=user, status='active')
+    except (model.DoesNotExist, ValueError, TypeError):
+        errors[field] = message
+        return None
+
+
+def validate_patch(user, patch):
+    """Проверяет патч; возвращает ``{'account': ..., 'project': ..., ...}`` только с переданными полями."""
+    if not isinstance(patch, dict) or not any(field in patch for field in PATCH_FIELDS):
+        raise BatchError({'patch': 'Укажите, что изменить'})
+    errors = {}
+    cleaned = {}
+    if 'account_id' in patch:
+        cleaned['account'] = _active(Account, user, patch['account_id'], 'Счёт не найден', errors, 'account')
+    if 'project_id' in patch:
+        cleaned['project'] = _active(Project, user, patch['project_id'], 'Проект не найден', errors, 'project')
+    if 'category_id' in patch:
+        cleaned['category'] = _active(Category, user, patch['category_id'], 'Категория не найдена', errors, 'category')
+    if 'subcategory_id' in patch:
+        cleaned['subcategory'] = None
+        if patch['subcategory_id']:
+            cleaned['subcategory'] = _active(
+                Subcategory, user, patch['subcategory_id'], 'Подкатегория не найдена', errors, 'subcategory'
+            )
+    elif 'category' in cleaned:
+        # Подкатегория принадлежит связке с категорией: смена категории её сбрасывает
+        cleaned['subcategory'] = None
+    if 'comment' in patch:
+        cleaned['comment'] = normalize_string(patch['comment']) or None
+    if 'currency' in patch:
+        cleaned['currency'] = normalize_string(patch['currency']).upper()
+        if not cleaned['currency']:
+            errors['currency'] = 'Укажите валюту'
+    if errors:
+        raise BatchError(errors)
+    return cleaned
+
+
+def _link_mapping(user, queryset, cleaned):
+    """{текущая связка: новая} для транзакций выборки; связки создаются пакетно."""
+    current = queryset.order_by().values_list(
+        'expense_link_id',
+        'expense_link__project_id',
+        'expense_link__category_id',
+        'expense_link__subcategory_id',
+    ).distinct()
+    targets = {}
+    for link_id, project_id, category_id, subcategory_id in current:
+        targets[link_id] = (
+            cleaned['project'].pk if 'project' in cleaned else project_id,
+            cleaned['category'].pk if 'category' in cleaned else category_id,
+            (cleaned['subcategory'].pk if cleaned['subcategory'] else None)
+            if 'subcategory' in cleaned else subcategory_id,
+        )
+    resolver = DimensionResolver(user)
+    resolver.resolve_links(set(targets.values()))
+    return {
+        link_id: resolver.links[key].pk
+        for link_id, key in targets.items()
+        if resolver.links[key].pk != link_id
+    }
+
+
+def update_transactions(user, ids, cleaned):
+    """Применяет патч ко всем ``ids`` и возвращает число изменённых транзакций."""
+    queryset = Transaction.objects.filter(pk__in=ids)
+    with db_transaction.atomic():
+        fields = {}
+        if 'account' in cleaned:
+            fields['account_id'] = cleaned['account'].pk
+        if 'comment' in cleaned:
+            fields['comment'] = cleaned['comment']
+        if 'currency' in cleaned:
+            fields['currency'] = cleaned['currency']
+        if {'project', 'category', 'subcategory'} & cleaned.keys():
+            mapping = _link_mapping(user, queryset, cleaned)
+            if mapping:
+                fields['expense_link_id'] = Case(
+                    *[When(expense_link_id=source, then=Value(target)) for source, target in mapping.items()],
+                    default='expense_link_id',
+                    output_field=BigIntegerField(),
+                )
+        rows = TransactionRow.objects.filter(pk__in=ids)
+        deltas = queryset_deltas(rows, sign=-1)
+        updated = queryset.update(**fields) if fields else 0
+        if fields.keys() & {'account_id', 'expense_link_id', 'comment'}:
+            refresh_search_documents(queryset)
+        sync_transaction_rows(queryset)
+        apply_deltas(queryset_deltas(rows, deltas=deltas))
+    note_transactions_changed(user.id)
+    return updated
+
+
+def delete_transactions(user, ids):
+    """Удаляет ``ids`` одним DELETE; проекция удаляется каскадом, обороты уменьшаются разом."""
+    with db_transaction.atomic(), muted_transaction_signals():
+        deltas = queryset_deltas(TransactionRow.objects.filter(pk__in=ids), sign=-1)
+        deleted, per_model = Transaction.objects.filter(pk__in=ids).delete()
+        apply_deltas(deltas)
+    count = per_model.get(Transaction._meta.label, 0)
+    if count:
+        note_transactions_changed(user.id, deleted=count)
+    return count
@@ -0,0 +1,70 @@
+"""Счётчики строк для таблицы транзакций.
+
+``recordsTotal`` берётся из счётчика пользователя (core.datastate), а
+``recordsFiltered`` кэшируется по хэшу фильтров. Версия данных пользователя
+входит в ключ кэша, поэтому любая запись транзакций делает старые значения
+недоступными без явной очистки. В режиме ``estimated`` для больших выборок
+на PostgreSQL используется оценка планировщика вместо точного COUNT.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+
+from core.datastate import get_transaction_state
+
+
+COUNT_MODE_EXACT = 'exact'
+COUNT_MODE_ESTIMATED = 'estimated'
+DEFAULT_CACHE_TIMEOUT = 10 * 60
+DEFAULT_EXACT_COUNT_LIMIT = 50000
+
+
+def _filters_digest(filters):
+    payload = json.dumps(filters, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def planner_estimate(queryset):
+    """Оценка числа строк из EXPLAIN или None, если бэкенд не PostgreSQL."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    try:
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def grid_counts(user, queryset, filters):
+    """(recordsTotal, recordsFiltered, estimated) для ``transaction_data``."""
+    total, version = get_transaction_state(user.id)
+    active = {name: value for name, value in filters.items() if value}
+    if not active:
+        return total, total, False
+
+    key = f'transactions:count:{user.id}:{version}:{_filters_digest(active)}'
+    cached = cache.get(key)
+    if cached is not None:
+        return total, cached[0], cached[1]
+
+    estimated = False
+    filtered = None
+    if getattr(settings, 'TRANSACTION_GRID_COUNT_MODE', COUNT_MODE_EXACT) == COUNT_MODE_ESTIMATED:
+        estimate = planner_estimate(queryset)
+        limit = int(getattr(settings, 'TRANSACTION_GRID_EXACT_COUNT_LIMIT', DEFAULT_EXACT_COUNT_LIMIT))
+        if estimate is not None and estimate > limit:
+            filtered, estimated = estimate, True
+    if filtered is None:
+        filtered = queryset.count()
+    cache.set(key, (filtered, estimated), int(getattr(settings, 'TRANSACTION_GRID_COUNT_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT)))
+    return total, filtered, estimated
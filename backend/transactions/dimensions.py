@@ -0,0 +1,145 @@
+"""Пакетный резолв справочников пользователя по именам.
+
+Счета и проекты сравниваются без учёта регистра по ``name_key``
+(``str.casefold``) в Python: ``lower()`` базы не везде сворачивает
+кириллицу (SQLite), и сравнение на разных сторонах давало дубли. Их у
+пользователя немного, поэтому они читаются целиком один раз. Категории и
+подкатегории сравниваются точно и находятся запросами ``IN`` по ``name``.
+Недостающие записи создаются одним ``bulk_create`` на тип справочника,
+поэтому число запросов не зависит от количества различных имён в файле.
+"""
+from core.datastate import note_dimensions_changed
+from core.models import Account, Project, Category, Subcategory, ExpenseLink
+
+
+LOOKUP_BATCH_SIZE = 1000
+
+
+def batched(items, size=LOOKUP_BATCH_SIZE):
+    items = list(items)
+    for offset in range(0, len(items), size):
+        yield items[offset:offset + size]
+
+
+def name_key(name):
+    """Ключ имени счёта или проекта: без учёта регистра."""
+    return name.casefold()
+
+
+class DimensionResolver:
+    """Кэши справочников с пакетной догрузкой недостающих имён."""
+
+    def __init__(self, user):
+        self.user = user
+        self.accounts = {}
+        self.projects = {}
+        self.categories = {}
+        self.subcategories = {}
+        self.links = {}
+        self._preloaded = set()
+
+    def _fetch_by_names(self, model, keys):
+        found = {}
+        for batch in batched(keys):
+            for obj in model.objects.filter(user=self.user, name__in=batch).order_by('id'):
+                found.setdefault(obj.name, obj)
+        return found
+
+    def _preload(self, model, cache):
+        if model in self._preloaded:
+            return
+        for obj in model.objects.filter(user=self.user).order_by('id'):
+            cache.setdefault(name_key(obj.name), obj)
+        self._preloaded.add(model)
+
+    def _resolve(self, model, cache, names, build, *, folded=False):
+        if folded:
+            self._preload(model, cache)
+        missing = {key: value for key, value in names.items() if key not in cache}
+        if not missing:
+            return
+        found = {} if folded else self._fetch_by_names(model, missing.keys())
+        cache.update(found)
+        to_create = [key for key in missing if key not in found]
+        if not to_create:
+            return
+        created = model.objects.bulk_create([build(missing[key]) for key in to_create])
+        # bulk_create не посылает сигналов: версию данных меняем явно
+        note_dimensions_changed(self.user.id)
+        for key, obj in zip(to_create, created):
+            cache[key] = obj
+
+    def resolve_accounts(self, names):
+        """``names``: {name_key(name): (name, currency)}."""
+        self._resolve(
+            Account,
+            self.accounts,
+            names,
+            lambda item: Account(user=self.user, name=item[0], currency=item[1] or 'RUB', status='active'),
+            folded=True,
+        )
+
+    def resolve_projects(self, names):
+        """``names``: {name_key(name): name}."""
+        self._resolve(
+            Project,
+            self.projects,
+            names,
+            lambda name: Project(user=self.user, name=name, status='active'),
+            folded=True,
+        )
+
+    def resolve_categories(self, names):
+        """``names``: {name: name}."""
+        self._resolve(
+            Category,
+            self.categories,
+            names,
+            lambda name: Category(user=self.user, name=name, status='active'),
+        )
+
+    def resolve_subcategories(self, names):
+        """``names``: {name: name}."""
+        self._resolve(
+            Subcategory,
+            self.subcategories,
+            names,
+            lambda name: Subcategory(user=self.user, name=name, status='active'),
+        )
+
+    def resolve_links(self, keys):
+        """``keys``: множество (project_id, category_id, subcategory_id | None)."""
+        missing = {key for key in keys if key not in self.links}
+        if not missing:
+            return
+        project_ids = {key[0] for key in missing}
+        category_ids = {key[1] for key in missing}
+        queryset = (
+            ExpenseLink.objects
+            .filter(user=self.user, project_id__in=project_ids, category_id__in=category_ids)
+            .order_by('id')
+        )
+        for link in queryset:
+            key = (link.project_id, link.category_id, link.subcategory_id)
+            if key not in missing:
+                continue
+            # Как transaction_update: первая активная связка, иначе первая любая
+            current = self.links.get(key)
+            if current is None or (current.status != 'active' and link.status == 'active'):
+                self.links[key] = link
+        to_create = [key for key in missing if key not in self.links]
+        if not to_create:
+            return
+        created = ExpenseLink.objects.bulk_create([
+            ExpenseLink(
+                user=self.user,
+                project_id=project_id,
+                category_id=category_id,
+                subcategory_id=subcategory_id,
+                status='active',
+            )
+            for project_id, category_id, subcategory_id in to_create
+        ])
+        note_dimensions_changed(self.user.id)
+        for key, link in zip(to_create, created):
+            self.links[key] = link
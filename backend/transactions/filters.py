@@ -0,0 +1,123 @@
+"""Фильтры таблицы транзакций по счёту, проекту, категории и подкатегории.
+
+Фильтры приходят как id (``account_id``, ``project_id``, ...) или, для
+совместимости, как названия. Названия переводятся в id один раз через карту
+измерений пользователя (``DimensionMap``), после чего основной запрос
+фильтруется по ``account_id IN (...)`` и ``expense_link_id IN (...)`` без
+соединений со справочниками. Карта кэшируется по версии данных пользователя
+(core.datastate): переименования и новые связки меняют версию вместе с
+транзакциями, которые на них ссылаются.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from core.datastate import get_data_version
+from core.models import Account, ExpenseLink
+
+
+DIMENSIONS = ('account', 'project', 'category', 'subcategory')
+NO_SUBCATEGORY = '__none'
+DEFAULT_CACHE_TIMEOUT = 10 * 60
+
+
+class InvalidFilter(ValueError):
+    """Raised when a grid filter parameter cannot be parsed."""
+
+
+class DimensionMap:
+    """Счета и связки проект/категория/подкатегория одного пользователя."""
+
+    def __init__(self, accounts, links):
+        # accounts: [(id, name)], links: [(id, project_id, project, category_id, category, subcategory_id, subcategory)]
+        self.accounts = accounts
+        self.links = links
+
+    @classmethod
+    def load(cls, user_id):
+        accounts = list(Account.objects.filter(user_id=user_id).values_list('id', 'name'))
+        links = list(
+            ExpenseLink.objects.filter(user_id=user_id).values_list(
+                'id',
+                'project_id', 'project__name',
+                'category_id', 'category__name',
+                'subcategory_id', 'subcategory__name',
+            )
+        )
+        return cls(accounts, links)
+
+    def account_ids(self, selection):
+        return [pk for pk, name in self.accounts if _selected(selection, pk, name)]
+
+    def link_ids(self, project, category, subcategory):
+        """id связок, подходящих под выбранные проект, категорию и подкатегорию."""
+        result = []
+        for link_id, project_id, project_name, category_id, category_name, sub_id, sub_name in self.links:
+            if not _selected(project, project_id, project_name):
+                continue
+            if not _selected(category, category_id, category_name):
+                continue
+            if subcategory is not None and subcategory.get('none'):
+                if sub_id is not None:
+                    continue
+            elif not _selected(subcategory, sub_id, sub_name):
+                continue
+            result.append(link_id)
+        return result
+
+
+def _selected(selection, pk, name):
+    if selection is None:
+        return True
+    if 'id' in selection:
+        return pk == selection['id']
+    return name == selection['name']
+
+
+def get_dimension_map(user_id):
+    version = get_data_version(user_id)
+    key = f'transactions:dimensions:{user_id}:{version}'
+    dimensions = cache.get(key)
+    if dimensions is None:
+        dimensions = DimensionMap.load(user_id)
+        timeout = int(getattr(settings, 'TRANSACTION_GRID_COUNT_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT))
+        cache.set(key, dimensions, timeout)
+    return dimensions
+
+
+def read_dimension_filters(params):
+    """Выбранные фильтры из GET: ``{измерение: {'id': ...} | {'name': ...} | {'none': True}}``.
+
+    Параметр ``<измерение>_id`` важнее названия; ``__none`` в подкатегории
+    означает транзакции без подкатегории.
+    """
+    selected = {}
+    for dimension in DIMENSIONS:
+        raw_id = params.get(f'{dimension}_id', '').strip()
+        name = params.get(dimension, '').strip()
+        if dimension == 'subcategory' and NO_SUBCATEGORY in (raw_id, name):
+            selected[dimension] = {'none': True}
+        elif raw_id:
+            try:
+                selected[dimension] = {'id': int(raw_id)}
+            except ValueError as exc:
+                raise InvalidFilter(f'Некорректный параметр {dimension}_id') from exc
+        elif name:
+            selected[dimension] = {'name': name}
+    return selected
+
+
+def apply_dimension_filters(queryset, user_id, selected):
+    """Ограничивает выборку по ``account_id`` и ``expense_link_id`` вместо соединений."""
+    if not selected:
+        return queryset
+    dimensions = get_dimension_map(user_id)
+    if 'account' in selected:
+        queryset = queryset.filter(account_id__in=dimensions.account_ids(selected['account']))
+    if any(dimension in selected for dimension in ('project', 'category', 'subcategory')):
+        link_ids = dimensions.link_ids(
+            selected.get('project'),
+            selected.get('category'),
+            selected.get('subcategory'),
+        )
+        queryset = queryset.filter(expense_link_id__in=link_ids)
+    return queryset
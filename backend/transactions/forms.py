@@ -87,6 +87,7 @@ class TransactionImportMappingForm(forms.Form):
 
         self.fields['column_comment'] = forms.ChoiceField(label='Колонка с комментарием', choices=optional_choices, required=False)
         self.fields['default_comment'] = forms.CharField(label='Комментарий по умолчанию', required=False)
+        self.fields['column_operation_id'] = forms.ChoiceField(label='Колонка с ID операции банка', choices=optional_choices, required=False)
 
         initial = preset_initial or {}
         for name, value in initial.items():
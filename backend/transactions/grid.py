@@ -0,0 +1,80 @@
+"""Сериализация строк таблицы транзакций.
+
+Страница читается как кортежи ``values_list(*GRID_FIELDS, named=True)`` из
+проекции ``TransactionRow`` без создания моделей, строки собираются
+форматтерами без strftime и локали, а ответ кодируется orjson, если он
+установлен (иначе — стандартный ``JsonResponse``). Те же форматтеры
+принимают и экземпляр ``TransactionRow`` (ответ ``transaction_update``).
+"""
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+# Имена совпадают с атрибутами TransactionRow, поэтому кортеж и модель взаимозаменяемы
+GRID_FIELDS = (
+    'pk', 'date', 'amount', 'is_income', 'currency',
+    'account_id', 'account_name',
+    'project_id', 'project_name',
+    'category_id', 'category_name',
+    'subcategory_id', 'subcategory_name',
+    'comment',
+)
+# '1,234.50' → '1 234,50' за один проход
+AMOUNT_SEPARATORS = str.maketrans({',': ' ', '.': ','})
+
+
+def format_amount(value):
+    text = f'{abs(value):,.2f}'.translate(AMOUNT_SEPARATORS)
+    return text[:-3] if text.endswith(',00') else text
+
+
+def format_grid_row(row, tz=None):
+    """Словарь строки таблицы; ``tz`` передаётся, чтобы не искать зону на каждой строке."""
+    amount_value = float(row.amount)
+    is_income = row.is_income
+    local = row.date.astimezone(tz or timezone.get_current_timezone())
+    day = f'{local.day:02d}'
+    month = f'{local.month:02d}'
+    clock = f'{local.hour:02d}:{local.minute:02d}'
+    return {
+        'id': row.pk,
+        'date': {
+            'display': f'{day}.{month}.{local.year} {clock}',
+            'sort': row.date.timestamp(),
+        },
+        'date_iso': f'{local.year:04d}-{month}-{day}T{clock}',
+        'type_raw': 'income' if is_income else 'expense',
+        'amount': {
+            'display': f"<span class=\"amount-value\">{'+' if is_income else '-'}{format_amount(amount_value)}</span>",
+            'sort': amount_value,
+        },
+        'amount_raw': str(row.amount),
+        'currency': row.currency,
+        'currency_code': row.currency,
+        'account': row.account_name,
+        'account_id': row.account_id,
+        'project': row.project_name,
+        'project_id': row.project_id,
+        'category': row.category_name,
+        'category_id': row.category_id,
+        'subcategory': row.subcategory_name or '—',
+        'subcategory_id': row.subcategory_id,
+        'comment': row.comment,
+        'comment_raw': row.comment,
+    }
+
+
+def format_grid_rows(rows):
+    tz = timezone.get_current_timezone()
+    return [format_grid_row(row, tz) for row in rows]
+
+
+def grid_json_response(payload, status=200):
+    if orjson is None:
+        return JsonResponse(payload, status=status)
+    return HttpResponse(orjson.dumps(payload), status=status, content_type='application/json')
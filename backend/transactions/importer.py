@@ -0,0 +1,508 @@
+"""Движок импорта транзакций.
+
+Файл читается порциями ограниченного размера: каждая порция разбирается,
+справочники резолвятся через кэши, а транзакции записываются через
+``bulk_create`` до чтения следующей порции. Благодаря этому потребление
+памяти не зависит от размера выписки.
+"""
+import csv
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import pandas as pd
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from core.bulk import copy_insert
+from core.datastate import note_transactions_changed
+from core.fingerprints import FingerprintCounter, base_key
+from core.listing import build_row
+from core.models import ExpenseLink, Transaction, TransactionRow
+from core.rollups import apply_deltas, rebuild_rollups, row_deltas
+from core.search import build_search_document
+from .dimensions import DimensionResolver, batched, name_key
+from .parsing import (
+    DATE_PATTERNS,
+    detect_date_format,
+    marker_signs,
+    parse_amount_column,
+    parse_date_column,
+    text_column,
+)
+from .spool import open_spooled
+from .staging import StagedRows
+from .workbook import Workbook
+
+
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_MAX_STORED_ERRORS = 1000
+SAMPLE_ROWS_LIMIT = 10
+# Transaction.amount — DecimalField(max_digits=14, decimal_places=2)
+MAX_AMOUNT = Decimal(10) ** 12
+
+
+class ImportRowError(Exception):
+    """Raised when a row in the import file cannot be processed."""
+
+
+def get_chunk_size():
+    return int(getattr(settings, 'TRANSACTION_IMPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+
+
+def normalize_string(value):
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value.strip()
+    return str(value).strip()
+
+
+def parse_decimal(value):
+    text = normalize_string(value)
+    if not text:
+        raise ImportRowError('Не указана сумма')
+    text = text.replace(' ', '').replace("'", '')
+    text = text.replace(',', '.').replace('\xa0', '')
+    try:
+        return Decimal(text)
+    except InvalidOperation as exc:
+        raise ImportRowError(f"Не удалось преобразовать сумму '{value}'") from exc
+
+
+def check_amount(amount, value):
+    """Сумма, которую можно сохранить: конечная и в пределах ``Transaction.amount``."""
+    if not amount.is_finite() or abs(amount) >= MAX_AMOUNT:
+        raise ImportRowError(f"Недопустимая сумма '{value}'")
+    return amount
+
+
+def parse_date_value(value):
+    text = normalize_string(value)
+    if not text:
+        raise ImportRowError('Не указана дата')
+    for pattern in DATE_PATTERNS:
+        try:
+            dt = datetime.strptime(text, pattern)
+            break
+        except ValueError:
+            continue
+    else:
+        try:
+            dt = datetime.fromisoformat(text)
+        except ValueError as exc:
+            raise ImportRowError(f"Не удалось распознать дату '{value}'") from exc
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt, timezone.get_current_timezone())
+    return dt
+
+
+def split_markers(markers):
+    return [item.strip().lower() for item in (markers or '').split(',') if item.strip()]
+
+
+# === ЧТЕНИЕ ФАЙЛА ===
+
+def normalize_frame(df):
+    """Приводит порцию к строкам: пустые строки выброшены, ячейки — str."""
+    df = df.replace(r'^\s*$', pd.NA, regex=True)
+    df = df.dropna(how='all')
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime('%Y-%m-%d %H:%M:%S')
+    df = df.fillna('').astype(str)
+    df.columns = [str(col).strip() for col in df.columns]
+    return df
+
+
+def _is_csv(original_name):
+    return original_name.lower().endswith('.csv')
+
+
+def _detect_csv_separator(stream):
+    head = stream.read(64 * 1024)
+    stream.seek(0)
+    if isinstance(head, bytes):
+        head = head.decode('utf-8', errors='ignore')
+    try:
+        return csv.Sniffer().sniff(head, delimiters=',;\t|').delimiter
+    except csv.Error:
+        return ';'
+
+
+def _count_csv_rows(stream):
+    """Оценка числа строк данных CSV по переводам строк, без заголовка.
+
+    Переносы внутри кавычек и пустые строки завышают оценку: для прогресса
+    это верхняя граница, а файл не разбирается.
+    """
+    count = 0
+    last = None
+    while True:
+        block = stream.read(1024 * 1024)
+        if not block:
+            break
+        count += block.count(b'\n' if isinstance(block, bytes) else '\n')
+        last = block[-1:]
+    stream.seek(0)
+    if last is not None and last not in (b'\n', '\n'):
+        count += 1
+    return max(count - 1, 0)
+
+
+def _iter_csv_chunks(source, chunk_size, on_total=None):
+    if on_total is not None:
+        on_total(_count_csv_rows(source))
+    separator = _detect_csv_separator(source)
+    reader = pd.read_csv(source, sep=separator, dtype=str, chunksize=chunk_size)
+    for chunk in reader:
+        yield chunk
+
+
+def _iter_excel_chunks(source, original_name, sheet_name, chunk_size, on_total=None):
+    """``source`` — файл или уже открытый ``Workbook`` (тогда он не закрывается)."""
+    workbook = source if isinstance(source, Workbook) else Workbook(source, original_name)
+    try:
+        if on_total is not None:
+            total = workbook.row_count(sheet_name)
+            if total is not None:
+                on_total(total)
+        columns, rows = workbook.iter_rows(sheet_name)
+        buffer = []
+        for values in rows:
+            buffer.append(values)
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=columns, dtype=object)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns, dtype=object)
+    finally:
+        if workbook is not source:
+            workbook.close()
+
+
+def iter_file_chunks(source, original_name, *, sheet_name=None, chunk_size=None, on_total=None):
+    """Читает CSV/Excel порциями по ``chunk_size`` строк (нормализованные DataFrame).
+
+    ``on_total(rows)`` вызывается до первой порции с оценкой числа строк
+    файла, если её можно получить без разбора.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    if _is_csv(original_name):
+        raw_chunks = _iter_csv_chunks(source, chunk_size, on_total)
+    else:
+        raw_chunks = _iter_excel_chunks(source, original_name, sheet_name, chunk_size, on_total)
+    try:
+        for chunk in raw_chunks:
+            frame = normalize_frame(chunk)
+            if len(frame.index):
+                yield frame
+    except ImportRowError:
+        raise
+    except Exception as exc:
+        raise ImportRowError('Не удалось прочитать файл. Убедитесь, что формат поддерживается.') from exc
+
+
+def read_preview(source, original_name, *, sheet_name=None):
+    """Колонки и первые строки файла для формы сопоставления.
+
+    Читается только первая порция из ``SAMPLE_ROWS_LIMIT`` строк, поэтому время
+    загрузки не зависит от размера файла; полный разбор выполняет задание импорта.
+    """
+    chunks = iter_file_chunks(source, original_name, sheet_name=sheet_name, chunk_size=SAMPLE_ROWS_LIMIT)
+    first = next(chunks, None)
+    chunks.close()
+    if first is None:
+        return {'original_name': original_name, 'columns': [], 'sample_rows': []}
+    return {
+        'original_name': original_name,
+        'columns': list(first.columns),
+        'sample_rows': first.to_dict('records'),
+    }
+
+
+def iter_session_chunks(session, chunk_size=None, on_total=None):
+    """Порции строк сессии: из сохранённого файла или из staged_rows (повтор ошибочных строк)."""
+    chunk_size = chunk_size or get_chunk_size()
+    source = session.metadata.get('source')
+    if source:
+        with open_spooled(source['token']) as stream:
+            yield from iter_file_chunks(
+                stream,
+                source['original_name'],
+                sheet_name=source.get('sheet_name'),
+                chunk_size=chunk_size,
+                on_total=on_total,
+            )
+        return
+    if session.staged_rows:
+        staged = StagedRows(session.staged_rows)
+        if on_total is not None:
+            on_total(len(staged))
+        yield from staged.iter_frames(chunk_size)
+        return
+    rows = session.rows or []
+    for offset in range(0, len(rows), chunk_size):
+        frame = pd.DataFrame(rows[offset:offset + chunk_size], columns=session.columns)
+        yield frame.fillna('')
+
+
+# === РЕЗОЛВ СПРАВОЧНИКОВ ===
+
+def ensure_expense_link(user, project, category, subcategory):
+    link, _ = ExpenseLink.objects.get_or_create(
+        user=user,
+        project=project,
+        category=category,
+        subcategory=subcategory,
+        defaults={'status': 'active'},
+    )
+    return link
+
+
+# === ОБРАБОТКА ===
+
+class TransactionImporter:
+    """Обрабатывает порции строк и сохраняет транзакции после каждой порции.
+
+    Порция проходит в три шага: пакетный разбор дат/сумм, пакетный резолв
+    справочников по различным именам порции и сборка транзакций для
+    ``copy_insert``. Уже загруженные ранее строки отсеиваются по отпечатку
+    одним запросом на порцию и учитываются в ``result['duplicates']``.
+    Строки проекции ``TransactionRow`` пишутся в той же транзакции БД из уже
+    известных справочников, без повторного чтения транзакций, и по ним же
+    сдвигаются дневные обороты ``DailyRollup``.
+    Кэши справочников живут между порциями, а список ошибок ограничен
+    ``TRANSACTION_IMPORT_MAX_STORED_ERRORS``: остальные только считаются.
+    """
+
+    def __init__(self, user, cleaned):
+        self.user = user
+        self.cleaned = cleaned
+        self.column_date = cleaned['column_date']
+        self.column_amount = cleaned['column_amount']
+        self.column_currency = cleaned.get('column_currency')
+        self.column_account = cleaned.get('column_account')
+        self.column_project = cleaned.get('column_project')
+        self.column_category = cleaned.get('column_category')
+        self.column_subcategory = cleaned.get('column_subcategory')
+        self.column_comment = cleaned.get('column_comment')
+        self.column_type = cleaned.get('column_type')
+        self.column_operation_id = cleaned.get('column_operation_id')
+
+        self.income_markers = set(split_markers(cleaned.get('income_markers')))
+        self.expense_markers = set(split_markers(cleaned.get('expense_markers')))
+        self.default_currency = normalize_string(cleaned.get('default_currency')) or 'RUB'
+        self.default_account_name = normalize_string(cleaned.get('default_account_name'))
+        self.default_project_name = normalize_string(cleaned.get('default_project_name'))
+        self.default_comment = normalize_string(cleaned.get('default_comment'))
+        self.max_stored_errors = int(
+            getattr(settings, 'TRANSACTION_IMPORT_MAX_STORED_ERRORS', DEFAULT_MAX_STORED_ERRORS)
+        )
+
+        self.result = {'created': 0, 'duplicates': 0, 'errors': [], 'error_count': 0}
+        self.fingerprints = FingerprintCounter()
+        self.row_index = 0
+        # Формат дат определяется один раз по образцам первой порции
+        self.date_format = None
+
+        # Счёт/проект, выбранные в форме, подставляются в строки с пустой ячейкой
+        self.default_account = cleaned.get('default_account')
+        self.default_project = cleaned.get('default_project')
+        if self.default_account is not None:
+            self.default_account_name = ''
+        if self.default_project is not None:
+            self.default_project_name = ''
+        self.dimensions = DimensionResolver(user)
+
+    def run(self, chunks, progress=None):
+        """``progress(processed_rows, result)`` вызывается после каждой сохранённой порции."""
+        for frame in chunks:
+            self.process_chunk(frame)
+            if progress is not None:
+                progress(self.row_index, self.result)
+        return self.result
+
+    def process_chunk(self, frame):
+        base_index = self.row_index
+        self.row_index += len(frame.index)
+        non_empty = frame.ne('').any(axis=1).tolist() if len(frame.columns) else []
+
+        # Даты, суммы и признаки типа разбираются пакетно; None — построчный разбор с ошибкой
+        date_texts = text_column(frame, self.column_date)
+        if self.date_format is None:
+            self.date_format = detect_date_format(date_texts.tolist())
+        dates = parse_date_column(date_texts, self.date_format, timezone.get_current_timezone_name())
+        amount_texts = text_column(frame, self.column_amount)
+        amounts = parse_amount_column(amount_texts)
+        if self.column_type:
+            signs = marker_signs(text_column(frame, self.column_type), self.income_markers, self.expense_markers)
+        else:
+            signs = [0] * len(non_empty)
+
+        date_texts = date_texts.tolist()
+        amount_texts = amount_texts.tolist()
+        currencies = [value or self.default_currency for value in text_column(frame, self.column_currency).tolist()]
+        account_names = [value or self.default_account_name for value in text_column(frame, self.column_account).tolist()]
+        project_names = [value or self.default_project_name for value in text_column(frame, self.column_project).tolist()]
+        category_names = text_column(frame, self.column_category).tolist()
+        subcategory_names = text_column(frame, self.column_subcategory).tolist()
+        comments = text_column(frame, self.column_comment).tolist()
+        operation_ids = text_column(frame, self.column_operation_id).tolist()
+
+        # Шаг 1: значения строки
+        candidates = []
+        for position, has_data in enumerate(non_empty):
+            if not has_data:
+                continue
+            try:
+                date_value = dates[position]
+                if date_value is None:
+                    date_value = parse_date_value(date_texts[position])
+                amount = amounts[position]
+                if amount is None:
+                    amount = parse_decimal(amount_texts[position])
+                amount = check_amount(amount, amount_texts[position])
+                if signs[position] > 0:
+                    amount = abs(amount)
+                elif signs[position] < 0:
+                    amount = -abs(amount)
+                candidates.append((position, date_value, amount))
+            except ImportRowError as exc:
+                self._add_error(frame, base_index, position, str(exc))
+            except Exception as exc:  # catch-all for unexpected issues
+                self._add_error(frame, base_index, position, f'Неожиданная ошибка: {exc}')
+
+        # Шаг 2: справочники — по одному набору запросов на тип
+        dims = self.dimensions
+        account_keys, project_keys, category_keys, subcategory_keys = {}, {}, {}, {}
+        for position, _, _ in candidates:
+            account_name = account_names[position]
+            if account_name:
+                account_keys.setdefault(name_key(account_name), (account_name, currencies[position]))
+            if project_names[position]:
+                project_keys.setdefault(name_key(project_names[position]), project_names[position])
+            if category_names[position]:
+                category_keys.setdefault(category_names[position], category_names[position])
+            if subcategory_names[position]:
+                subcategory_keys.setdefault(subcategory_names[position], subcategory_names[position])
+        dims.resolve_accounts(account_keys)
+        dims.resolve_projects(project_keys)
+        dims.resolve_categories(category_keys)
+        dims.resolve_subcategories(subcategory_keys)
+
+        resolved = []
+        for position, date_value, amount in candidates:
+            try:
+                resolved.append((position, date_value, amount) + self._row_dimensions(
+                    account_names[position],
+                    project_names[position],
+                    category_names[position],
+                    subcategory_names[position],
+                ))
+            except ImportRowError as exc:
+                self._add_error(frame, base_index, position, str(exc))
+
+        dims.resolve_links({
+            (project.id, category.id, subcategory.id if subcategory else None)
+            for _, _, _, _, project, category, subcategory in resolved
+        })
+
+        # Шаг 3: транзакции
+        pending_transactions = []
+        pending_dimensions = {}
+        for position, date_value, amount, account, project, category, subcategory in resolved:
+            expense_link = dims.links[(project.id, category.id, subcategory.id if subcategory else None)]
+            comment_parts = [comments[position], self.default_comment]
+            comment = ' '.join(part for part in comment_parts if part)
+            currency = currencies[position] or account.currency
+            key = base_key(account.id, date_value, amount, currency, comments[position], operation_ids[position])
+            fingerprint = self.fingerprints.next(key)
+            pending_dimensions[fingerprint] = (account, project, category, subcategory)
+            pending_transactions.append(Transaction(
+                fingerprint=fingerprint,
+                search_document=build_search_document(
+                    account.name,
+                    project.name,
+                    category.name,
+                    subcategory.name if subcategory else '',
+                    comment,
+                ),
+                account=account,
+                expense_link=expense_link,
+                amount=amount,
+                currency=currency,
+                date=date_value,
+                transaction_type='income' if amount >= 0 else 'expense',
+                comment=comment or None,
+            ))
+
+        self.fingerprints.flush()
+
+        existing = set()
+        for batch in batched([item.fingerprint for item in pending_transactions]):
+            existing.update(Transaction.objects.filter(fingerprint__in=batch).values_list('fingerprint', flat=True))
+        new_transactions = [item for item in pending_transactions if item.fingerprint not in existing]
+        created = 0
+        if new_transactions:
+            with db_transaction.atomic():
+                # Конфликты на уникальном индексе возможны только при параллельном импорте того же файла
+                created = copy_insert(Transaction, new_transactions, ignore_conflicts=True)
+                rows = self._insert_rows(new_transactions, pending_dimensions)
+                if created == len(new_transactions):
+                    apply_deltas(row_deltas(rows))
+                else:
+                    # Часть порции вставил параллельный импорт: чьи строки учтены, неизвестно
+                    rebuild_rollups(self.user.id)
+        self.result['created'] += created
+        if created:
+            note_transactions_changed(self.user.id, inserted=created)
+        self.result['duplicates'] += len(pending_transactions) - created
+
+    def _insert_rows(self, transactions, dimensions):
+        """Вставляет и возвращает строки TransactionRow для транзакций порции: id берутся по отпечаткам."""
+        ids = {}
+        for batch in batched([item.fingerprint for item in transactions]):
+            ids.update(Transaction.objects.filter(fingerprint__in=batch).values_list('fingerprint', 'id'))
+        rows = []
+        for item in transactions:
+            item.pk = ids.get(item.fingerprint)
+            if item.pk is not None:
+                rows.append(build_row(item, *dimensions[item.fingerprint]))
+        copy_insert(TransactionRow, rows, ignore_conflicts=True)
+        return rows
+
+    def _row_dimensions(self, account_name, project_name, category_name, subcategory_name):
+        dims = self.dimensions
+        if account_name:
+            account = dims.accounts[name_key(account_name)]
+        elif self.default_account is not None:
+            account = self.default_account
+        else:
+            raise ImportRowError('Не удалось определить счёт')
+
+        if project_name:
+            project = dims.projects[name_key(project_name)]
+        elif self.default_project is not None:
+            project = self.default_project
+        else:
+            raise ImportRowError('Не удалось определить проект')
+
+        if not category_name:
+            raise ImportRowError('Не удалось определить категорию')
+        category = dims.categories[category_name]
+        subcategory = dims.subcategories[subcategory_name] if subcategory_name else None
+        return account, project, category, subcategory
+
+    def _add_error(self, frame, base_index, position, message):
+        self.result['error_count'] += 1
+        if len(self.result['errors']) < self.max_stored_errors:
+            row_data = frame.iloc[position].to_dict()
+            self.result['errors'].append({'row': base_index + position + 1, 'message': message, 'row_data': row_data})
+
+
+def process_rows(user, session, cleaned, progress=None, total=None):
+    """``total(rows)`` получает оценку числа строк, как только источник открыт."""
+    importer = TransactionImporter(user, cleaned)
+    return importer.run(iter_session_chunks(session, on_total=total), progress=progress)
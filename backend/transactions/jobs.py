@@ -0,0 +1,189 @@
+"""Фоновые задания импорта.
+
+Шаг сопоставления только ставит задание в очередь (таблица
+``TransactionImportJob``), а строки обрабатывает воркер
+``run_import_worker``. Задание захватывается условным ``UPDATE`` по статусу,
+поэтому несколько воркеров не возьмут одно и то же задание. Счётчики
+обновляются после каждой сохранённой порции — их читает страница импорта.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from core.models import Account, Project
+from .importer import process_rows
+from .models import TransactionImportJob, TransactionImportSession
+from .spool import SpoolMissingError
+from .staging import encode_records
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STALE_TIMEOUT = 30 * 60
+
+
+def get_stale_timeout():
+    return int(getattr(settings, 'TRANSACTION_IMPORT_JOB_STALE_TIMEOUT', DEFAULT_STALE_TIMEOUT))
+
+
+def snapshot_mapping(cleaned):
+    """cleaned_data формы сопоставления → JSON: счёт и проект сохраняются по id."""
+    snapshot = cleaned.copy()
+    account_obj = snapshot.pop('default_account', None)
+    project_obj = snapshot.pop('default_project', None)
+    if account_obj:
+        snapshot['default_account_id'] = account_obj.id
+    if project_obj:
+        snapshot['default_project_id'] = project_obj.id
+    return snapshot
+
+
+def restore_mapping(user, snapshot):
+    """Обратное преобразование: id счёта и проекта → объекты пользователя."""
+    mapping = dict(snapshot or {})
+    account_id = mapping.pop('default_account_id', None)
+    project_id = mapping.pop('default_project_id', None)
+    if account_id:
+        mapping['default_account'] = Account.objects.filter(pk=account_id, user=user).first()
+    if project_id:
+        mapping['default_project'] = Project.objects.filter(pk=project_id, user=user).first()
+    return mapping
+
+
+def enqueue_import(user, session, cleaned):
+    """Создаёт задание для сессии; если задание уже в работе — возвращает его."""
+    with db_transaction.atomic():
+        session = TransactionImportSession.objects.select_for_update().defer('rows', 'staged_rows').get(pk=session.pk)
+        active = session.jobs.filter(status__in=TransactionImportJob.ACTIVE_STATUSES).first()
+        if active:
+            return active
+        mapping = snapshot_mapping(cleaned)
+        session.metadata['last_mapping'] = mapping
+        session.save(update_fields=['metadata'])
+        return TransactionImportJob.objects.create(
+            user=user,
+            session=session,
+            original_name=session.original_name,
+            mapping=mapping,
+            total_rows=session.row_count,
+        )
+
+
+def fail_stale_jobs(timeout=None, now=None):
+    """Помечает ошибкой задания, воркер которых перестал обновлять прогресс."""
+    timeout = get_stale_timeout() if timeout is None else timeout
+    now = now or timezone.now()
+    return TransactionImportJob.objects.filter(
+        status=TransactionImportJob.STATUS_RUNNING,
+        updated_at__lt=now - timedelta(seconds=timeout),
+    ).update(
+        status=TransactionImportJob.STATUS_FAILED,
+        message='Обработка прервана. Проверьте список транзакций и повторите импорт оставшихся строк.',
+        finished_at=now,
+        updated_at=now,
+    )
+
+
+def claim_next_job():
+    """Захватывает самое старое задание в очереди или возвращает None."""
+    candidates = (
+        TransactionImportJob.objects
+        .filter(status=TransactionImportJob.STATUS_QUEUED)
+        .order_by('created_at')
+        .values_list('pk', flat=True)[:10]
+    )
+    for pk in list(candidates):
+        now = timezone.now()
+        claimed = TransactionImportJob.objects.filter(
+            pk=pk,
+            status=TransactionImportJob.STATUS_QUEUED,
+        ).update(status=TransactionImportJob.STATUS_RUNNING, started_at=now, updated_at=now)
+        if claimed:
+            return TransactionImportJob.objects.get(pk=pk)
+    return None
+
+
+def run_job(job):
+    """Выполняет захваченное задание и фиксирует итог в нём и в сессии."""
+    session = job.session
+    if session is None:
+        _finish(job, TransactionImportJob.STATUS_FAILED, message='Сессия импорта не найдена.')
+        return job
+
+    def progress(processed_rows, result):
+        TransactionImportJob.objects.filter(pk=job.pk).update(
+            processed_rows=processed_rows,
+            created_count=result['created'],
+            duplicate_count=result['duplicates'],
+            error_count=result['error_count'],
+            updated_at=timezone.now(),
+        )
+
+    def total(rows):
+        # Для файлов из хранилища число строк известно только воркеру
+        TransactionImportJob.objects.filter(pk=job.pk).update(total_rows=rows, updated_at=timezone.now())
+
+    try:
+        result = process_rows(
+            job.user,
+            session,
+            restore_mapping(job.user, job.mapping),
+            progress=progress,
+            total=total,
+        )
+    except SpoolMissingError:
+        _finish(job, TransactionImportJob.STATUS_FAILED, message='Исходный файл импорта устарел. Загрузите его заново.')
+        return job
+    except Exception as exc:
+        logger.exception('Import job %s failed', job.pk)
+        job.refresh_from_db(fields=['total_rows', 'processed_rows', 'created_count', 'duplicate_count', 'error_count'])
+        _finish(job, TransactionImportJob.STATUS_FAILED, message=f'Неожиданная ошибка: {exc}')
+        return job
+
+    job.refresh_from_db(fields=['total_rows', 'processed_rows'])
+    job.created_count = result['created']
+    job.duplicate_count = result['duplicates']
+    job.error_count = result['error_count']
+    job.errors = result['errors']
+    _finish_session(job, session, result)
+    _finish(job, TransactionImportJob.STATUS_DONE)
+    return job
+
+
+def _finish_session(job, session, result):
+    error_rows = [err.get('row_data') for err in result['errors'] if err.get('row_data')]
+    if not result['error_count']:
+        job.session = None
+        session.delete()
+        return
+    stored, total = len(error_rows), result['error_count']
+    if stored < total and session.metadata.get('source'):
+        # Сохранены не все ошибочные строки: повтор читает исходный файл целиком, пока он
+        # в хранилище, а уже загруженные строки отсеиваются по отпечаткам как дубликаты
+        job.message = (
+            f'Для исправления сохранено {stored} из {total} ошибочных строк. Повторный импорт '
+            'прочитает исходный файл целиком, уже загруженные строки будут пропущены.'
+        )
+        session.sample_rows = error_rows[:10]
+        session.save(update_fields=['sample_rows'])
+    elif error_rows:
+        if stored < total:
+            job.message = f'Для исправления сохранены только первые {stored} из {total} ошибочных строк.'
+        # Повторный импорт работает только с ошибочными строками, исходный файл больше не нужен
+        session.metadata.pop('source', None)
+        session.rows = []
+        session.staged_rows = encode_records(session.columns, error_rows)
+        session.row_count = stored
+        session.sample_rows = error_rows[:10]
+        session.save(update_fields=['rows', 'staged_rows', 'row_count', 'sample_rows', 'metadata'])
+
+
+def _finish(job, status, message=None):
+    job.status = status
+    if message is not None:
+        job.message = message
+    job.finished_at = timezone.now()
+    job.save()
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from transactions.spool import cleanup_expired, get_ttl
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из spool-каталога импорта файлы старше TTL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, default=None, help='TTL в секундах (по умолчанию из настроек).')
+
+    def handle(self, *args, **options):
+        ttl = options['ttl'] if options['ttl'] is not None else get_ttl()
+        removed = cleanup_expired(ttl=ttl)
+        self.stdout.write(self.style.SUCCESS(f'Удалено файлов: {removed}'))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from transactions.jobs import claim_next_job, fail_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает очередь заданий импорта транзакций.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Обработать очередь и завершиться.')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Пауза между опросами пустой очереди, сек.')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            fail_stale_jobs()
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+            self.stdout.write(f'Задание #{job.pk}: {job.original_name}')
+            run_job(job)
+            self.stdout.write(self.style.SUCCESS(
+                f'Задание #{job.pk} [{job.status}]: создано {job.created_count}, ошибок {job.error_count}'
+            ))
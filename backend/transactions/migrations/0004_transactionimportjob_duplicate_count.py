@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0003_transactionimportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transactionimportjob',
+            name='duplicate_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -8,8 +8,59 @@ class TransactionImportSession(models.Model):
     original_name = models.CharField(max_length=255)
     columns = models.JSONField()
     sample_rows = models.JSONField()
-    rows = models.JSONField()
+    # Устаревшее хранение строк списком словарей; новые сессии используют staged_rows
+    rows = models.JSONField(default=list, blank=True)
+    staged_rows = models.BinaryField(blank=True, null=True, editable=False)
+    row_count = models.PositiveIntegerField(default=0)
     metadata = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f"Import {self.original_name} ({self.created_at:%Y-%m-%d %H:%M})"
+
+
+class TransactionImportJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Завершён'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='transaction_import_jobs')
+    session = models.ForeignKey(
+        TransactionImportSession,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='jobs',
+    )
+    original_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    # Снимок формы сопоставления: объекты заменены на id, как в metadata['last_mapping']
+    mapping = models.JSONField(default=dict)
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    duplicate_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"Import job #{self.pk} {self.original_name} [{self.status}]"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
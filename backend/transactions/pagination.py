@@ -0,0 +1,74 @@
+"""Keyset-пагинация списка транзакций по ключу ``(date, id)``.
+
+Курсор — непрозрачная строка (base64 от даты и id строки), от которой
+следующая страница выбирается условием ``(date, id) < (d, i)`` вместо
+``OFFSET``. Поэтому страница N стоит столько же, сколько первая.
+Порядок сортировки совпадает с основным: ``-date, -pk``.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+
+DIRECTION_NEXT = 'next'
+DIRECTION_PREV = 'prev'
+# Верхняя граница bigint: больший id в курсоре не влезет в параметр запроса
+MAX_ID = 2 ** 63 - 1
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(row):
+    payload = json.dumps([row.date.isoformat(), row.pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(value):
+    """``(date, id)`` из курсора; подделанный курсор даёт ``InvalidCursor``, а не ошибку запроса."""
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        date_text, pk = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        date_value = datetime.fromisoformat(date_text)
+    except (ValueError, TypeError, UnicodeError) as exc:
+        raise InvalidCursor('Некорректный курсор страницы') from exc
+    if date_value.tzinfo is None or type(pk) is not int or not 0 < pk <= MAX_ID:
+        raise InvalidCursor('Некорректный курсор страницы')
+    return date_value, pk
+
+
+def seek_page(queryset, cursor, direction, length):
+    """Страница после (``next``) или перед (``prev``) курсором.
+
+    Возвращает ``(rows, next_cursor, prev_cursor)``; курсор равен None, если
+    в этом направлении строк больше нет.
+    """
+    date_value, pk = decode_cursor(cursor)
+    if direction == DIRECTION_PREV:
+        window = queryset.filter(Q(date__gt=date_value) | Q(date=date_value, pk__gt=pk)).order_by('date', 'pk')
+        rows = list(window[:length + 1])
+        has_more = len(rows) > length
+        rows = rows[:length][::-1]
+        next_cursor = encode_cursor(rows[-1]) if rows else cursor
+        prev_cursor = encode_cursor(rows[0]) if rows and has_more else None
+        return rows, next_cursor, prev_cursor
+
+    window = queryset.filter(Q(date__lt=date_value) | Q(date=date_value, pk__lt=pk)).order_by('-date', '-pk')
+    rows = list(window[:length + 1])
+    has_more = len(rows) > length
+    rows = rows[:length]
+    next_cursor = encode_cursor(rows[-1]) if rows and has_more else None
+    prev_cursor = encode_cursor(rows[0]) if rows else cursor
+    return rows, next_cursor, prev_cursor
+
+
+def page_cursors(rows, *, has_previous, has_next):
+    """Курсоры для страницы, полученной обычным OFFSET-запросом."""
+    if not rows:
+        return None, None
+    next_cursor = encode_cursor(rows[-1]) if has_next else None
+    prev_cursor = encode_cursor(rows[0]) if has_previous else None
+    return next_cursor, prev_cursor
@@ -0,0 +1,84 @@
+"""Векторный разбор колонок импорта: даты, суммы и признаки дохода/расхода.
+
+Каждая функция принимает колонку порции целиком (``pandas.Series`` строк)
+и возвращает список значений по позициям. ``None`` означает, что значение
+не удалось разобрать пакетно — такую строку импортёр разбирает построчно,
+чтобы вернуть точное сообщение об ошибке.
+"""
+from datetime import datetime
+from decimal import Decimal
+
+import pandas as pd
+
+
+DATE_PATTERNS = [
+    '%d.%m.%Y %H:%M:%S',
+    '%d.%m.%Y %H:%M',
+    '%d.%m.%Y',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%d',
+]
+DATE_SAMPLE_SIZE = 20
+AMOUNT_TRANSLATION = str.maketrans({' ': None, "'": None, '\xa0': None, ',': '.'})
+AMOUNT_RE = r'^[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?$'
+
+
+def text_column(frame, column):
+    """Колонка порции как Series обрезанных строк; отсутствующая колонка — пустые строки."""
+    if not column or column not in frame.columns:
+        return pd.Series([''] * len(frame.index), index=frame.index, dtype=object)
+    return frame[column].astype(str).str.strip()
+
+
+def detect_date_format(values, sample_size=DATE_SAMPLE_SIZE):
+    """Шаблон из DATE_PATTERNS, которому соответствует больше всего непустых образцов."""
+    samples = [value for value in values if value][:sample_size]
+    best_pattern, best_hits = None, 0
+    for pattern in DATE_PATTERNS:
+        hits = 0
+        for sample in samples:
+            try:
+                datetime.strptime(sample, pattern)
+            except ValueError:
+                continue
+            hits += 1
+        if hits > best_hits:
+            best_pattern, best_hits = pattern, hits
+    return best_pattern
+
+
+def _to_iso_order(values, date_format):
+    """dd.mm.YYYY... → YYYY-mm-dd...: ISO-шаблоны pandas разбирает на порядок быстрее."""
+    if not date_format.startswith('%d.%m.%Y'):
+        return values, date_format
+    dotted = (values.str[2] == '.') & (values.str[5] == '.')
+    reordered = values.str[6:10] + '-' + values.str[3:5] + '-' + values.str[0:2] + values.str[10:]
+    return reordered.where(dotted, ''), '%Y-%m-%d' + date_format[len('%d.%m.%Y'):]
+
+
+def parse_date_column(values, date_format, tz_name):
+    """Разбирает колонку одним шаблоном и локализует в ``tz_name``."""
+    if not date_format:
+        return [None] * len(values)
+    values, date_format = _to_iso_order(values, date_format)
+    parsed = pd.to_datetime(values, format=date_format, errors='coerce')
+    parsed = parsed.dt.tz_localize(tz_name, ambiguous='NaT', nonexistent='NaT')
+    missing = parsed.isna().tolist()
+    converted = parsed.array.to_pydatetime()
+    return [None if is_missing else value for value, is_missing in zip(converted, missing)]
+
+
+def parse_amount_column(values):
+    """Чистит разделители разрядов и десятичную запятую, переводит в Decimal."""
+    cleaned = values.str.translate(AMOUNT_TRANSLATION)
+    valid = cleaned.str.match(AMOUNT_RE).tolist()
+    return [Decimal(text) if ok else None for text, ok in zip(cleaned.tolist(), valid)]
+
+
+def marker_signs(values, income_markers, expense_markers):
+    """+1 для признаков дохода, -1 для расхода, 0 — знак суммы не меняется."""
+    lowered = values.str.lower()
+    income = lowered.isin(income_markers).tolist() if income_markers else [False] * len(values)
+    expense = lowered.isin(expense_markers).tolist() if expense_markers else [False] * len(values)
+    return [1 if is_income else (-1 if is_expense else 0) for is_income, is_expense in zip(income, expense)]
@@ -0,0 +1,138 @@
+"""Серверное хранилище загруженных файлов импорта.
+
+Файл записывается один раз под именем из SHA-256 содержимого, а в сессии
+хранится только короткий токен. Чтение идёт через mmap, без копирования
+файла в память процесса. Устаревшие файлы удаляются по TTL: при каждой
+новой загрузке и командой ``cleanup_import_spool``.
+"""
+import hashlib
+import io
+import mmap
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+DEFAULT_TTL = 6 * 60 * 60
+TOKEN_RE = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]{1,8})?$')
+
+
+class SpoolMissingError(Exception):
+    """Raised when a spooled file is unknown or has expired."""
+
+
+class _MappedFile(io.RawIOBase):
+    """Файловый интерфейс поверх mmap: нужен zipfile/openpyxl и pandas."""
+
+    def __init__(self, mapped):
+        super().__init__()
+        self._mapped = mapped
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self._mapped.read()
+        return self._mapped.read(size)
+
+    def readinto(self, buffer):
+        data = self._mapped.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._mapped.seek(offset, whence)
+        return self._mapped.tell()
+
+    def tell(self):
+        return self._mapped.tell()
+
+
+def get_spool_dir():
+    return str(getattr(settings, 'TRANSACTION_IMPORT_SPOOL_DIR', os.path.join(settings.BASE_DIR, 'var', 'import_spool')))
+
+
+def get_ttl():
+    return int(getattr(settings, 'TRANSACTION_IMPORT_SPOOL_TTL', DEFAULT_TTL))
+
+
+def spool_upload(uploaded_file):
+    """Сохраняет загрузку в хранилище и возвращает токен вида ``<sha256><расширение>``."""
+    spool_dir = get_spool_dir()
+    os.makedirs(spool_dir, exist_ok=True)
+    cleanup_expired()
+
+    _, extension = os.path.splitext(getattr(uploaded_file, 'name', '') or '')
+    extension = extension.lower() if re.match(r'^\.[a-z0-9]{1,8}$', extension.lower()) else ''
+    digest = hashlib.sha256()
+    handle, temp_path = tempfile.mkstemp(dir=spool_dir, suffix='.part')
+    try:
+        with os.fdopen(handle, 'wb') as target:
+            for part in uploaded_file.chunks():
+                digest.update(part)
+                target.write(part)
+        token = f'{digest.hexdigest()}{extension}'
+        final_path = os.path.join(spool_dir, token)
+        if os.path.exists(final_path):
+            os.remove(temp_path)
+            os.utime(final_path)
+        else:
+            os.replace(temp_path, final_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return token
+
+
+def spool_path(token):
+    if not token or not TOKEN_RE.match(token):
+        raise SpoolMissingError('Некорректный токен файла')
+    path = os.path.join(get_spool_dir(), token)
+    if not os.path.exists(path):
+        raise SpoolMissingError('Файл импорта не найден или устарел')
+    return path
+
+
+@contextmanager
+def open_spooled(token):
+    """Открывает файл из хранилища через mmap, без копирования в память процесса."""
+    path = spool_path(token)
+    # Обращение продлевает жизнь файла
+    os.utime(path)
+    with open(path, 'rb') as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            yield handle
+            return
+        mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield _MappedFile(mapped)
+        finally:
+            mapped.close()
+
+
+def cleanup_expired(ttl=None, now=None):
+    """Удаляет файлы старше TTL и возвращает их количество."""
+    ttl = get_ttl() if ttl is None else ttl
+    now = time.time() if now is None else now
+    spool_dir = get_spool_dir()
+    if not os.path.isdir(spool_dir):
+        return 0
+    removed = 0
+    for name in os.listdir(spool_dir):
+        path = os.path.join(spool_dir, name)
+        try:
+            if now - os.path.getmtime(path) > ttl:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
@@ -0,0 +1,95 @@
+"""Компактное хранение разобранных строк импорта.
+
+Строки хранятся по колонкам: каждая колонка — отдельный JSON-массив строк,
+сжатый zlib. Заголовок с именами колонок и смещениями лежит в начале блоба,
+поэтому для чтения одной колонки распаковывается только она.
+
+Формат блоба::
+
+    MAGIC | uint32 длина заголовка | JSON-заголовок | сжатые колонки
+"""
+import json
+import struct
+import zlib
+
+import pandas as pd
+
+
+MAGIC = b'FFC1'
+_HEADER_SIZE = struct.Struct('>I')
+
+
+class StagingFormatError(Exception):
+    """Raised when a staged blob cannot be decoded."""
+
+
+def encode_frame(frame):
+    """Упаковывает нормализованный DataFrame (все ячейки — str) в блоб."""
+    columns = [str(column) for column in frame.columns]
+    return _encode(columns, [frame[column].tolist() for column in frame.columns], len(frame.index))
+
+
+def encode_records(columns, records):
+    """Упаковывает список словарей (например, строки с ошибками) в блоб."""
+    values = [[_cell(record.get(column)) for record in records] for column in columns]
+    return _encode(list(columns), values, len(records))
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    return value if isinstance(value, str) else str(value)
+
+
+def _encode(columns, column_values, row_count):
+    offsets = []
+    blobs = []
+    position = 0
+    for values in column_values:
+        blob = zlib.compress(json.dumps(values, ensure_ascii=False).encode('utf-8'), 6)
+        offsets.append([position, len(blob)])
+        blobs.append(blob)
+        position += len(blob)
+    header = json.dumps({'columns': columns, 'rows': row_count, 'offsets': offsets}, ensure_ascii=False).encode('utf-8')
+    return b''.join([MAGIC, _HEADER_SIZE.pack(len(header)), header] + blobs)
+
+
+class StagedRows:
+    """Чтение блоба по колонкам без построения словаря на каждую строку."""
+
+    def __init__(self, blob):
+        blob = bytes(blob or b'')
+        if blob[:len(MAGIC)] != MAGIC:
+            raise StagingFormatError('Неизвестный формат сохранённых строк')
+        header_start = len(MAGIC) + _HEADER_SIZE.size
+        (header_length,) = _HEADER_SIZE.unpack_from(blob, len(MAGIC))
+        header = json.loads(blob[header_start:header_start + header_length].decode('utf-8'))
+        self._blob = blob
+        self._data_start = header_start + header_length
+        self._offsets = dict(zip(header['columns'], header['offsets']))
+        self._cache = {}
+        self.columns = header['columns']
+        self.row_count = header['rows']
+
+    def __len__(self):
+        return self.row_count
+
+    def column(self, name):
+        if name not in self._cache:
+            offset = self._offsets.get(name)
+            if offset is None:
+                self._cache[name] = [''] * self.row_count
+            else:
+                start = self._data_start + offset[0]
+                raw = zlib.decompress(self._blob[start:start + offset[1]])
+                self._cache[name] = json.loads(raw.decode('utf-8'))
+        return self._cache[name]
+
+    def iter_frames(self, chunk_size):
+        """Порции строк в виде DataFrame, собранные из срезов колонок."""
+        data = {name: self.column(name) for name in self.columns}
+        for offset in range(0, self.row_count, chunk_size):
+            yield pd.DataFrame(
+                {name: values[offset:offset + chunk_size] for name, values in data.items()},
+                columns=self.columns,
+            )
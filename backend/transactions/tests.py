@@ -1,3 +1,954 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+import pandas as pd
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import (
+    Account, Category, DailyRollup, ExpenseLink, Project, Subcategory, Transaction, TransactionRow,
+)
+from core.rollups import rollup_mismatches
+from .export import CONTENT_TYPES, EXPORT_HEADERS
+from .importer import SAMPLE_ROWS_LIMIT, TransactionImporter, read_preview
+from .jobs import claim_next_job, enqueue_import, run_job
+from .models import TransactionImportJob, TransactionImportSession
+from .pagination import encode_cursor
+from .parsing import detect_date_format, marker_signs, parse_amount_column, parse_date_column
+from .spool import open_spooled, spool_upload
+from .staging import StagedRows, StagingFormatError, encode_frame, encode_records
+from .workbook import Workbook
+
+
+class StagingTests(SimpleTestCase):
+    def test_frame_round_trip(self):
+        frame = pd.DataFrame({
+            'Дата': ['01.02.2024', '02.02.2024', ''],
+            'Сумма': ['1\xa0000,50', '-12', '7'],
+            'Комментарий': ['кофе', '', 'такси "Ё"'],
+        })
+        staged = StagedRows(encode_frame(frame))
+        self.assertEqual(staged.columns, ['Дата', 'Сумма', 'Комментарий'])
+        self.assertEqual(len(staged), 3)
+        for column in frame.columns:
+            self.assertEqual(staged.column(column), frame[column].tolist())
+
+    def test_chunks_restore_frame(self):
+        frame = pd.DataFrame({'a': [str(value) for value in range(7)], 'b': ['x'] * 7})
+        chunks = list(StagedRows(encode_frame(frame)).iter_frames(3))
+        self.assertEqual([len(chunk.index) for chunk in chunks], [3, 3, 1])
+        restored = pd.concat(chunks, ignore_index=True)
+        pd.testing.assert_frame_equal(restored, frame)
+
+    def test_records_round_trip(self):
+        records = [{'row': 3, 'message': 'Ошибка'}, {'row': 9, 'message': None}]
+        staged = StagedRows(encode_records(['row', 'message'], records))
+        self.assertEqual(staged.column('row'), ['3', '9'])
+        self.assertEqual(staged.column('message'), ['Ошибка', ''])
+
+    def test_unknown_column_is_empty(self):
+        staged = StagedRows(encode_frame(pd.DataFrame({'a': ['1', '2']})))
+        self.assertEqual(staged.column('нет'), ['', ''])
+
+    def test_empty_frame(self):
+        staged = StagedRows(encode_frame(pd.DataFrame({'a': []}, dtype=object)))
+        self.assertEqual(len(staged), 0)
+        self.assertEqual(list(staged.iter_frames(10)), [])
+
+    def test_foreign_blob_is_rejected(self):
+        with self.assertRaises(StagingFormatError):
+            StagedRows(b'{"rows": []}')
+
+
+class ParsingTests(SimpleTestCase):
+    def test_detect_date_format(self):
+        cases = [
+            (['31.01.2024', '01.02.2024'], '%d.%m.%Y'),
+            (['31.01.2024 10:15', ''], '%d.%m.%Y %H:%M'),
+            (['31.01.2024 10:15:30'], '%d.%m.%Y %H:%M:%S'),
+            (['2024-01-31'], '%Y-%m-%d'),
+            (['2024-01-31 10:15:30', 'мусор'], '%Y-%m-%d %H:%M:%S'),
+            (['мусор', ''], None),
+        ]
+        for values, expected in cases:
+            with self.subTest(values=values):
+                self.assertEqual(detect_date_format(values), expected)
+
+    def test_parse_date_column(self):
+        cases = [
+            ('31.01.2024', '%d.%m.%Y', datetime(2024, 1, 31)),
+            ('31.01.2024 10:15', '%d.%m.%Y %H:%M', datetime(2024, 1, 31, 10, 15)),
+            ('2024-01-31 10:15:30', '%Y-%m-%d %H:%M:%S', datetime(2024, 1, 31, 10, 15, 30)),
+            ('31.02.2024', '%d.%m.%Y', None),
+            ('2024-01-31', '%d.%m.%Y', None),
+        ]
+        for text, date_format, expected in cases:
+            with self.subTest(text=text):
+                (parsed,) = parse_date_column(pd.Series([text]), date_format, 'Europe/Moscow')
+                if expected is None:
+                    self.assertIsNone(parsed)
+                else:
+                    self.assertEqual(parsed.replace(tzinfo=None), expected)
+                    self.assertEqual(str(parsed.tzinfo), 'Europe/Moscow')
+
+    def test_parse_amount_column(self):
+        cases = [
+            ('1234.5', Decimal('1234.5')),
+            ('1234,50', Decimal('1234.50')),
+            ('-12,3', Decimal('-12.3')),
+            ('+7', Decimal('7')),
+            ('1\xa0234\xa0567,89', Decimal('1234567.89')),
+            ('1 234,5', Decimal('1234.5')),
+            ("1'234.5", Decimal('1234.5')),
+            (',5', Decimal('0.5')),
+            ('1e3', Decimal('1E+3')),
+            ('', None),
+            ('12 руб', None),
+            ('1,234.5', None),
+        ]
+        amounts = parse_amount_column(pd.Series([text for text, _ in cases]))
+        for (text, expected), amount in zip(cases, amounts):
+            with self.subTest(text=text):
+                self.assertEqual(amount, expected)
+
+    def test_marker_signs(self):
+        values = pd.Series(['Доход', 'РАСХОД', 'перевод', '', 'зачисление'])
+        signs = marker_signs(values, {'доход', 'зачисление'}, {'расход'})
+        self.assertEqual(signs, [1, -1, 0, 0, 1])
+        self.assertEqual(marker_signs(values, set(), set()), [0] * 5)
+
+
+
+def xlsx_bytes(sheets):
+    """Книга xlsx из ``{лист: [строки]}``, собранная openpyxl."""
+    from openpyxl import Workbook as OpenpyxlWorkbook
+
+    book = OpenpyxlWorkbook()
+    book.remove(book.active)
+    for title, rows in sheets.items():
+        sheet = book.create_sheet(title)
+        for row in rows:
+            sheet.append(row)
+    buffer = BytesIO()
+    book.save(buffer)
+    return buffer.getvalue()
+
+
+def openpyxl_workbook(content, original_name='statement.xlsx'):
+    """``Workbook`` на openpyxl: calamine — необязательная зависимость."""
+    with mock.patch('transactions.workbook.python_calamine', None):
+        return Workbook(BytesIO(content), original_name)
+
+
+class WorkbookTests(SimpleTestCase):
+    content = xlsx_bytes({
+        'Выписка': [
+            ['Дата', 'Сумма', None, 'Сумма'],
+            [datetime(2024, 2, 1, 10, 30), -100.0, None, 2.5],
+            ['02.02.2024', 15, 'лишнее', None, 'за шириной'],
+        ],
+        'Итоги': [['Месяц', 'Итого'], ['Февраль', -85]],
+    })
+
+    def test_sheet_names_and_header(self):
+        with openpyxl_workbook(self.content) as workbook:
+            self.assertEqual(workbook.engine, 'openpyxl')
+            self.assertEqual(workbook.sheet_names, ['Выписка', 'Итоги'])
+            self.assertEqual(workbook.header(), ['Дата', 'Сумма', 'Unnamed: 2', 'Сумма.1'])
+            self.assertEqual(workbook.header('Итоги'), ['Месяц', 'Итого'])
+
+    def test_header_reads_only_first_row(self):
+        with openpyxl_workbook(self.content) as workbook:
+            with mock.patch.object(workbook, '_raw_rows', wraps=workbook._raw_rows) as raw_rows:
+                workbook.header('Выписка')
+            raw_rows.assert_called_once_with('Выписка', limit=1)
+            self.assertEqual(len(list(workbook._raw_rows('Выписка', limit=1))), 1)
+
+    def test_rows_of_selected_sheet(self):
+        with openpyxl_workbook(self.content) as workbook:
+            columns, rows = workbook.iter_rows('Выписка')
+            self.assertEqual(columns, ['Дата', 'Сумма', 'Unnamed: 2', 'Сумма.1'])
+            self.assertEqual(list(rows), [
+                ['2024-02-01 10:30:00', '-100', '', '2.5'],
+                ['02.02.2024', '15', 'лишнее', ''],
+            ])
+            columns, rows = workbook.iter_rows('Итоги')
+            self.assertEqual((columns, list(rows)), (['Месяц', 'Итого'], [['Февраль', '-85']]))
+            self.assertEqual(workbook.row_count('Выписка'), 2)
+
+    def test_unknown_sheet(self):
+        with openpyxl_workbook(self.content) as workbook:
+            with self.assertRaises(KeyError):
+                workbook.header('Нет такого')
+
+
+
+class PreviewTests(SimpleTestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.spool_dir.cleanup)
+        settings_override = override_settings(TRANSACTION_IMPORT_SPOOL_DIR=self.spool_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_csv_preview_is_limited(self):
+        lines = ['Дата;Сумма;Комментарий'] + [f'01.02.2024;-{index};строка {index}' for index in range(50)]
+        preview = read_preview(BytesIO('\n'.join(lines).encode('utf-8')), 'statement.csv')
+        self.assertEqual(preview['columns'], ['Дата', 'Сумма', 'Комментарий'])
+        self.assertEqual(len(preview['sample_rows']), SAMPLE_ROWS_LIMIT)
+        self.assertEqual(preview['sample_rows'][0], {'Дата': '01.02.2024', 'Сумма': '-0', 'Комментарий': 'строка 0'})
+
+    def test_excel_preview_of_selected_sheet(self):
+        content = xlsx_bytes({
+            'Итоги': [['Месяц', 'Итого'], ['Февраль', -435]],
+            'Выписка': [['Дата', 'Сумма']] + [['01.02.2024', -index] for index in range(1, 30)],
+        })
+        preview = read_preview(openpyxl_workbook(content), 'statement.xlsx', sheet_name='Выписка')
+        self.assertEqual(preview['columns'], ['Дата', 'Сумма'])
+        self.assertEqual(len(preview['sample_rows']), SAMPLE_ROWS_LIMIT)
+        self.assertEqual(preview['sample_rows'][-1], {'Дата': '01.02.2024', 'Сумма': str(-SAMPLE_ROWS_LIMIT)})
+        totals = read_preview(openpyxl_workbook(content), 'statement.xlsx', sheet_name='Итоги')
+        self.assertEqual(totals['columns'], ['Месяц', 'Итого'])
+        self.assertEqual(totals['sample_rows'], [{'Месяц': 'Февраль', 'Итого': '-435'}])
+
+    def test_spooled_preview_reads_only_file_head(self):
+        lines = ['Дата;Сумма;Комментарий'] + [f'01.02.2024;-{index};{"х" * 40}' for index in range(100000)]
+        content = '\n'.join(lines).encode('utf-8')
+        token = spool_upload(SimpleUploadedFile('statement.csv', content))
+        with open_spooled(token) as stream:
+            preview = read_preview(stream, 'statement.csv')
+            consumed = stream.tell()
+        self.assertEqual(len(preview['sample_rows']), SAMPLE_ROWS_LIMIT)
+        self.assertLess(consumed, len(content) // 10)
+
+
+class ImportErrorRowsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('parser')
+        self.account = Account.objects.create(user=self.user, name='Карта')
+        self.project = Project.objects.create(user=self.user, name='Дом')
+
+    def test_bad_cells_report_file_row_numbers(self):
+        cleaned = {
+            'column_date': 'Дата',
+            'column_amount': 'Сумма',
+            'column_category': 'Категория',
+            'default_account': self.account,
+            'default_project': self.project,
+        }
+        chunks = [
+            pd.DataFrame({
+                'Дата': ['01.02.2024', '31.02.2024', '03.02.2024'],
+                'Сумма': ['-100', '-5', '-1\xa0000,50'],
+                'Категория': ['Еда', 'Еда', 'Еда'],
+            }),
+            pd.DataFrame({
+                'Дата': ['04.02.2024', '', '06.02.2024'],
+                'Сумма': ['12 руб', '-3', '7,5'],
+                'Категория': ['Еда', 'Еда', ''],
+            }),
+            pd.DataFrame({
+                'Дата': ['07.02.2024', '08.02.2024', '09.02.2024'],
+                'Сумма': ['NaN', '-Infinity', '1e20'],
+                'Категория': ['Еда', 'Еда', 'Еда'],
+            }),
+        ]
+        result = TransactionImporter(self.user, cleaned).run(chunks)
+        self.assertEqual(result['created'], 2)
+        self.assertEqual(result['error_count'], 7)
+        self.assertEqual([error['row'] for error in result['errors']], [2, 4, 5, 6, 7, 8, 9])
+        self.assertIn('31.02.2024', result['errors'][0]['message'])
+        self.assertIn('12 руб', result['errors'][1]['message'])
+        self.assertEqual(result['errors'][2]['message'], 'Не указана дата')
+        self.assertEqual(result['errors'][3]['message'], 'Не удалось определить категорию')
+        self.assertEqual(
+            [error['message'] for error in result['errors'][4:]],
+            ["Недопустимая сумма 'NaN'", "Недопустимая сумма '-Infinity'", "Недопустимая сумма '1e20'"],
+        )
+        amounts = sorted(Transaction.objects.filter(account=self.account).values_list('amount', flat=True))
+        self.assertEqual(amounts, [Decimal('-1000.50'), Decimal('-100.00')])
+
+
+def run_import(user, rows, **options):
+    """Импорт строк ``rows`` (словари колонка → текст) одной порцией."""
+    cleaned = {
+        'column_date': 'Дата',
+        'column_amount': 'Сумма',
+        'column_account': 'Счёт',
+        'column_project': 'Проект',
+        'column_category': 'Категория',
+        'column_subcategory': 'Подкатегория',
+        'column_comment': 'Комментарий',
+    }
+    cleaned.update(options)
+    frame = pd.DataFrame(rows, dtype=object).fillna('')
+    return TransactionImporter(user, cleaned).run([frame])
+
+
+class DimensionResolutionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dimensions')
+
+    def test_cyrillic_names_imported_twice(self):
+        row = {
+            'Дата': '01.02.2024',
+            'Сумма': '-100',
+            'Счёт': 'Карта Сбер',
+            'Проект': 'Дом',
+            'Категория': 'Продукты',
+            'Подкатегория': 'Овощи',
+        }
+        run_import(self.user, [row])
+        result = run_import(self.user, [
+            dict(row, Сумма='-200'),
+            dict(row, Сумма='-300', Счёт='КАРТА СБЕР', Проект='дом'),
+        ])
+        self.assertEqual(result['created'], 2)
+        self.assertEqual(list(Account.objects.filter(user=self.user).values_list('name', flat=True)), ['Карта Сбер'])
+        self.assertEqual(list(Project.objects.filter(user=self.user).values_list('name', flat=True)), ['Дом'])
+        self.assertEqual(Category.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(Subcategory.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(ExpenseLink.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(Transaction.objects.filter(account__user=self.user).count(), 3)
+
+    def test_category_names_match_exactly(self):
+        run_import(self.user, [
+            {'Дата': '01.02.2024', 'Сумма': '-1', 'Счёт': 'Наличные', 'Проект': 'Дом', 'Категория': 'Кафе'},
+            {'Дата': '01.02.2024', 'Сумма': '-2', 'Счёт': 'Наличные', 'Проект': 'Дом', 'Категория': 'кафе'},
+        ])
+        names = Category.objects.filter(user=self.user).order_by('name').values_list('name', flat=True)
+        self.assertEqual(list(names), ['Кафе', 'кафе'])
+
+    def test_default_account_fills_only_empty_cells(self):
+        default_account = Account.objects.create(user=self.user, name='Основной')
+        default_project = Project.objects.create(user=self.user, name='Общее')
+        row = {'Дата': '01.02.2024', 'Счёт': '', 'Проект': '', 'Категория': 'Еда'}
+        result = run_import(
+            self.user,
+            [
+                dict(row, Сумма='-1', Счёт='Карта', Проект='Дом'),
+                dict(row, Сумма='-2', Счёт='Наличные'),
+                dict(row, Сумма='-3'),
+            ],
+            default_account=default_account,
+            default_project=default_project,
+            default_account_name='Основной',
+        )
+        self.assertEqual(result['created'], 3)
+        placed = Transaction.objects.filter(account__user=self.user).order_by('-amount').values_list(
+            'account__name', 'expense_link__project__name'
+        )
+        self.assertEqual(list(placed), [('Карта', 'Дом'), ('Наличные', 'Общее'), ('Основной', 'Общее')])
+
+
+@override_settings(TRANSACTION_IMPORT_CHUNK_SIZE=2)
+class ImportJobTests(TestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.spool_dir.cleanup)
+        settings_override = override_settings(TRANSACTION_IMPORT_SPOOL_DIR=self.spool_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('jobs')
+
+    def spooled_session(self, lines):
+        content = '\n'.join(['Дата;Сумма;Счёт;Проект;Категория'] + lines) + '\n'
+        token = spool_upload(SimpleUploadedFile('statement.csv', content.encode('utf-8')))
+        return TransactionImportSession.objects.create(
+            user=self.user,
+            original_name='statement.csv',
+            columns=['Дата', 'Сумма', 'Счёт', 'Проект', 'Категория'],
+            sample_rows=[],
+            metadata={'source': {'token': token, 'original_name': 'statement.csv'}},
+        )
+
+    def run_session(self, session):
+        enqueue_import(self.user, session, {
+            'column_date': 'Дата',
+            'column_amount': 'Сумма',
+            'column_account': 'Счёт',
+            'column_project': 'Проект',
+            'column_category': 'Категория',
+        })
+        return run_job(claim_next_job())
+
+    def test_worker_sets_total_rows_for_spooled_file(self):
+        session = self.spooled_session([f'0{day}.02.2024;-{day};Карта;Дом;Еда' for day in range(1, 6)])
+        job = self.run_session(session)
+        self.assertEqual(job.status, TransactionImportJob.STATUS_DONE)
+        self.assertEqual((job.total_rows, job.processed_rows, job.created_count), (5, 5, 5))
+        job.refresh_from_db()
+        self.assertEqual(job.total_rows, 5)
+
+    @override_settings(TRANSACTION_IMPORT_MAX_STORED_ERRORS=2)
+    def test_truncated_errors_keep_source_file(self):
+        lines = [
+            '01.02.2024;-1;Карта;Дом;Еда',
+            '31.02.2024;-2;Карта;Дом;Еда',
+            '30.02.2024;-3;Карта;Дом;Еда',
+            '02.02.2024;-4;Карта;Дом;Еда',
+            '32.02.2024;-5;Карта;Дом;Еда',
+        ]
+        session = self.spooled_session(lines)
+        job = self.run_session(session)
+        self.assertEqual((job.created_count, job.error_count, len(job.errors)), (2, 3, 2))
+        self.assertIn('2 из 3', job.message)
+        session.refresh_from_db()
+        self.assertIn('source', session.metadata)
+        self.assertIsNone(session.staged_rows)
+
+        retry = self.run_session(session)
+        self.assertEqual((retry.created_count, retry.duplicate_count, retry.error_count), (0, 2, 3))
+
+    def test_error_rows_are_staged_for_retry(self):
+        session = self.spooled_session(['01.02.2024;-1;Карта;Дом;Еда', '31.02.2024;-2;Карта;Дом;Еда'])
+        job = self.run_session(session)
+        self.assertEqual((job.created_count, job.error_count, job.message), (1, 1, ''))
+        session.refresh_from_db()
+        self.assertNotIn('source', session.metadata)
+        self.assertEqual(session.row_count, 1)
+        self.assertEqual(StagedRows(session.staged_rows).column('Дата'), ['31.02.2024'])
+
+
+class DuplicateImportTests(TestCase):
+    rows = [
+        {'Дата': '01.02.2024 10:00', 'Сумма': '-100', 'Счёт': 'Карта', 'Проект': 'Дом', 'Категория': 'Еда'},
+        {'Дата': '01.02.2024 10:00', 'Сумма': '-100', 'Счёт': 'Карта', 'Проект': 'Дом', 'Категория': 'Еда'},
+        {'Дата': '01.02.2024 10:00', 'Сумма': '-100', 'Счёт': 'Карта', 'Проект': 'Дом', 'Категория': 'Еда'},
+        {'Дата': '02.02.2024 11:00', 'Сумма': '-250', 'Счёт': 'Карта', 'Проект': 'Дом', 'Категория': 'Еда'},
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create_user('duplicates')
+
+    def fingerprints(self):
+        return set(Transaction.objects.filter(account__user=self.user).values_list('fingerprint', flat=True))
+
+    def test_identical_rows_in_one_file_are_kept(self):
+        result = run_import(self.user, self.rows)
+        self.assertEqual((result['created'], result['duplicates']), (4, 0))
+        self.assertEqual(len(self.fingerprints()), 4)
+
+    def test_reimport_creates_nothing(self):
+        run_import(self.user, self.rows)
+        before = self.fingerprints()
+        result = run_import(self.user, self.rows)
+        self.assertEqual((result['created'], result['duplicates'], result['error_count']), (0, 4, 0))
+        self.assertEqual(self.fingerprints(), before)
+
+    def test_overlapping_file_adds_only_new_rows(self):
+        run_import(self.user, self.rows[:2])
+        result = run_import(self.user, self.rows)
+        self.assertEqual((result['created'], result['duplicates']), (2, 2))
+
+    def test_changed_rows_are_new(self):
+        run_import(self.user, self.rows[:1])
+        changed = [
+            dict(self.rows[0], Сумма='-100,01'),
+            dict(self.rows[0], Дата='01.02.2024 10:01'),
+            dict(self.rows[0], Счёт='Наличные'),
+        ]
+        result = run_import(self.user, changed)
+        self.assertEqual((result['created'], result['duplicates']), (3, 0))
+        self.assertEqual(len(self.fingerprints()), 4)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('pages')
+        self.client.force_login(self.user)
+        self.card = Account.objects.create(user=self.user, name='Карта')
+        self.cash = Account.objects.create(user=self.user, name='Наличные')
+        project = Project.objects.create(user=self.user, name='Дом')
+        category = Category.objects.create(user=self.user, name='Еда')
+        self.link = ExpenseLink.objects.create(user=self.user, project=project, category=category)
+        tz = timezone.get_current_timezone()
+        # По три операции в одну и ту же секунду: порядок внутри решает id
+        moments = [datetime(2024, 2, day, 12, 0) for day in (1, 1, 1, 2, 3, 3, 3, 4)]
+        self.transactions = [
+            Transaction.objects.create(
+                account=self.cash if index % 3 == 0 else self.card,
+                expense_link=self.link,
+                amount=Decimal(-(index + 1)),
+                date=timezone.make_aware(moment, tz),
+                transaction_type='expense',
+            )
+            for index, moment in enumerate(moments)
+        ]
+
+    def expected_ids(self, account=None):
+        items = [item for item in self.transactions if account is None or item.account_id == account.pk]
+        return [item.pk for item in sorted(items, key=lambda item: (item.date, item.pk), reverse=True)]
+
+    def page(self, **params):
+        response = self.client.get(reverse('transactions:data'), {'length': 3, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def walk_forward(self, **params):
+        page = self.page(**params)
+        ids, cursors = [row['id'] for row in page['data']], []
+        while page['next_cursor']:
+            cursors.append(page['next_cursor'])
+            page = self.page(cursor=page['next_cursor'], **params)
+            ids.extend(row['id'] for row in page['data'])
+        return ids, page, cursors
+
+    def test_pages_follow_date_ties_by_id(self):
+        ids, last_page, cursors = self.walk_forward()
+        self.assertEqual(ids, self.expected_ids())
+        self.assertEqual(len(cursors), 2)
+        self.assertEqual(len(last_page['data']), 2)
+        self.assertIsNone(last_page['next_cursor'])
+        self.assertIsNotNone(last_page['prev_cursor'])
+
+    def test_previous_pages_mirror_next_pages(self):
+        _, last_page, _ = self.walk_forward()
+        expected = self.expected_ids()
+        previous = self.page(cursor=last_page['prev_cursor'], direction='prev')
+        self.assertEqual([row['id'] for row in previous['data']], expected[3:6])
+        first = self.page(cursor=previous['prev_cursor'], direction='prev')
+        self.assertEqual([row['id'] for row in first['data']], expected[:3])
+        self.assertIsNone(first['prev_cursor'])
+
+    def test_page_after_last_row_is_empty(self):
+        last = Transaction.objects.get(pk=self.expected_ids()[-1])
+        page = self.page(cursor=encode_cursor(last))
+        self.assertEqual(page['data'], [])
+        self.assertIsNone(page['next_cursor'])
+
+    def test_cursor_with_filters(self):
+        params = {'account_id': self.card.pk}
+        ids, _, cursors = self.walk_forward(**params)
+        self.assertEqual(ids, self.expected_ids(self.card))
+        self.assertEqual(len(cursors), 1)
+        page = self.page(cursor=cursors[0], **params)
+        self.assertTrue(all(row['account_id'] == self.card.pk for row in page['data']))
+
+    def test_invalid_cursor_is_rejected(self):
+        def raw(value):
+            return base64.urlsafe_b64encode(value.encode('utf-8')).decode('ascii')
+
+        for cursor in [
+            'не-курсор',
+            '%%%',
+            raw('{"date": 1}'),
+            raw('["2024-02-01T12:00:00+03:00"]'),
+            raw('["вчера", 1]'),
+            raw('["2024-02-01T12:00:00+03:00", "id"]'),
+            raw('["2024-02-01T12:00:00+03:00", 1e400]'),
+            raw('["2024-02-01T12:00:00+03:00", 100000000000000000000000000]'),
+            raw('["2024-02-01T12:00:00", 1]'),
+        ]:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('transactions:data'), {'length': 3, 'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('search')
+        self.client.force_login(self.user)
+        self.account = Account.objects.create(user=self.user, name='Карта')
+        project = Project.objects.create(user=self.user, name='Дом')
+        self.category = Category.objects.create(user=self.user, name='Еда')
+        link = ExpenseLink.objects.create(user=self.user, project=project, category=self.category)
+        self.transaction = Transaction.objects.create(
+            account=self.account,
+            expense_link=link,
+            amount=Decimal('-10'),
+            date=timezone.now(),
+            transaction_type='expense',
+        )
+
+    def found(self, query):
+        response = self.client.get(reverse('transactions:data'), {'search_query': query})
+        return [row['id'] for row in response.json()['data']]
+
+    def test_rename_keeps_documents_lowercase(self):
+        self.category.name = 'КАФЕ Пушкин'
+        self.category.save()
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.search_document, 'карта дом кафе пушкин  ')
+        row = TransactionRow.objects.get(transaction=self.transaction)
+        self.assertEqual(row.search_document, self.transaction.search_document)
+        self.assertEqual(self.found('Кафе ПУШКИН'), [self.transaction.pk])
+        self.assertEqual(self.found('еда'), [])
+
+    def test_batch_comment_is_searchable(self):
+        response = self.client.post(
+            reverse('transactions:batch'),
+            json.dumps({'ids': [self.transaction.pk], 'action': 'update', 'patch': {'comment': 'ПОДАРОК Маме'}}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.found('подарок мам'), [self.transaction.pk])
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('batch')
+        self.client.force_login(self.user)
+        self.account = Account.objects.create(user=self.user, name='Карта')
+        self.project = Project.objects.create(user=self.user, name='Дом')
+        self.food = Category.objects.create(user=self.user, name='Еда')
+        self.cafe = Category.objects.create(user=self.user, name='Кафе')
+        link = ExpenseLink.objects.create(user=self.user, project=self.project, category=self.food)
+        self.transactions = [
+            Transaction.objects.create(
+                account=self.account,
+                expense_link=link,
+                amount=Decimal(-amount),
+                date=timezone.now(),
+                transaction_type='expense',
+            )
+            for amount in (10, 20)
+        ]
+        self.ids = [item.pk for item in self.transactions]
+
+    def batch(self, payload):
+        return self.client.post(reverse('transactions:batch'), json.dumps(payload), content_type='application/json')
+
+    def test_prefers_active_link(self):
+        ExpenseLink.objects.create(user=self.user, project=self.project, category=self.cafe, status='archived')
+        active = ExpenseLink.objects.create(user=self.user, project=self.project, category=self.cafe)
+        response = self.batch({'ids': self.ids, 'action': 'update', 'patch': {'category_id': self.cafe.pk}})
+        self.assertEqual(response.status_code, 200)
+        links = set(Transaction.objects.filter(pk__in=self.ids).values_list('expense_link_id', flat=True))
+        self.assertEqual(links, {active.pk})
+
+    def test_rejects_foreign_and_inactive_dimensions(self):
+        other = User.objects.create_user('batch-other')
+        foreign_account = Account.objects.create(user=other, name='Чужой')
+        archived_category = Category.objects.create(user=self.user, name='Старое', status='archived')
+        cases = [
+            ({'account_id': foreign_account.pk}, 'account'),
+            ({'category_id': archived_category.pk}, 'category'),
+            ({'project_id': 'abc'}, 'project'),
+            ({'subcategory_id': 10 ** 6}, 'subcategory'),
+        ]
+        for patch, field in cases:
+            with self.subTest(patch=patch):
+                response = self.batch({'ids': self.ids, 'action': 'update', 'patch': patch})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.json()['errors'])
+        self.assertEqual(
+            set(Transaction.objects.filter(pk__in=self.ids).values_list('account_id', flat=True)),
+            {self.account.pk},
+        )
+
+    def test_rejects_other_users_transactions(self):
+        other = User.objects.create_user('batch-owner')
+        account = Account.objects.create(user=other, name='Карта')
+        link = ExpenseLink.objects.create(
+            user=other,
+            project=Project.objects.create(user=other, name='Дом'),
+            category=Category.objects.create(user=other, name='Еда'),
+        )
+        foreign = Transaction.objects.create(
+            account=account, expense_link=link, amount=Decimal('-5'), date=timezone.now(), transaction_type='expense',
+        )
+        for action, patch in (('update', {'comment': 'чужое'}), ('delete', None)):
+            with self.subTest(action=action):
+                response = self.batch({'ids': self.ids + [foreign.pk], 'action': action, 'patch': patch})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('ids', response.json()['errors'])
+        foreign.refresh_from_db()
+        self.assertIsNone(foreign.comment)
+        self.assertEqual(Transaction.objects.filter(pk__in=self.ids).count(), 2)
+
+    def test_update_returns_rows(self):
+        response = self.batch({
+            'ids': self.ids,
+            'action': 'update',
+            'patch': {'category_id': self.cafe.pk, 'comment': 'Обед'},
+        })
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload['updated'], 2)
+        self.assertEqual(sorted(row['id'] for row in payload['rows']), sorted(self.ids))
+        for row in payload['rows']:
+            self.assertEqual((row['category'], row['category_id'], row['comment']), ('Кафе', self.cafe.pk, 'Обед'))
+
+    def test_delete(self):
+        response = self.batch({'ids': self.ids[:1], 'action': 'delete'})
+        self.assertEqual(response.json(), {'success': True, 'deleted': 1})
+        self.assertEqual(list(TransactionRow.objects.filter(user=self.user).values_list('pk', flat=True)), self.ids[1:])
+
+
+class RollupConsistencyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('rollups')
+        self.client.force_login(self.user)
+
+    def assertRollupsMatch(self):
+        self.assertEqual(rollup_mismatches(self.user.id), [])
+
+    def post(self, name, payload, *args):
+        response = self.client.post(reverse(name, args=args), json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_every_write_path_keeps_rollups(self):
+        rows = [
+            {'Дата': '01.02.2024 10:00', 'Сумма': '-100', 'Счёт': 'Карта', 'Проект': 'Дом', 'Категория': 'Еда'},
+            {'Дата': '01.02.2024 23:30', 'Сумма': '-50,5', 'Счёт': 'Карта', 'Проект': 'Дом', 'Категория': 'Еда'},
+            {'Дата': '02.02.2024 09:00', 'Сумма': '5000', 'Счёт': 'Карта', 'Проект': 'Дом', 'Категория': 'Зарплата'},
+            {'Дата': '03.02.2024 12:00', 'Сумма': '-20', 'Счёт': 'Наличные', 'Проект': 'Дача', 'Категория': 'Еда'},
+            {'Дата': '03.02.2024 12:00', 'Сумма': '-7', 'Счёт': 'Наличные', 'Проект': 'Дача', 'Категория': 'Еда',
+             'Валюта': 'USD'},
+        ]
+        result = run_import(self.user, rows, column_currency='Валюта')
+        self.assertEqual(result['created'], 5)
+        self.assertEqual(DailyRollup.objects.filter(user=self.user).count(), 4)
+        self.assertRollupsMatch()
+
+        transactions = list(Transaction.objects.filter(account__user=self.user).order_by('date', 'pk'))
+        cash = Account.objects.get(user=self.user, name='Наличные')
+        first = transactions[0]
+        link = first.expense_link
+        self.post('transactions:update', {
+            'date': '2024-02-05T08:15',
+            'amount': '-120,25',
+            'account_id': cash.pk,
+            'project_id': link.project_id,
+            'category_id': link.category_id,
+        }, first.pk)
+        self.assertRollupsMatch()
+
+        self.post('transactions:delete', {}, transactions[1].pk)
+        self.assertRollupsMatch()
+
+        cafe = Category.objects.create(user=self.user, name='Кафе')
+        batch_ids = [item.pk for item in transactions[2:]]
+        self.post('transactions:batch', {
+            'ids': batch_ids,
+            'action': 'update',
+            'patch': {'account_id': cash.pk, 'category_id': cafe.pk, 'currency': 'EUR'},
+        })
+        self.assertRollupsMatch()
+
+        self.post('transactions:batch', {'ids': batch_ids[:2], 'action': 'delete'})
+        self.assertRollupsMatch()
+        self.assertEqual(
+            DailyRollup.objects.filter(user=self.user).aggregate(total=Sum('operations'))['total'],
+            Transaction.objects.filter(account__user=self.user).count(),
+        )
+
+
+GRID_ROWS = [
+    {'Дата': '01.02.2024 10:00', 'Сумма': '-100', 'Счёт': 'Карта', 'Проект': 'Дом', 'Категория': 'Еда',
+     'Комментарий': 'Обед'},
+    {'Дата': '02.02.2024 11:00', 'Сумма': '-250', 'Счёт': 'Карта', 'Проект': 'Дом', 'Категория': 'Кафе',
+     'Комментарий': 'Ужин'},
+    {'Дата': '03.02.2024 12:00', 'Сумма': '-30', 'Счёт': 'Наличные', 'Проект': 'Дом', 'Категория': 'Еда',
+     'Комментарий': 'обед в столовой'},
+    {'Дата': '05.02.2024 09:00', 'Сумма': '5000', 'Счёт': 'Карта', 'Проект': 'Работа', 'Категория': 'Зарплата'},
+]
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class GridCountTests(TestCase):
+    def setUp(self):
+        # Ключи счётчиков — id пользователя и версия: после отката прошлого теста они могут совпасть
+        cache.clear()
+        self.user = User.objects.create_user('counts')
+        self.client.force_login(self.user)
+        run_import(self.user, GRID_ROWS)
+
+    def grid(self, **params):
+        response = self.client.get(reverse('transactions:data'), dict(params, length=50))
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def post(self, name, payload, *args):
+        response = self.client.post(reverse(name, args=args), json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def assertTotal(self, expected):
+        self.assertEqual(Transaction.objects.filter(account__user=self.user).count(), expected)
+        payload = self.grid()
+        self.assertEqual((payload['recordsTotal'], payload['recordsFiltered']), (expected, expected))
+
+    def test_total_follows_imports_deletes_and_batches(self):
+        self.assertTotal(4)
+        run_import(self.user, [dict(GRID_ROWS[0], Сумма='-1')])
+        self.assertTotal(5)
+        ids = list(Transaction.objects.filter(account__user=self.user).order_by('pk').values_list('pk', flat=True))
+        self.post('transactions:delete', {}, ids[0])
+        self.assertTotal(4)
+        self.post('transactions:batch', {'ids': ids[1:3], 'action': 'update', 'patch': {'comment': 'Проверено'}})
+        self.assertTotal(4)
+        self.post('transactions:batch', {'ids': ids[1:3], 'action': 'delete'})
+        self.assertTotal(2)
+
+    def test_filtered_counts_match_queryset(self):
+        rows = TransactionRow.objects.filter(user=self.user)
+        cases = [
+            ({'account': 'Наличные'}, rows.filter(account_name='Наличные')),
+            ({'category': 'Еда', 'account': 'Карта'}, rows.filter(category_name='Еда', account_name='Карта')),
+            # icontains в SQLite не сравняет регистр кириллицы: ожидаемые строки перечислены явно
+            ({'search_query': 'обед'}, rows.filter(comment__in=['Обед', 'обед в столовой'])),
+            (
+                {'date_start': '2024-02-02', 'date_end': '2024-02-03'},
+                rows.filter(local_date__range=(date(2024, 2, 2), date(2024, 2, 3))),
+            ),
+            ({'project': 'Нет такого'}, rows.none()),
+        ]
+        for params, expected in cases:
+            with self.subTest(params=params):
+                for _ in range(2):
+                    payload = self.grid(**params)
+                    self.assertEqual(payload['recordsTotal'], 4)
+                    self.assertEqual(payload['recordsFiltered'], expected.count())
+                    self.assertEqual(len(payload['data']), expected.count())
+                    self.assertFalse(payload['countEstimated'])
+
+    def test_filtered_count_follows_batch_changes(self):
+        self.assertEqual(self.grid(category='Кафе')['recordsFiltered'], 1)
+        food = list(TransactionRow.objects.filter(user=self.user, category_name='Еда').values_list('pk', flat=True))
+        cafe = Category.objects.get(user=self.user, name='Кафе')
+        self.post('transactions:batch', {'ids': food, 'action': 'update', 'patch': {'category_id': cafe.pk}})
+        self.assertEqual(self.grid(category='Кафе')['recordsFiltered'], 3)
+        self.assertEqual(self.grid(category='Еда')['recordsFiltered'], 0)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('export')
+        self.client.force_login(self.user)
+        run_import(self.user, GRID_ROWS)
+        other = User.objects.create_user('export-other')
+        run_import(other, [dict(GRID_ROWS[0], Комментарий='Чужая покупка')])
+
+    def export(self, **params):
+        response = self.client.get(reverse('transactions:export'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv(self):
+        response, content = self.export(format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="transactions-', response['Content-Disposition'])
+        rows = list(csv.reader(content.decode('utf-8-sig').splitlines(), delimiter=';'))
+        self.assertEqual(tuple(rows[0]), EXPORT_HEADERS)
+        self.assertEqual(rows[1:], [
+            ['2024-02-05 09:00:00', 'Доход', '5000.00', 'RUB', 'Карта', 'Работа', 'Зарплата', '', ''],
+            ['2024-02-03 12:00:00', 'Расход', '-30.00', 'RUB', 'Наличные', 'Дом', 'Еда', '', 'обед в столовой'],
+            ['2024-02-02 11:00:00', 'Расход', '-250.00', 'RUB', 'Карта', 'Дом', 'Кафе', '', 'Ужин'],
+            ['2024-02-01 10:00:00', 'Расход', '-100.00', 'RUB', 'Карта', 'Дом', 'Еда', '', 'Обед'],
+        ])
+
+    def test_xlsx(self):
+        from openpyxl import load_workbook
+
+        response, content = self.export(format='xlsx')
+        self.assertEqual(response['Content-Type'], CONTENT_TYPES['xlsx'])
+        sheet = load_workbook(BytesIO(content), read_only=True)['Транзакции']
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(rows[0], EXPORT_HEADERS)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1], (datetime(2024, 2, 5, 9, 0), 'Доход', 5000, 'RUB', 'Карта', 'Работа', 'Зарплата', '', ''))
+        self.assertEqual(rows[-1][:3], (datetime(2024, 2, 1, 10, 0), 'Расход', -100))
+
+    def test_grid_filters_apply(self):
+        _, content = self.export(format='csv', account='Карта', search_query='обед')
+        rows = list(csv.reader(content.decode('utf-8-sig').splitlines(), delimiter=';'))
+        self.assertEqual([row[-1] for row in rows[1:]], ['Обед'])
+        _, content = self.export(format='csv', date_start='2024-02-02', date_end='2024-02-03')
+        self.assertEqual(len(content.decode('utf-8-sig').splitlines()), 3)
+
+    def test_other_users_rows_are_excluded(self):
+        _, content = self.export(format='csv')
+        self.assertNotIn('Чужая покупка', content.decode('utf-8-sig'))
+
+    def test_unknown_format(self):
+        response = self.client.get(reverse('transactions:export'), {'format': 'pdf'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Неизвестный формат выгрузки'})
+
+
+class GridConditionalTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('etag')
+        self.client.force_login(self.user)
+        run_import(self.user, GRID_ROWS)
+
+    def grid(self, etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('transactions:data'), dict({'draw': 1}, **params), **headers)
+
+    def post(self, name, payload, *args):
+        response = self.client.post(reverse(name, args=args), json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def assertChanged(self, etag):
+        """После записи старый ETag не подходит, а новый снова даёт 304."""
+        response = self.grid(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.grid(response['ETag'], draw=2).status_code, 304)
+        return response['ETag']
+
+    def test_repeated_request_is_not_modified(self):
+        response = self.grid()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        etag = response['ETag']
+        repeated = self.grid(etag, draw=5)
+        self.assertEqual(repeated.status_code, 304)
+        self.assertEqual(repeated.content, b'')
+        self.assertEqual(self.grid(etag, account='Карта').status_code, 200)
+
+    def test_every_write_changes_etag(self):
+        etag = self.grid()['ETag']
+        transactions = list(Transaction.objects.filter(account__user=self.user).order_by('pk'))
+        first = transactions[0]
+        link = first.expense_link
+
+        response = self.client.post(reverse('transactions:list'), {
+            'date': '2024-02-06T10:00',
+            'amount': '-15',
+            'currency': 'RUB',
+            'account': first.account_id,
+            'project': link.project_id,
+            'category': link.category_id,
+        })
+        self.assertEqual(response.status_code, 302)
+        etag = self.assertChanged(etag)
+
+        self.post('transactions:update', {
+            'date': '2024-02-01T10:00',
+            'amount': '-101',
+            'account_id': first.account_id,
+            'project_id': link.project_id,
+            'category_id': link.category_id,
+        }, first.pk)
+        etag = self.assertChanged(etag)
+
+        self.post('transactions:delete', {}, transactions[1].pk)
+        etag = self.assertChanged(etag)
+
+        run_import(self.user, [dict(GRID_ROWS[0], Сумма='-7')])
+        etag = self.assertChanged(etag)
+
+        self.post('transactions:batch', {'ids': [transactions[2].pk], 'action': 'update', 'patch': {'comment': 'Новый'}})
+        etag = self.assertChanged(etag)
+
+        self.post('transactions:batch', {'ids': [transactions[2].pk], 'action': 'delete'})
+        self.assertChanged(etag)
+        rows = self.grid().json()['data']
+        self.assertEqual(len(rows), 4)
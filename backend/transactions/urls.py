@@ -2,9 +2,12 @@ from django.urls import path
 from .views import (
     transaction_list,
     transaction_import,
+    transaction_import_status,
     transaction_data,
+    transaction_export,
     transaction_update,
     transaction_delete,
+    transaction_batch,
 )
 
 app_name = 'transactions'
@@ -12,7 +15,10 @@ app_name = 'transactions'
 urlpatterns = [
     path('', transaction_list, name='list'),
     path('import/', transaction_import, name='import'),
+    path('import/jobs/<int:pk>/', transaction_import_status, name='import_status'),
     path('data/', transaction_data, name='data'),
+    path('export/', transaction_export, name='export'),
     path('<int:pk>/update/', transaction_update, name='update'),
     path('<int:pk>/delete/', transaction_delete, name='delete'),
+    path('batch/', transaction_batch, name='batch'),
 ]
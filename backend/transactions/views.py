@@ -1,116 +1,58 @@
-import io
 import json
 import re
-import base64
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
 
-import pandas as pd
-
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from django.core.paginator import Paginator
-from django.db.models import Q
 from django.views.decorators.http import require_POST
 
-from core.models import Account, Project, Category, Subcategory, ExpenseLink, Transaction, UserPreferences
+from core.conditional import data_condition
+from core.listing import row_for
+from core.models import (
+    Account,
+    Project,
+    Category,
+    Subcategory,
+    ExpenseLink,
+    Transaction,
+    TransactionRow,
+    UserPreferences,
+)
+from core.search import search_transactions
 from .forms import (
     TransactionForm,
     TransactionImportUploadForm,
     TransactionImportMappingForm,
 )
-from .models import TransactionImportSession
-
-
-class ImportRowError(Exception):
-    """Raised when a row in the import file cannot be processed."""
-
-
-def _normalize_string(value):
-    if value is None:
-        return ''
-    if isinstance(value, str):
-        return value.strip()
-    return str(value).strip()
-
-
-def _parse_decimal(value):
-    text = _normalize_string(value)
-    if not text:
-        raise ImportRowError('Не указана сумма')
-    text = text.replace(' ', '').replace("'", '')
-    text = text.replace(',', '.').replace('\xa0', '')
-    try:
-        return Decimal(text)
-    except InvalidOperation as exc:
-        raise ImportRowError(f"Не удалось преобразовать сумму '{value}'") from exc
-
-
-def _parse_date_value(value):
-    text = _normalize_string(value)
-    if not text:
-        raise ImportRowError('Не указана дата')
-    patterns = [
-        '%d.%m.%Y %H:%M:%S',
-        '%d.%m.%Y %H:%M',
-        '%d.%m.%Y',
-        '%Y-%m-%d %H:%M:%S',
-        '%Y-%m-%d %H:%M',
-        '%Y-%m-%d',
-    ]
-    for pattern in patterns:
-        try:
-            dt = datetime.strptime(text, pattern)
-            break
-        except ValueError:
-            continue
-    else:
-        try:
-            dt = datetime.fromisoformat(text)
-        except ValueError as exc:
-            raise ImportRowError(f"Не удалось распознать дату '{value}'") from exc
-    if timezone.is_naive(dt):
-        dt = timezone.make_aware(dt, timezone.get_current_timezone())
-    return dt
-
-
-def _split_markers(markers):
-    return [item.strip().lower() for item in (markers or '').split(',') if item.strip()]
-
-
-def _read_import_file(uploaded_file, *, original_name=None, sheet_name=None):
-    original_name = original_name or getattr(uploaded_file, 'name', 'upload')
-    filename = original_name.lower()
-    try:
-        if filename.endswith('.csv'):
-            data = uploaded_file.read()
-            buffer = io.BytesIO(data)
-            try:
-                df = pd.read_csv(buffer, sep=None, engine='python')
-            except Exception:
-                buffer.seek(0)
-                df = pd.read_csv(buffer, sep=';', engine='python')
-        else:
-            df = pd.read_excel(uploaded_file, sheet_name=sheet_name or 0)
-    except Exception as exc:
-        raise ImportRowError('Не удалось прочитать файл. Убедитесь, что формат поддерживается.') from exc
-
-    df = df.replace(r'^\s*$', pd.NA, regex=True)
-    df = df.dropna(how='all')
-    df = df.fillna('')
-    columns = [str(col).strip() for col in df.columns]
-    df.columns = columns
-    sample_rows = json.loads(df.head(10).to_json(orient='records', force_ascii=False, date_format='iso'))
-    rows = json.loads(df.to_json(orient='records', force_ascii=False, date_format='iso'))
-    return {
-        'original_name': original_name,
-        'columns': columns,
-        'sample_rows': sample_rows,
-        'rows': rows,
-    }
+from .jobs import enqueue_import
+from .batch import (
+    BATCH_DELETE,
+    BATCH_UPDATE,
+    BatchError,
+    delete_transactions,
+    owned_ids,
+    parse_ids,
+    update_transactions,
+    validate_patch,
+)
+from .counts import grid_counts
+from .export import CONTENT_TYPES, FORMAT_CSV, stream_export
+from .filters import InvalidFilter, apply_dimension_filters, read_dimension_filters
+from .grid import GRID_FIELDS, format_grid_row, format_grid_rows, grid_json_response
+from .models import TransactionImportJob, TransactionImportSession
+from .pagination import DIRECTION_NEXT, InvalidCursor, page_cursors, seek_page
+from .importer import (
+    ImportRowError,
+    ensure_expense_link,
+    normalize_string,
+    read_preview,
+)
+from .spool import SpoolMissingError, open_spooled, spool_upload
+from .workbook import Workbook
 
 
 AUTO_COLUMN_HINTS = {
@@ -133,7 +75,7 @@ EXPENSE_VALUE_MARKERS = {'расход', 'списание', 'перевод', '
 
 
 def _normalize_header(value):
-    text = _normalize_string(value)
+    text = normalize_string(value)
     return re.sub(r'[^a-z0-9а-яё]+', ' ', text.lower()).strip()
 
 
@@ -157,7 +99,7 @@ def _collect_column_samples(columns, sample_rows, limit=5):
 def _looks_like_numeric(values):
     positive_hits = 0
     for value in values:
-        text = _normalize_string(value)
+        text = normalize_string(value)
         if not text:
             continue
         normalized = text.replace(' ', '').replace('\xa0', '').replace(',', '.')
@@ -172,7 +114,7 @@ def _looks_like_numeric(values):
 def _looks_like_currency(values):
     hits = 0
     for value in values:
-        token = _normalize_string(value).upper()
+        token = normalize_string(value).upper()
         if len(token) == 3 and token.isalpha():
             if token in KNOWN_CURRENCY_CODES:
                 hits += 1
@@ -184,7 +126,7 @@ def _looks_like_currency(values):
 def _looks_like_type_markers(values):
     hits = 0
     for value in values:
-        token = _normalize_string(value).lower()
+        token = normalize_string(value).lower()
         if not token:
             continue
         if token in INCOME_VALUE_MARKERS or token in EXPENSE_VALUE_MARKERS:
@@ -241,191 +183,29 @@ def _infer_preset(columns):
     return 'other'
 
 
-def _resolve_account(user, row_value, cleaned, currency):
-    currency = _normalize_string(currency) or _normalize_string(cleaned.get('default_currency')) or 'RUB'
-    account = cleaned.get('default_account')
-    name = _normalize_string(row_value)
-    if not name and account is None:
-        fallback_name = _normalize_string(cleaned.get('default_account_name'))
-        if fallback_name:
-            name = fallback_name
-    if account is None and not name:
-        raise ImportRowError('Не удалось определить счёт')
-    if account is not None:
-        return account
-    existing = Account.objects.filter(user=user, name__iexact=name).first()
-    if existing:
-        return existing
-    return Account.objects.create(
-        user=user,
-        name=name,
-        currency=currency or 'RUB',
-        status='active',
-    )
+def _preview_spooled(token, original_name, *, sheet_name=None):
+    with open_spooled(token) as source:
+        return read_preview(source, original_name, sheet_name=sheet_name)
 
 
-def _resolve_project(user, row_value, cleaned):
-    project = cleaned.get('default_project')
-    name = _normalize_string(row_value)
-    if not name and project is None:
-        fallback_name = _normalize_string(cleaned.get('default_project_name'))
-        if fallback_name:
-            name = fallback_name
-    if project is None and not name:
-        raise ImportRowError('Не удалось определить проект')
-    if project is not None:
-        return project
-    existing = Project.objects.filter(user=user, name__iexact=name).first()
-    if existing:
-        return existing
-    return Project.objects.create(user=user, name=name, status='active')
-
-
-def _resolve_category(user, project, row_value):
-    name = _normalize_string(row_value)
-    if not name:
-        raise ImportRowError('Не удалось определить категорию')
-    category, _ = Category.objects.get_or_create(user=user, name=name, defaults={'status': 'active'})
-    return category
-
-
-def _resolve_subcategory(user, row_value):
-    name = _normalize_string(row_value)
-    if not name:
-        return None
-    subcategory, _ = Subcategory.objects.get_or_create(user=user, name=name, defaults={'status': 'active'})
-    return subcategory
-
-
-def _ensure_expense_link(user, project, category, subcategory):
-    link, _ = ExpenseLink.objects.get_or_create(
+def _create_import_session(user, preview, *, token, bank_preset, sheet_name=None):
+    """Сессия хранит только предпросмотр; строки читаются из spool при импорте."""
+    metadata = {
+        'bank_preset': bank_preset,
+        'source': {'token': token, 'original_name': preview['original_name']},
+    }
+    original_name = preview['original_name']
+    if sheet_name is not None:
+        metadata['sheet_name'] = sheet_name
+        metadata['source']['sheet_name'] = sheet_name
+        original_name = f"{original_name} — {sheet_name}"
+    return TransactionImportSession.objects.create(
         user=user,
-        project=project,
-        category=category,
-        subcategory=subcategory,
-        defaults={'status': 'active'},
+        original_name=original_name,
+        columns=preview['columns'],
+        sample_rows=preview['sample_rows'],
+        metadata=metadata,
     )
-    return link
-
-
-def _process_rows(user, session, cleaned):
-    rows = session.rows
-    column_date = cleaned['column_date']
-    column_amount = cleaned['column_amount']
-    column_currency = cleaned.get('column_currency')
-    column_account = cleaned.get('column_account')
-    column_project = cleaned.get('column_project')
-    column_category = cleaned.get('column_category')
-    column_subcategory = cleaned.get('column_subcategory')
-    column_comment = cleaned.get('column_comment')
-    column_type = cleaned.get('column_type')
-
-    income_markers = set(_split_markers(cleaned.get('income_markers')))
-    expense_markers = set(_split_markers(cleaned.get('expense_markers')))
-
-    result = {'created': 0, 'errors': []}
-
-    accounts_cache = {acc.name.lower(): acc for acc in Account.objects.filter(user=user)}
-    projects_cache = {proj.name.lower(): proj for proj in Project.objects.filter(user=user)}
-    categories_cache = {}
-    subcategories_cache = {}
-    links_cache = {}
-    pending_transactions = []
-
-    for index, row in enumerate(rows, start=1):
-        try:
-            if not any(value and str(value).strip() for value in row.values()):
-                continue
-
-            date_value = _parse_date_value(row.get(column_date))
-            amount = _parse_decimal(row.get(column_amount))
-
-            type_value = _normalize_string(row.get(column_type)) if column_type else ''
-            type_value_lower = type_value.lower()
-            if column_type and income_markers:
-                if type_value_lower in income_markers:
-                    amount = abs(amount)
-                elif type_value_lower in expense_markers:
-                    amount = -abs(amount)
-            elif column_type and expense_markers:
-                if type_value_lower in expense_markers:
-                    amount = -abs(amount)
-
-            currency = _normalize_string(row.get(column_currency)) if column_currency else ''
-            if not currency:
-                currency = _normalize_string(cleaned.get('default_currency')) or 'RUB'
-
-            account_name = _normalize_string(row.get(column_account)) or _normalize_string(cleaned.get('default_account_name'))
-            if cleaned.get('default_account') and not account_name:
-                account = cleaned['default_account']
-            else:
-                cache_key = (account_name or '').lower()
-                account = accounts_cache.get(cache_key)
-                if account is None:
-                    account = _resolve_account(user, row.get(column_account), cleaned, currency)
-                    accounts_cache[cache_key or account.name.lower()] = account
-
-            project_name = _normalize_string(row.get(column_project)) or _normalize_string(cleaned.get('default_project_name'))
-            if cleaned.get('default_project') and not project_name:
-                project = cleaned['default_project']
-            else:
-                proj_key = (project_name or '').lower()
-                project = projects_cache.get(proj_key)
-                if project is None:
-                    project = _resolve_project(user, row.get(column_project), cleaned)
-                    projects_cache[proj_key or project.name.lower()] = project
-
-            category_value = row.get(column_category) if column_category else ''
-            category_key = (_normalize_string(category_value) or '').lower()
-            category = categories_cache.get(category_key)
-            if category is None:
-                category = _resolve_category(user, project, category_value)
-                categories_cache[category_key or category.name.lower()] = category
-
-            sub_value = row.get(column_subcategory) if column_subcategory else ''
-            sub_name = _normalize_string(sub_value)
-            sub_key = (sub_name or '').lower()
-            subcategory = subcategories_cache.get(sub_key)
-            if subcategory is None and sub_name:
-                subcategory = _resolve_subcategory(user, sub_value)
-                subcategories_cache[sub_key] = subcategory
-            elif not sub_name:
-                subcategory = None
-
-            link_key = (project.id, category.id, subcategory.id if subcategory else None)
-            expense_link = links_cache.get(link_key)
-            if expense_link is None:
-                expense_link = _ensure_expense_link(user, project, category, subcategory)
-                links_cache[link_key] = expense_link
-
-            comment_parts = []
-            if column_comment:
-                comment_parts.append(_normalize_string(row.get(column_comment)))
-            if cleaned.get('default_comment'):
-                comment_parts.append(_normalize_string(cleaned.get('default_comment')))
-            comment = ' '.join(part for part in comment_parts if part)
-
-            transaction_type = 'income' if amount >= 0 else 'expense'
-
-            pending_transactions.append(Transaction(
-                account=account,
-                expense_link=expense_link,
-                amount=amount,
-                currency=currency or account.currency,
-                date=date_value,
-                transaction_type=transaction_type,
-                comment=comment or None,
-            ))
-        except ImportRowError as exc:
-            result['errors'].append({'row': index, 'message': str(exc), 'row_data': row})
-        except Exception as exc:  # catch-all for unexpected issues
-            result['errors'].append({'row': index, 'message': f'Неожиданная ошибка: {exc}', 'row_data': row})
-
-    if pending_transactions:
-        Transaction.objects.bulk_create(pending_transactions, batch_size=500)
-        result['created'] += len(pending_transactions)
-
-    return result
 
 
 def _build_project_structure(user):
@@ -462,43 +242,6 @@ def _build_project_structure(user):
     return project_data
 
 
-def _format_transaction_row(transaction):
-    amount_value = float(transaction.amount)
-    amount_abs = f"{abs(amount_value):,.2f}".replace(',', ' ').replace('.', ',')
-    if amount_abs.endswith(',00'):
-        amount_abs = amount_abs[:-3]
-    is_income = amount_value >= 0
-    localized_date = timezone.localtime(transaction.date)
-    expense_link = transaction.expense_link
-    subcategory = expense_link.subcategory
-    return {
-        'id': transaction.id,
-        'date': {
-            'display': localized_date.strftime('%d.%m.%Y %H:%M'),
-            'sort': transaction.date.timestamp(),
-        },
-        'date_iso': localized_date.strftime('%Y-%m-%dT%H:%M'),
-        'type_raw': 'income' if is_income else 'expense',
-        'amount': {
-            'display': f"<span class=\"amount-value\">{'+' if is_income else '-'}{amount_abs}</span>",
-            'sort': amount_value,
-        },
-        'amount_raw': str(transaction.amount),
-        'currency': transaction.currency,
-        'currency_code': transaction.currency,
-        'account': transaction.account.name,
-        'account_id': transaction.account_id,
-        'project': expense_link.project.name,
-        'project_id': expense_link.project_id,
-        'category': expense_link.category.name,
-        'category_id': expense_link.category_id,
-        'subcategory': subcategory.name if subcategory else '—',
-        'subcategory_id': subcategory.id if subcategory else None,
-        'comment': transaction.comment or '',
-        'comment_raw': transaction.comment or '',
-    }
-
-
 @login_required
 def transaction_import(request):
     session_id = request.GET.get('session')
@@ -509,8 +252,33 @@ def transaction_import(request):
     preset_initial = {}
     preferences, _ = UserPreferences.objects.get_or_create(user=request.user)
 
+    job_id = request.GET.get('job')
+    if job_id and request.method == 'GET':
+        job = get_object_or_404(TransactionImportJob, pk=job_id, user=request.user)
+        if not job.is_finished:
+            return render(request, 'transactions/import.html', {
+                'step': 'progress',
+                'job': job,
+            })
+        return render(request, 'transactions/import.html', {
+            'step': 'result',
+            'job': job,
+            'result': {
+                'created': job.created_count,
+                'duplicates': job.duplicate_count,
+                'errors': job.errors,
+                'error_count': job.error_count,
+            },
+            'session': job.session if job.errors else None,
+        })
+
     if session_id:
-        session = get_object_or_404(TransactionImportSession, pk=session_id, user=request.user)
+        # Для формы сопоставления нужны только колонки и примеры строк
+        session = get_object_or_404(
+            TransactionImportSession.objects.defer('rows', 'staged_rows'),
+            pk=session_id,
+            user=request.user,
+        )
         preset_initial = BANK_PRESET_MAPPINGS.get(session.metadata.get('bank_preset', 'other'), {})
 
     if request.method == 'POST':
@@ -521,28 +289,44 @@ def transaction_import(request):
                 uploaded = upload_form.cleaned_data['file']
                 preset_choice = upload_form.cleaned_data.get('bank_preset') or 'auto'
                 original_name = uploaded.name
-                data = uploaded.read()
                 preset_detected = preset_choice
+                # Файл пишется в хранилище один раз, дальше читаем его через mmap по токену
+                token = spool_upload(uploaded)
                 if original_name.lower().endswith(('.xlsx', '.xls')):
+                    preview = None
                     try:
-                        workbook = pd.ExcelFile(io.BytesIO(data))
-                        sheet_names = workbook.sheet_names
+                        # Книга открывается один раз: имена листов и заголовок первого листа для пресета
+                        with open_spooled(token) as source, Workbook(source, original_name) as workbook:
+                            sheet_names = workbook.sheet_names
+                            if len(sheet_names) == 1:
+                                # Единственный лист: предпросмотр сразу, без шага выбора листа
+                                preview = read_preview(workbook, original_name, sheet_name=sheet_names[0])
+                            elif sheet_names and preset_choice == 'auto':
+                                try:
+                                    preset_detected = _infer_preset(workbook.header(sheet_names[0]))
+                                except Exception:
+                                    preset_detected = 'other'
+                    except ImportRowError as exc:
+                        upload_form.add_error('file', str(exc))
                     except Exception as exc:
                         upload_form.add_error('file', f'Не удалось прочитать Excel: {exc}')
                     else:
                         if not sheet_names:
                             upload_form.add_error('file', 'В книге нет листов.')
-                        else:
+                        elif preview is not None:
                             if preset_choice == 'auto':
-                                # попробуем определить по первому листу
-                                try:
-                                    preview_df = pd.read_excel(io.BytesIO(data), sheet_name=sheet_names[0])
-                                    preview_cols = [str(col).strip() for col in preview_df.columns]
-                                    preset_detected = _infer_preset(preview_cols)
-                                except Exception:
-                                    preset_detected = 'other'
+                                preset_detected = _infer_preset(preview['columns'])
+                            session = _create_import_session(
+                                request.user,
+                                preview,
+                                token=token,
+                                bank_preset=preset_detected,
+                                sheet_name=sheet_names[0],
+                            )
+                            return redirect(f"{reverse('transactions:import')}?session={session.id}")
+                        else:
                             request.session['import_excel_pending'] = {
-                                'data': base64.b64encode(data).decode('ascii'),
+                                'token': token,
                                 'original_name': original_name,
                                 'bank_preset': preset_detected,
                             }
@@ -554,45 +338,46 @@ def transaction_import(request):
                             })
                 else:
                     try:
-                        parsed = _read_import_file(io.BytesIO(data), original_name=original_name)
+                        preview = _preview_spooled(token, original_name)
                     except ImportRowError as exc:
                         upload_form.add_error('file', str(exc))
                     else:
                         if preset_choice == 'auto':
-                            preset_detected = _infer_preset(parsed['columns'])
-                        session = TransactionImportSession.objects.create(
-                            user=request.user,
-                            original_name=parsed['original_name'],
-                            columns=parsed['columns'],
-                            sample_rows=parsed['sample_rows'],
-                            rows=parsed['rows'],
-                            metadata={'bank_preset': preset_detected},
+                            preset_detected = _infer_preset(preview['columns'])
+                        session = _create_import_session(
+                            request.user,
+                            preview,
+                            token=token,
+                            bank_preset=preset_detected,
                         )
                         return redirect(f"{reverse('transactions:import')}?session={session.id}")
         elif step == 'sheet_select':
             pending = request.session.get('import_excel_pending')
             sheet_names = request.session.get('import_excel_sheets', [])
             sheet_name = request.POST.get('sheet')
-            if not pending or sheet_name not in sheet_names:
+            if not pending or not pending.get('token') or sheet_name not in sheet_names:
                 upload_form = TransactionImportUploadForm()
                 request.session.pop('import_excel_pending', None)
                 request.session.pop('import_excel_sheets', None)
                 upload_form.add_error(None, 'Сессия выбора листа устарела. Загрузите файл заново.')
             else:
-                file_bytes = base64.b64decode(pending['data'])
                 try:
-                    parsed = _read_import_file(io.BytesIO(file_bytes), original_name=pending['original_name'], sheet_name=sheet_name)
+                    preview = _preview_spooled(pending['token'], pending['original_name'], sheet_name=sheet_name)
+                except SpoolMissingError:
+                    upload_form = TransactionImportUploadForm()
+                    request.session.pop('import_excel_pending', None)
+                    request.session.pop('import_excel_sheets', None)
+                    upload_form.add_error(None, 'Сессия выбора листа устарела. Загрузите файл заново.')
                 except ImportRowError as exc:
                     upload_form = TransactionImportUploadForm()
                     upload_form.add_error('file', str(exc))
                 else:
-                    session = TransactionImportSession.objects.create(
-                        user=request.user,
-                        original_name=f"{parsed['original_name']} — {sheet_name}",
-                        columns=parsed['columns'],
-                        sample_rows=parsed['sample_rows'],
-                        rows=parsed['rows'],
-                        metadata={'bank_preset': pending.get('bank_preset', 'other'), 'sheet_name': sheet_name},
+                    session = _create_import_session(
+                        request.user,
+                        preview,
+                        token=pending['token'],
+                        bank_preset=pending.get('bank_preset', 'other'),
+                        sheet_name=sheet_name,
                     )
                     request.session.pop('import_excel_pending', None)
                     request.session.pop('import_excel_sheets', None)
@@ -612,32 +397,9 @@ def transaction_import(request):
                 preset_initial=preset_initial,
             )
             if mapping_form.is_valid():
-                mapping_data = mapping_form.cleaned_data
-                result = _process_rows(request.user, session, mapping_data)
-                mapping_snapshot = mapping_data.copy()
-                account_obj = mapping_snapshot.pop('default_account', None)
-                project_obj = mapping_snapshot.pop('default_project', None)
-                if account_obj:
-                    mapping_snapshot['default_account_id'] = account_obj.id
-                if project_obj:
-                    mapping_snapshot['default_project_id'] = project_obj.id
-                session.metadata['last_mapping'] = mapping_snapshot
-                session.save(update_fields=['metadata'])
-                has_errors = bool(result['errors'])
-                if has_errors:
-                    error_rows = [err.get('row_data') for err in result['errors'] if err.get('row_data')]
-                    if error_rows:
-                        session.rows = error_rows
-                        session.sample_rows = error_rows[:10]
-                        session.save(update_fields=['rows', 'sample_rows'])
-                else:
-                    session.delete()
-                    session = None
-                return render(request, 'transactions/import.html', {
-                    'step': 'result',
-                    'result': result,
-                    'session': session,
-                })
+                # Строки обрабатывает воркер run_import_worker, страница опрашивает прогресс
+                job = enqueue_import(request.user, session, mapping_form.cleaned_data)
+                return redirect(f"{reverse('transactions:import')}?job={job.id}")
         elif step == 'discard' and session:
             session.delete()
             return redirect('transactions:list')
@@ -698,6 +460,24 @@ def transaction_import(request):
     })
 
 
+@login_required
+def transaction_import_status(request, pk):
+    job = get_object_or_404(TransactionImportJob, pk=pk, user=request.user)
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'finished': job.is_finished,
+        'total_rows': job.total_rows,
+        'processed_rows': job.processed_rows,
+        'created': job.created_count,
+        'duplicates': job.duplicate_count,
+        'error_count': job.error_count,
+        'errors': [{'row': err['row'], 'message': err['message']} for err in job.errors[:10]],
+        'message': job.message,
+    })
+
+
 @login_required
 def transaction_list(request):
     user = request.user
@@ -794,40 +574,20 @@ def transaction_list(request):
     return render(request, 'transactions/transaction-list.html', context)
 
 
-@login_required
-def transaction_data(request):
+def _filter_transactions(request, queryset):
+    """Фильтры таблицы транзакций из GET: (queryset, значения для ключа кэша).
+
+    Общие для ``transaction_data`` и выгрузки; ``InvalidFilter`` — при
+    некорректном id измерения.
+    """
     user = request.user
-    draw = int(request.GET.get('draw', 1))
-    start = int(request.GET.get('start', 0))
-    length = int(request.GET.get('length', 20))
     search_query = request.GET.get('search_query', '').strip()
-    project_filter = request.GET.get('project', '').strip()
-    account_filter = request.GET.get('account', '').strip()
-    category_filter = request.GET.get('category', '').strip()
-    subcategory_filter = request.GET.get('subcategory', '').strip()
     date_start = request.GET.get('date_start')
     date_end = request.GET.get('date_end')
+    dimension_filters = read_dimension_filters(request.GET)
 
-    base_queryset = Transaction.objects.filter(
-        account__user=user
-    )
-    queryset = base_queryset.select_related(
-        'account',
-        'expense_link__project',
-        'expense_link__category',
-        'expense_link__subcategory'
-    ).order_by('-date', '-id')
-
-    if project_filter:
-        queryset = queryset.filter(expense_link__project__name=project_filter)
-    if account_filter:
-        queryset = queryset.filter(account__name=account_filter)
-    if category_filter:
-        queryset = queryset.filter(expense_link__category__name=category_filter)
-    if subcategory_filter == '__none':
-        queryset = queryset.filter(expense_link__subcategory__isnull=True)
-    elif subcategory_filter:
-        queryset = queryset.filter(expense_link__subcategory__name=subcategory_filter)
+    # Названия и id переводятся в account_id / expense_link_id IN (...) по карте измерений
+    queryset = apply_dimension_filters(queryset, user.id, dimension_filters)
 
     if date_start:
         qs_start = datetime.strptime(date_start, '%Y-%m-%d')
@@ -842,32 +602,86 @@ def transaction_data(request):
         queryset = queryset.filter(date__lte=qs_end)
 
     if search_query:
-        queryset = queryset.filter(
-            Q(account__name__icontains=search_query) |
-            Q(expense_link__project__name__icontains=search_query) |
-            Q(expense_link__category__name__icontains=search_query) |
-            Q(expense_link__subcategory__name__icontains=search_query) |
-            Q(comment__icontains=search_query)
-        )
+        # Одно условие по денормализованному документу вместо пяти icontains через соединения
+        queryset = search_transactions(queryset, search_query)
+
+    return queryset, {
+        'search_query': search_query,
+        'dimensions': dimension_filters,
+        'date_start': date_start,
+        'date_end': date_end,
+    }
 
-    records_total = base_queryset.count()
-    records_filtered = queryset.count()
-    if length <= 0:
-        length = records_filtered or 1
-    paginator = Paginator(queryset, length)
-    page_number = start // length + 1
-    page = paginator.get_page(page_number)
 
-    data = [_format_transaction_row(transaction) for transaction in page.object_list]
+@login_required
+@data_condition()
+def transaction_data(request):
+    user = request.user
+    draw = int(request.GET.get('draw', 1))
+    start = int(request.GET.get('start', 0))
+    length = int(request.GET.get('length', 20))
+    # Необязательный курсор keyset-пагинации; без него работают start/length
+    cursor = request.GET.get('cursor', '').strip()
+    direction = request.GET.get('direction', DIRECTION_NEXT)
 
-    return JsonResponse({
+    # Плоская проекция: строки таблицы читаются без соединений со справочниками
+    queryset = TransactionRow.objects.filter(user=user).order_by('-date', '-pk')
+    try:
+        queryset, filters = _filter_transactions(request, queryset)
+        # Кортежи вместо моделей: страница сериализуется без создания объектов
+        queryset = queryset.values_list(*GRID_FIELDS, named=True)
+    except InvalidFilter as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    records_total, records_filtered, count_estimated = grid_counts(user, queryset, filters)
+    if cursor and length > 0:
+        try:
+            rows, next_cursor, prev_cursor = seek_page(queryset, cursor, direction, length)
+        except InvalidCursor as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+    else:
+        if length <= 0:
+            length = records_filtered or 1
+        # Срез без Paginator: его count() повторил бы уже посчитанный recordsFiltered
+        start = max(start - start % length, 0)
+        if start and start >= records_filtered and not count_estimated:
+            start = max(records_filtered - 1, 0) // length * length
+        rows = list(queryset[start:start + length + 1])
+        has_next = len(rows) > length
+        rows = rows[:length]
+        next_cursor, prev_cursor = page_cursors(rows, has_previous=start > 0, has_next=has_next)
+
+    return grid_json_response({
         'draw': draw,
         'recordsTotal': records_total,
         'recordsFiltered': records_filtered,
-        'data': data,
+        'countEstimated': count_estimated,
+        'data': format_grid_rows(rows),
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
     })
 
 
+@login_required
+def transaction_export(request):
+    export_format = request.GET.get('format', FORMAT_CSV)
+    if export_format not in CONTENT_TYPES:
+        return JsonResponse({'error': 'Неизвестный формат выгрузки'}, status=400)
+    queryset = TransactionRow.objects.filter(user=request.user).order_by('-date', '-pk')
+    try:
+        queryset, _ = _filter_transactions(request, queryset)
+    except InvalidFilter as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    response = StreamingHttpResponse(
+        stream_export(queryset, export_format),
+        content_type=CONTENT_TYPES[export_format],
+    )
+    filename = f"transactions-{timezone.localdate():%Y%m%d}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 @login_required
 @require_POST
 def transaction_update(request, pk):
@@ -907,7 +721,7 @@ def transaction_update(request, pk):
     except (InvalidOperation, TypeError, AttributeError):
         errors['amount'] = 'Некорректная сумма'
 
-    currency = _normalize_string(payload.get('currency')) or transaction.currency
+    currency = normalize_string(payload.get('currency')) or transaction.currency
 
     account = None
     account_id = payload.get('account_id')
@@ -958,18 +772,18 @@ def transaction_update(request, pk):
         status='active'
     ).first()
     if not expense_link:
-        expense_link = _ensure_expense_link(request.user, project, category, subcategory)
+        expense_link = ensure_expense_link(request.user, project, category, subcategory)
 
     transaction.date = date_value
     transaction.amount = amount
     transaction.currency = currency or account.currency
     transaction.account = account
     transaction.expense_link = expense_link
-    transaction.comment = (_normalize_string(payload.get('comment')) or None)
+    transaction.comment = (normalize_string(payload.get('comment')) or None)
     transaction.transaction_type = 'income' if amount >= 0 else 'expense'
     transaction.save()
 
-    return JsonResponse({'success': True, 'row': _format_transaction_row(transaction)})
+    return JsonResponse({'success': True, 'row': format_grid_row(row_for(transaction))})
 
 
 @login_required
@@ -1000,3 +814,35 @@ BANK_PRESET_MAPPINGS = {
         'default_account_name': 'Счёт Альфа',
     },
 }
+
+
+@login_required
+@require_POST
+def transaction_batch(request):
+    """Пакетное действие над транзакциями: ``{"ids": [...], "action": "update" | "delete", "patch": {...}}``."""
+    try:
+        payload = json.loads((request.body or b'{}').decode('utf-8'))
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'error': 'Не удалось разобрать данные'}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'success': False, 'error': 'Не удалось разобрать данные'}, status=400)
+
+    action = payload.get('action')
+    if action not in (BATCH_UPDATE, BATCH_DELETE):
+        return JsonResponse({'success': False, 'error': 'Неизвестное действие'}, status=400)
+    try:
+        ids = owned_ids(request.user, parse_ids(payload.get('ids')))
+        if action == BATCH_DELETE:
+            deleted = delete_transactions(request.user, ids)
+            return JsonResponse({'success': True, 'deleted': deleted})
+        cleaned = validate_patch(request.user, payload.get('patch'))
+    except BatchError as exc:
+        return JsonResponse({'success': False, 'errors': exc.errors}, status=400)
+
+    updated = update_transactions(request.user, ids, cleaned)
+    rows = (
+        TransactionRow.objects.filter(pk__in=ids)
+        .order_by('-date', '-pk')
+        .values_list(*GRID_FIELDS, named=True)
+    )
+    return grid_json_response({'success': True, 'updated': updated, 'rows': format_grid_rows(rows)})
@@ -0,0 +1,160 @@
+"""Однократное открытие Excel-книги для импорта.
+
+``Workbook`` открывает файл один раз и отдаёт имена листов, заголовок листа
+(только первая строка — для автоопределения пресета) и строки выбранного
+листа. Если установлен ``python-calamine``, книга читается им (xlsx и xls),
+иначе — openpyxl в режиме read_only для xlsx и pandas/xlrd для xls.
+Значения ячеек приводятся к тексту одинаково для всех движков.
+"""
+from datetime import date, datetime
+
+import pandas as pd
+
+try:
+    import python_calamine
+except ImportError:  # pragma: no cover - optional dependency
+    python_calamine = None
+
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def cell_text(value):
+    """Текст ячейки: пустые — '', даты — ``DATETIME_FORMAT``, целые числа без '.0'."""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime(DATETIME_FORMAT)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day).strftime(DATETIME_FORMAT)
+    if isinstance(value, float):
+        if value != value:
+            return ''
+        if value.is_integer():
+            return str(int(value))
+    return str(value)
+
+
+def header_columns(values):
+    """Имена колонок из строки заголовка: пустые — 'Unnamed: N', повторы — 'имя.1'."""
+    values = list(values)
+    while values and cell_text(values[-1]) == '':
+        values.pop()
+    columns = []
+    seen = {}
+    for position, value in enumerate(values):
+        name = cell_text(value).strip() or f'Unnamed: {position}'
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        columns.append(name if count == 0 else f'{name}.{count}')
+    return columns
+
+
+class Workbook:
+    """Книга, открытая один раз на запрос."""
+
+    def __init__(self, source, original_name):
+        self.original_name = original_name
+        self._sheets = {}
+        if python_calamine is not None:
+            self.engine = 'calamine'
+            self._book = python_calamine.CalamineWorkbook.from_filelike(source)
+            self.sheet_names = list(self._book.sheet_names)
+        elif original_name.lower().endswith('.xls'):
+            self.engine = 'xlrd'
+            self._book = pd.ExcelFile(source)
+            self.sheet_names = list(self._book.sheet_names)
+        else:
+            from openpyxl import load_workbook
+
+            self.engine = 'openpyxl'
+            self._book = load_workbook(source, read_only=True, data_only=True)
+            self.sheet_names = list(self._book.sheetnames)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.engine in ('openpyxl', 'xlrd'):
+            self._book.close()
+        self._sheets.clear()
+
+    def _sheet_name(self, sheet_name):
+        if sheet_name in (None, 0):
+            if not self.sheet_names:
+                raise KeyError('В книге нет листов')
+            return self.sheet_names[0]
+        return sheet_name
+
+    def _calamine_sheet(self, sheet_name):
+        # calamine разбирает лист целиком при открытии: объект листа переиспользуется
+        if sheet_name not in self._sheets:
+            self._sheets[sheet_name] = self._book.get_sheet_by_name(sheet_name)
+        return self._sheets[sheet_name]
+
+    def _xlrd_frame(self, sheet_name):
+        # xlrd не умеет читать построчно: лист разбирается один раз и переиспользуется
+        if sheet_name not in self._sheets:
+            self._sheets[sheet_name] = self._book.parse(sheet_name, header=None, dtype=object)
+        return self._sheets[sheet_name]
+
+    def _raw_rows(self, sheet_name, limit=None):
+        """Строки листа ``sheet_name``; с ``limit`` в Python переводятся только первые ``limit`` строк."""
+        sheet_name = self._sheet_name(sheet_name)
+        if self.engine == 'calamine':
+            sheet = self._calamine_sheet(sheet_name)
+            if limit is not None:
+                rows = iter(sheet.to_python(nrows=limit))
+            elif hasattr(sheet, 'iter_rows'):
+                rows = sheet.iter_rows()
+            else:
+                rows = iter(sheet.to_python())
+        elif self.engine == 'xlrd':
+            if limit is not None and sheet_name not in self._sheets:
+                frame = self._book.parse(sheet_name, header=None, nrows=limit, dtype=object)
+            else:
+                frame = self._xlrd_frame(sheet_name)
+            rows = (list(values) for values in frame.itertuples(index=False, name=None))
+        else:
+            rows = self._book[sheet_name].iter_rows(values_only=True, max_row=limit)
+        for index, values in enumerate(rows):
+            if limit is not None and index >= limit:
+                return
+            yield values
+
+    def row_count(self, sheet_name=None):
+        """Число строк данных листа (без заголовка) по размеру из книги; None, если книга его не хранит."""
+        sheet_name = self._sheet_name(sheet_name)
+        if self.engine == 'calamine':
+            height = getattr(self._calamine_sheet(sheet_name), 'height', None)
+        elif self.engine == 'xlrd':
+            height = len(self._xlrd_frame(sheet_name).index)
+        else:
+            height = self._book[sheet_name].max_row
+        if height is None:
+            return None
+        return max(height - 1, 0)
+
+    def header(self, sheet_name=None):
+        """Колонки листа по первой строке; остальные строки не читаются (calamine — не переводятся в Python)."""
+        first = next(self._raw_rows(sheet_name, limit=1), None)
+        return header_columns(first or [])
+
+    def iter_rows(self, sheet_name=None):
+        """(колонки, итератор строк-списков текста) для листа."""
+        rows = self._raw_rows(sheet_name)
+        first = next(rows, None)
+        columns = header_columns(first or [])
+        width = len(columns)
+
+        def values():
+            for raw in rows:
+                cells = [cell_text(value) for value in list(raw)[:width]]
+                if len(cells) < width:
+                    cells.extend([''] * (width - len(cells)))
+                yield cells
+
+        return columns, values()